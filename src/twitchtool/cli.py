@@ -1,16 +1,12 @@
 from __future__ import annotations
 
 import argparse
-import asyncio
+import io
 import json
 import os
-import shlex
-import subprocess
-import signal
 import sys
-import time
-from datetime import datetime, timedelta
-from typing import Any, Dict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict
 
 try:
     import tomllib  # Python 3.11+
@@ -21,26 +17,22 @@ import re
 
 from . import __version__
 from .config import DEFAULT_CONFIG_PATH, effective_config
-from .doctor import doctor as doctor_cmd
-from .encoder_daemon import (
-    EncodeOptions,
-    encode_daemon,
-    encoder_runtime_state,
-    stop_encoder_daemon,
-)
 from .ffmpeg_cmds import (
+    HWACCEL_CHOICES,
+    NVENC_PRESETS,
+    NVENC_SESSION_LIMIT,
+    NVENC_TUNES,
     FfmpegNotFound,
-    build_encode_cmd,
-    build_remux_cmd,
+    default_x265_params,
     normalize_inputs,
+    nvenc_sessions_in_use,
     resolve_ffmpeg,
+    resolve_ffprobe,
+    resolve_gpu_scaler,
+    resolve_hwaccel,
 )
 from .locks import GlobalSlotManager
-from .poller import PollerOptions, poller, poller_runtime_state, stop_poller_daemon
-from .recorder import RecordOptions, record
-from .utils import abspath, build_nice_ionice_prefix, is_process_alive
-from .status import gather_status, print_report
-from .users_cli import add_users, list_users, remove_users
+from .utils import ProcessHandle, build_nice_ionice_prefix
 
 
 class CustomHelpFormatter(argparse.HelpFormatter):
@@ -61,22 +53,24 @@ class CustomHelpFormatter(argparse.HelpFormatter):
         return super()._format_action(action)
 
 
+_TOML_ESC = str.maketrans({
+    "\\": "\\\\",
+    "\"": "\\\"",
+    "\n": "\\n",
+    "\r": "\\r",
+    "\t": "\\t",
+    "\b": "\\b",
+    "\f": "\\f",
+})
+
+
 def _serialize_toml(value: Any) -> str:
     if isinstance(value, bool):
         return "true" if value else "false"
     if isinstance(value, (int, float)):
         return str(value)
     if isinstance(value, str):
-        escaped = (
-            value.replace("\\", "\\\\")
-            .replace("\"", "\\\"")
-            .replace("\n", "\\n")
-            .replace("\r", "\\r")
-            .replace("\t", "\\t")
-            .replace("\b", "\\b")
-            .replace("\f", "\\f")
-        )
-        return f'"{escaped}"'
+        return '"' + value.translate(_TOML_ESC) + '"'
     if isinstance(value, list):
         inner = ", ".join(_serialize_toml(item) for item in value)
         return f"[{inner}]"
@@ -84,63 +78,74 @@ def _serialize_toml(value: Any) -> str:
 
 
 def _dump_toml(data: Dict[str, Any]) -> str:
-    lines: list[str] = []
-
-    def _dump_table(prefix: str | None, mapping: Dict[str, Any]) -> None:
-        simple_items: list[tuple[str, Any]] = []
-        nested_items: list[tuple[str, Dict[str, Any]]] = []
+    buf = io.StringIO()
+    wrote = False
+    # Depth-first over tables: a table's plain keys, then its sub-tables in order
+    stack: list[tuple[str | None, Dict[str, Any]]] = [(None, data)]
+    while stack:
+        prefix, mapping = stack.pop()
+        if prefix is not None:
+            if wrote:
+                buf.write("\n")
+            buf.write(f"[{prefix}]\n")
+            wrote = True
+        nested: list[tuple[str, Dict[str, Any]]] = []
         for key, val in mapping.items():
             if isinstance(val, dict):
-                nested_items.append((key, val))
+                nested.append((f"{prefix}.{key}" if prefix else key, val))
             else:
-                simple_items.append((key, val))
-        if prefix is not None:
-            lines.append(f"[{prefix}]")
-        for key, val in simple_items:
-            lines.append(f"{key} = {_serialize_toml(val)}")
-        for idx, (key, val) in enumerate(nested_items):
-            if lines and lines[-1] != "":
-                lines.append("")
-            new_prefix = f"{prefix}.{key}" if prefix else key
-            _dump_table(new_prefix, val)
-
-    top_simple: list[tuple[str, Any]] = []
-    top_nested: list[tuple[str, Dict[str, Any]]] = []
-    for key, val in data.items():
-        if isinstance(val, dict):
-            top_nested.append((key, val))
-        else:
-            top_simple.append((key, val))
+                buf.write(f"{key} = {_serialize_toml(val)}\n")
+                wrote = True
+        stack.extend(reversed(nested))
+    return buf.getvalue().rstrip() + "\n"
 
-    for key, val in top_simple:
-        lines.append(f"{key} = {_serialize_toml(val)}")
 
-    for idx, (key, val) in enumerate(top_nested):
-        if lines and lines[-1] != "":
-            lines.append("")
-        _dump_table(key, val)
+def _write_raw_config(path: Path, data: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    toml_text = _dump_toml(data)
+    path.write_text(toml_text, encoding="utf-8")
 
-    return "\n".join(lines).rstrip() + "\n"
 
+# One encoder for every --json-logs line; compact separators keep lines short
+_JSON_ENCODE = json.JSONEncoder(separators=(",", ":")).encode
 
-def _load_raw_config(path: Path) -> Dict[str, Any]:
-    try:
-        with path.open("rb") as fh:
-            return tomllib.load(fh)
-    except FileNotFoundError:
-        return {}
-    except Exception as exc:  # pragma: no cover
-        raise RuntimeError(f"failed to read config {path}: {exc}") from exc
 
+def _emit_event(json_logs: bool, event: str, **extra: object) -> None:
+    if json_logs:
+        payload: dict[str, object] = {"event": event}
+        if extra:
+            payload.update(extra)
+        print(_JSON_ENCODE(payload))
+    elif extra:
+        details = " ".join(f"{k}={v}" for k, v in extra.items())
+        print(f"{event}: {details}")
+    else:
+        print(event)
 
-def _write_raw_config(path: Path, data: Dict[str, Any]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    toml_text = _dump_toml(data)
-    path.write_text(toml_text, encoding="utf-8")
+
+def _write_json_line(payload: Dict[str, Any]) -> None:
+    """Write one JSON line as UTF-8 bytes, bypassing the text layer for state dumps."""
+    data = (_JSON_ENCODE(payload) + "\n").encode("utf-8")
+    out = getattr(sys.stdout, "buffer", None)
+    if out is None:  # replaced stdout (tests, embedding) without a byte layer
+        sys.stdout.write(data.decode("utf-8"))
+        return
+    sys.stdout.flush()
+    out.write(data)
+    out.flush()
 
 
-_TRUE_STRS = {"1", "true", "yes", "on", "y", "t"}
-_FALSE_STRS = {"0", "false", "no", "off", "n", "f"}
+def _parse_iso(value: Any) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value if isinstance(value, str) else str(value))
+    except ValueError:
+        return None
+
+
+_TRUE_STRS = frozenset({"1", "true", "yes", "on", "y", "t"})
+_FALSE_STRS = frozenset({"0", "false", "no", "off", "n", "f"})
 
 
 def _coerce_bool(value: Any, default: bool = False) -> bool:
@@ -148,8 +153,6 @@ def _coerce_bool(value: Any, default: bool = False) -> bool:
         return value
     if value is None:
         return default
-    if isinstance(value, (int, float)):
-        return bool(value)
     if isinstance(value, str):
         v = value.strip().lower()
         if v in _TRUE_STRS:
@@ -160,30 +163,54 @@ def _coerce_bool(value: Any, default: bool = False) -> bool:
     return bool(value)
 
 
+# [record] header or a one-line `record = {...}` table, found in a single pass
+_RECORD_FORM_RE = re.compile(
+    r"(?P<table>^\s*\[record\]\s*(#.*)?$)"
+    r"|(?P<inline>^(?P<prefix>\s*record\s*=\s*\{)(?P<body>[^}]*)\}(?P<suffix>\s*(#.*)?)$)",
+    re.MULTILINE,
+)
+_NEXT_TABLE_RE = re.compile(r"^\s*\[\[?[^\]\n]+\]\]?\s*(#.*)?$", re.MULTILINE)
+_ENABLE_REMUX_LINE_RE = re.compile(
+    r"^(?P<prefix>\s*enable_remux\s*=\s*)(?P<val>[^#\r\n]+)(?P<suffix>\s*(#.*)?)$", re.MULTILINE
+)
+_KV_ENABLE_REMUX_RE = re.compile(r"(\benable_remux\s*=\s*)([^,}]+)")
+# Top-level dotted keys (record.enable_remux = ...) end at the first table header
+_DOTTED_RECORD_RE = re.compile(r"^\s*record\s*\.[^\r\n]*(\r?\n|$)", re.MULTILINE)
+_DOTTED_ENABLE_REMUX_RE = re.compile(
+    r"^(?P<prefix>\s*record\s*\.\s*enable_remux\s*=\s*)(?P<val>[^#\r\n]+?)(?P<suffix>\s*(#.*)?)$", re.MULTILINE
+)
+
+
 def _set_enable_remux_in_config_text(text: str, desired: bool) -> tuple[str, bool]:
     """Return (new_text, changed) with only record.enable_remux toggled.
 
-    - If a [record] table exists, update or insert enable_remux there.
-    - Else, if a one-line inline table exists (record = {...}), update/insert it.
+    ``changed`` is False when the key already holds the desired literal.
+
+    - If a [record] table or a one-line inline table (record = {...}) exists,
+      update or insert enable_remux in whichever appears first.
+    - If record is defined through top-level dotted keys (record.quality = ...),
+      update record.enable_remux or add it after the last of them.
     - Else, append a [record] section with enable_remux.
 
     Attempts to preserve layout and comments where practical.
     """
     value = "true" if desired else "false"
 
+    m = _RECORD_FORM_RE.search(text)
+
     # 1) [record] explicit table
-    table_pat = re.compile(r"^\s*\[record\]\s*$", re.MULTILINE)
-    m = table_pat.search(text)
-    if m:
+    if m and m.group("table"):
         start = m.end()
         # Find end of table (next [section])
-        next_table = re.search(r"^\s*\[[^\]\n]+\]\s*$", text[start:], re.MULTILINE)
-        end = start + next_table.start() if next_table else len(text)
+        next_table = _NEXT_TABLE_RE.search(text, start)
+        end = next_table.start() if next_table else len(text)
         block = text[start:end]
         # Replace existing enable_remux line if present
-        line_pat = re.compile(r"^(?P<prefix>\s*enable_remux\s*=\s*)(?P<val>[^#\r\n]+)(?P<suffix>\s*(#.*)?)$", re.MULTILINE)
-        if line_pat.search(block):
-            new_block, n = line_pat.subn(lambda mo: f"{mo.group('prefix')}{value}{mo.group('suffix')}", block)
+        current = _ENABLE_REMUX_LINE_RE.search(block)
+        if current and current.group("val").strip() == value:
+            return text, False
+        if current:
+            new_block, n = _ENABLE_REMUX_LINE_RE.subn(lambda mo: f"{mo.group('prefix')}{value}{mo.group('suffix')}", block)
             if n:
                 return text[:start] + new_block + text[end:], True
         # Otherwise insert after header or at end of block
@@ -193,14 +220,15 @@ def _set_enable_remux_in_config_text(text: str, desired: bool) -> tuple[str, boo
         return text[:start] + new_block + text[end:], True
 
     # 2) One-line inline table: record = { ... }
-    inline_pat = re.compile(r"^(?P<prefix>\s*record\s*=\s*\{)(?P<body>[^}]*)\}(?P<suffix>\s*(#.*)?)$", re.MULTILINE)
-    m2 = inline_pat.search(text)
-    if m2:
+    if m:
+        m2 = m
         body = m2.group('body')
         # Check if enable_remux present
-        kv_pat = re.compile(r"(\benable_remux\s*=\s*)([^,}]+)")
-        if kv_pat.search(body):
-            new_body, n = kv_pat.subn(lambda mo: f"{mo.group(1)}{value}", body)
+        current = _KV_ENABLE_REMUX_RE.search(body)
+        if current and current.group(2).strip() == value:
+            return text, False
+        if current:
+            new_body, n = _KV_ENABLE_REMUX_RE.subn(lambda mo: f"{mo.group(1)}{value}", body)
             if n:
                 return text[:m2.start()] + f"{m2.group('prefix')}{new_body}}}{m2.group('suffix')}" + text[m2.end():], True
         # Insert at beginning of body
@@ -209,20 +237,50 @@ def _set_enable_remux_in_config_text(text: str, desired: bool) -> tuple[str, boo
         new_line = f"{m2.group('prefix')}{new_body.strip()}}}{m2.group('suffix')}"
         return text[:m2.start()] + new_line + text[m2.end():], True
 
-    # 3) Append a new table at end
+    # 3) Top-level dotted keys: record.enable_remux = ...
+    header = _NEXT_TABLE_RE.search(text)
+    top_end = header.start() if header else len(text)
+    current = _DOTTED_ENABLE_REMUX_RE.search(text, 0, top_end)
+    if current:
+        if current.group("val").strip() == value:
+            return text, False
+        line = f"{current.group('prefix')}{value}{current.group('suffix')}"
+        return text[: current.start()] + line + text[current.end() :], True
+    dotted = list(_DOTTED_RECORD_RE.finditer(text, 0, top_end))
+    if dotted:
+        last = dotted[-1]
+        newline = last.group(1) or "\n"
+        line = f"{text[last.start():last.end()].rstrip()}{newline}record.enable_remux = {value}{newline}"
+        return text[: last.start()] + line + text[last.end() :], True
+
+    # 4) Append a new table at end
     sep = "" if text.endswith("\n") or text == "" else "\n"
     new_text = f"{text}{sep}\n[record]\nenable_remux = {value}\n"
     return new_text, True
 
 
-def _set_enable_remux_in_config(path: Path, desired: bool) -> None:
-    """Update only record.enable_remux in the TOML file, preserving comments."""
+def _set_enable_remux_in_config(path: Path, desired: bool, original: str | None = None) -> None:
+    """Update only record.enable_remux in the TOML file, preserving comments.
+
+    Pass ``original`` when the caller already read the file to skip a second read.
+    Raises ValueError, without touching the file, when the edit cannot be verified.
+    """
     path = path.expanduser()
-    try:
-        original = path.read_text(encoding="utf-8")
-    except FileNotFoundError:
-        original = ""
+    if original is None:
+        try:
+            original = path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            original = ""
     new_text, changed = _set_enable_remux_in_config_text(original, desired)
+    try:
+        edited = tomllib.loads(new_text)
+        ok = isinstance(edited.get("record"), dict) and edited["record"].get("enable_remux") is desired
+    except Exception:
+        ok = False
+    if not ok:
+        # A layout the text edit does not understand (e.g. a multi-line inline
+        # table); leave the user's file alone rather than rewriting it
+        raise ValueError(f"cannot set record.enable_remux in {path}; edit it by hand")
     if changed:
         path.parent.mkdir(parents=True, exist_ok=True)
         path.write_text(new_text, encoding="utf-8")
@@ -233,18 +291,7 @@ def _add_common_flags(p: argparse.ArgumentParser) -> None:
     p.add_argument("--config", type=Path, default=None, help="path to config.toml (default: ~/.config/twitchtool/config.toml)")
 
 
-def build_parser() -> argparse.ArgumentParser:
-    ap = argparse.ArgumentParser(
-        prog="twitchtool",
-        description="Twitch recorder + encode queue + poller",
-        formatter_class=CustomHelpFormatter,
-    )
-    ap.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
-
-    sub = ap.add_subparsers(dest="cmd", required=True, metavar="command")
-    ap._subparsers_main = sub  # type: ignore[attr-defined]
-
-    # record
+def _add_record_parser(sub: Any) -> None:
     rp = sub.add_parser("record", help="record a Twitch user")
     _add_common_flags(rp)
     rp.add_argument("username", help="twitch username")
@@ -273,12 +320,15 @@ def build_parser() -> argparse.ArgumentParser:
     rp.add_argument("--record-limit", type=int, default=None, help="max concurrent recordings (default: 6)")
     rp.add_argument("--fail-fast", action="store_true", help="fail immediately if no global slot is available")
 
-    # status
+
+def _add_status_parser(sub: Any) -> None:
     status = sub.add_parser("status", help="show downloads and encode queue status")
     _add_common_flags(status)
     status.add_argument("--queue-dir", type=Path, default=None, help="override queue directory")
     status.add_argument("--record-limit", type=int, default=None, help="max concurrent recordings")
 
+
+def _add_stop_parser(sub: Any) -> None:
     stop = sub.add_parser("stop", help="gracefully stop a recording slot")
     _add_common_flags(stop)
     stop.add_argument("slot", type=int, help="slot number as shown in 'twitchtool status'")
@@ -295,7 +345,8 @@ def build_parser() -> argparse.ArgumentParser:
         help="after the timeout, send SIGKILL if the recorder is still running",
     )
 
-    # users management
+
+def _add_users_parser(sub: Any) -> None:
     up = sub.add_parser("users", help="manage poller user list")
     _add_common_flags(up)
     up.add_argument(
@@ -314,7 +365,8 @@ def build_parser() -> argparse.ArgumentParser:
     up_remove = users_sub.add_parser("remove", help="remove one or more users")
     up_remove.add_argument("usernames", nargs="+", help="twitch username(s) to remove")
 
-    # encode-mode
+
+def _add_encode_mode_parser(sub: Any) -> None:
     em = sub.add_parser("encode-mode", help="control remux/encode pipeline")
     _add_common_flags(em)
     em_sub = em.add_subparsers(dest="encode_mode_cmd", required=True, metavar="command")
@@ -322,7 +374,8 @@ def build_parser() -> argparse.ArgumentParser:
     em_sub.add_parser("on", help="enable remuxing/encoding")
     em_sub.add_parser("off", help="disable remuxing/encoding")
 
-    # encode-daemon
+
+def _add_encode_daemon_parser(sub: Any) -> None:
     ep = sub.add_parser("encode-daemon", help="manage encoder daemon")
     _add_common_flags(ep)
     enc_sub = ep.add_subparsers(dest="enc_cmd", required=False, metavar="command")
@@ -358,7 +411,8 @@ def build_parser() -> argparse.ArgumentParser:
 
     enc_sub.add_parser("status", help="show encoder status")
 
-    # poller
+
+def _add_poller_parser(sub: Any) -> None:
     pp = sub.add_parser("poller", help="manage poller daemon")
     _add_common_flags(pp)
     poller_sub = pp.add_subparsers(dest="poller_cmd", required=False, metavar="command")
@@ -393,8 +447,9 @@ def build_parser() -> argparse.ArgumentParser:
 
     poller_sub.add_parser("status", help="show poller status")
 
-    # tscompress (batch remux + encode for existing .ts files)
-    tc = sub.add_parser("tscompress", help="remux and compress .ts files serially")
+
+def _add_tscompress_parser(sub: Any) -> None:
+    tc = sub.add_parser("tscompress", help="remux and compress existing .ts files")
     _add_common_flags(tc)
     tc.add_argument("inputs", nargs="+", help="one or more .ts file paths, globs, or directories")
     tc.add_argument("--output-dir", type=Path, default=None, help="write outputs to this directory")
@@ -410,14 +465,99 @@ def build_parser() -> argparse.ArgumentParser:
     tc.add_argument("--crf", type=int, default=None, help="CRF target (default: config or 26)")
     tc.add_argument("--audio-bitrate", default=None, help="AAC bitrate, e.g. 160k")
     tc.add_argument("--audio-rate", type=int, default=None, help="AAC sample rate (default: 48000)")
-    tc.add_argument("--threads", type=int, default=None, help="encoder threads (default: config or 1)")
+    tc.add_argument(
+        "--audio-copy",
+        action="store_true",
+        default=None,
+        help="stream-copy audio when the source is already AAC (probed with ffprobe)",
+    )
+    tc.add_argument(
+        "--threads",
+        "--threads-per-job",
+        dest="threads",
+        type=int,
+        default=None,
+        help="encoder threads per job; 0 lets ffmpeg decide (default: 0 with one job, else cores / jobs)",
+    )
+    tc.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of inputs to process in parallel (default: half the CPU cores, at least 1)",
+    )
+    tc.add_argument(
+        "--batch",
+        type=int,
+        nargs="?",
+        const=8,
+        default=None,
+        metavar="N",
+        help="encode N inputs per ffmpeg run via multi-output mapping (default N: 8; implies no intermediate remux)",
+    )
+    tc.add_argument(
+        "--gpu-jobs",
+        type=int,
+        default=None,
+        help="max concurrent hardware encodes when --hwaccel is active (default: config or 2)",
+    )
     tc.add_argument("--max-height", dest="height", type=int, default=None, help="maximum output height; input is never upscaled")
     tc.add_argument("--height", dest="height", type=int, default=None, help=argparse.SUPPRESS)
     tc.add_argument("--x265-params", default=None, help="extra libx265 params (ignored for libx264)")
+    tc.add_argument(
+        "--hwaccel",
+        choices=HWACCEL_CHOICES,
+        default=None,
+        help="hardware HEVC encoder instead of libx265; 'auto' probes ffmpeg (default: config or none)",
+    )
+    tc.add_argument(
+        "--nvenc-preset",
+        choices=NVENC_PRESETS,
+        default=None,
+        help="NVENC speed/quality preset, p1 fastest .. p7 best; replaces --preset (default: config or p4)",
+    )
+    tc.add_argument(
+        "--nvenc-tune",
+        choices=NVENC_TUNES,
+        default=None,
+        help="NVENC tuning; ll/ull favour throughput over quality (default: config or hq)",
+    )
+    tc.add_argument(
+        "--two-stage",
+        action="store_true",
+        help="with nvenc, decode and resize on the GPU via the matching CUVID decoder (needs ffprobe)",
+    )
     tc.add_argument("--remux-only", action="store_true", help="only perform timestamp-preserving remux; skip encode")
+    tc.add_argument(
+        "--fuse-remux-encode",
+        action="store_true",
+        default=None,
+        help="encode straight from the .ts without writing an intermediate remux (default)",
+    )
+    tc.add_argument(
+        "--keep-remux",
+        dest="fuse_remux_encode",
+        action="store_false",
+        help="write the remuxed <basename>.mp4 first and encode from it",
+    )
     tc.add_argument("--loglevel", default=None, help="ffmpeg loglevel (default: config or info)")
     tc.add_argument("--overwrite", action="store_true", help="overwrite existing outputs if present")
     tc.add_argument("--dry-run", action="store_true", help="print commands without running them")
+    tc.add_argument(
+        "--preallocate",
+        action="store_true",
+        help="reserve disk space for each output before encoding to limit fragmentation (Linux)",
+    )
+    tc.add_argument(
+        "--pin-cpus",
+        action="store_true",
+        help="pin each --jobs worker and its ffmpeg to a disjoint set of CPUs (Linux)",
+    )
+    tc.add_argument(
+        "--resume",
+        action="store_true",
+        help="encode in 30s segments so an interrupted run continues from the last finished one",
+    )
+    tc.add_argument("--quiet", action="store_true", help="only log skipped and failed inputs")
     tc.add_argument("--keep-ts", action="store_true", default=None, help="keep .ts after remux (default)")
     tc.add_argument("--delete-ts-after-remux", action="store_true", help="delete .ts after successful remux")
     tc.add_argument(
@@ -433,44 +573,88 @@ def build_parser() -> argparse.ArgumentParser:
     )
     tc.add_argument("--fps", type=str, default=None, help=argparse.SUPPRESS)
 
-    # doctor
+
+def _add_doctor_parser(sub: Any) -> None:
     dp = sub.add_parser("doctor", help="check environment")
     _add_common_flags(dp)
     dp.add_argument("--queue-dir", type=Path, default=None)
     dp.add_argument("--logs-dir", type=Path, default=None)
 
-    # clean (simple helper)
+
+def _add_clean_parser(sub: Any) -> None:
     cp = sub.add_parser("clean", help="clean stale owner files and print status")
     _add_common_flags(cp)
     cp.add_argument("--record-limit", type=int, default=None)
 
+
+def _add_help_parser(sub: Any) -> None:
     help_parser = sub.add_parser("help", help="show help for a command")
     help_parser.add_argument("topic", nargs="?", help="command to describe")
 
+
+# Subcommand name -> builder; main() only builds the one being run
+_SUBCOMMAND_BUILDERS: Dict[str, Callable[[Any], None]] = {
+    "record": _add_record_parser,
+    "status": _add_status_parser,
+    "stop": _add_stop_parser,
+    "users": _add_users_parser,
+    "encode-mode": _add_encode_mode_parser,
+    "encode-daemon": _add_encode_daemon_parser,
+    "poller": _add_poller_parser,
+    "tscompress": _add_tscompress_parser,
+    "doctor": _add_doctor_parser,
+    "clean": _add_clean_parser,
+    "help": _add_help_parser,
+}
+
+
+def build_parser(only: str | None = None) -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(
+        prog="twitchtool",
+        description="Twitch recorder + encode queue + poller",
+        formatter_class=CustomHelpFormatter,
+    )
+    ap.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
+
+    sub = ap.add_subparsers(dest="cmd", required=True, metavar="command")
+    ap._subparsers_main = sub  # type: ignore[attr-defined]
+
+    for name, add in _SUBCOMMAND_BUILDERS.items():
+        if only is None or name == only:
+            add(sub)
+
     return ap
 
 
+_AUTO_RUN_SKIP = frozenset({"-h", "--help", "run", "stop", "status"})
+
+
+def _auto_insert_run(cmd: str, args: list[str]) -> None:
+    """Turn ``<cmd> --flag ...`` into ``<cmd> run --flag ...`` for daemon commands."""
+    if not args or args[0] != cmd:
+        return
+    if len(args) == 1:
+        args.insert(1, "run")
+        return
+    if args[1] in _AUTO_RUN_SKIP:
+        return
+    if args[1].startswith("-"):
+        args.insert(1, "run")
+
+
 def main(argv: list[str] | None = None) -> None:
     if argv is None:
         argv = sys.argv[1:]
     argv = list(argv)
-    def _auto_insert_run(cmd: str, args: list[str]) -> None:
-        if not args or args[0] != cmd:
-            return
-        if len(args) == 1:
-            args.insert(1, "run")
-            return
-        if args[1] in {"-h", "--help", "run", "stop", "status"}:
-            return
-        if args[1].startswith("-"):
-            args.insert(1, "run")
-
     _auto_insert_run("poller", argv)
     _auto_insert_run("encode-daemon", argv)
     if os.environ.get("TWITCHTOOL_DEBUG_ARGS"):
         print(f"argv after auto-insert: {argv}", file=sys.stderr)
 
-    ap = build_parser()
+    # Only the selected subcommand's arguments are built; help and unknown
+    # commands still get the full parser for listings and error messages
+    only = argv[0] if argv and argv[0] in _SUBCOMMAND_BUILDERS and argv[0] != "help" else None
+    ap = build_parser(only)
     ns = ap.parse_args(argv)
 
     if ns.cmd == "help":
@@ -487,10 +671,12 @@ def main(argv: list[str] | None = None) -> None:
         ap.print_help()
         sys.exit(1)
 
-    cfg = effective_config(getattr(ns, "config", None))
-
+    # Config is parsed per branch so stop/status subcommands that never read
+    # it skip the TOML load entirely
     if ns.cmd == "record":
-        c = cfg
+        from .recorder import RecordOptions, record
+
+        c = effective_config(ns.config)
         opts = RecordOptions(
             username=ns.username,
             quality=ns.quality or c["record"]["quality"],
@@ -523,24 +709,12 @@ def main(argv: list[str] | None = None) -> None:
         sys.exit(rc)
 
     elif ns.cmd == "encode-daemon":
-        c = cfg
-
-        def _emit_enc(event: str, **extra: object) -> None:
-            if ns.json_logs:
-                payload: dict[str, object] = {"event": event}
-                if extra:
-                    payload.update(extra)
-                print(json.dumps(payload))
-            else:
-                if extra:
-                    details = " ".join(f"{k}={extra[k]}" for k in sorted(extra))
-                    print(f"{event}: {details}")
-                else:
-                    print(event)
+        from .encoder_daemon import EncodeOptions, encode_daemon, encoder_runtime_state, stop_encoder_daemon
 
         enc_cmd = ns.enc_cmd or "run"
 
         if enc_cmd == "run":
+            c = effective_config(ns.config)
             encode_cfg = c.get("encode_daemon", {})
             video_codec = ns.video_codec or encode_cfg.get("video_codec", "libx265")
             audio_bitrate = ns.audio_bitrate or encode_cfg.get("audio_bitrate", "160k")
@@ -572,35 +746,37 @@ def main(argv: list[str] | None = None) -> None:
             res = result.get("result", "unknown")
             state = result.get("state", {})
             if res == "stopped":
-                _emit_enc("encoder-stopped", signal=result.get("signal"), pid=result.get("pid"))
+                _emit_event(ns.json_logs, "encoder-stopped", signal=result.get("signal"), pid=result.get("pid"))
                 sys.exit(0)
             elif res == "not_running":
-                _emit_enc("encoder-not-running", pid=result.get("pid"))
+                _emit_event(ns.json_logs, "encoder-not-running", pid=result.get("pid"))
                 sys.exit(0)
             elif res == "timeout":
-                _emit_enc("encoder-stop-timeout", pid=result.get("pid"), signal=result.get("signal"))
+                _emit_event(ns.json_logs, "encoder-stop-timeout", pid=result.get("pid"), signal=result.get("signal"))
                 sys.exit(2)
             else:
-                _emit_enc("encoder-stop-failed", pid=result.get("pid"))
+                _emit_event(ns.json_logs, "encoder-stop-failed", pid=result.get("pid"))
                 sys.exit(2)
 
         elif enc_cmd == "status":
             state = encoder_runtime_state()
             if ns.json_logs:
-                print(json.dumps({"event": "encoder-status", **state}))
+                _write_json_line({"event": "encoder-status", **state})
             else:
+                lines: list[str] = []
                 if state.get("running"):
-                    print(
+                    lines.append(
                         f"Encoder daemon: running (pid={state.get('pid')}, started={state.get('started_at')})"
                     )
                 else:
-                    print("Encoder daemon: not running")
+                    lines.append("Encoder daemon: not running")
                 current = state.get("current_job")
                 last = state.get("last_job")
                 if current:
-                    print(f"Current job: {current}")
+                    lines.append(f"Current job: {current}")
                 if last:
-                    print(f"Last job: {last}")
+                    lines.append(f"Last job: {last}")
+                sys.stdout.write("\n".join(lines) + "\n")
             sys.exit(0)
 
         else:
@@ -608,61 +784,51 @@ def main(argv: list[str] | None = None) -> None:
             sys.exit(1)
 
     elif ns.cmd == "encode-mode":
-        def _emit_mode(event: str, **extra: object) -> None:
-            if ns.json_logs:
-                payload: dict[str, object] = {"event": event}
-                if extra:
-                    payload.update(extra)
-                print(json.dumps(payload))
-            else:
-                if extra:
-                    details = " ".join(f"{k}={extra[k]}" for k in sorted(extra))
-                    print(f"{event}: {details}")
-                else:
-                    print(event)
-
+        # DEFAULT_CONFIG_PATH is expanded once at import
         cfg_path = Path(ns.config).expanduser() if ns.config else DEFAULT_CONFIG_PATH
 
         if ns.encode_mode_cmd == "status":
             current_cfg = effective_config(ns.config)
             enabled = _coerce_bool(current_cfg.get("record", {}).get("enable_remux", True), True)
-            _emit_mode("encode-mode-status", enabled=enabled)
+            _emit_event(ns.json_logs, "encode-mode-status", enabled=enabled)
             sys.exit(0)
 
         desired = True if ns.encode_mode_cmd == "on" else False
-        # Determine current value from file to avoid env-masked surprises
-        data = _load_raw_config(cfg_path)
-        record_cfg = data.get("record", {}) if isinstance(data, dict) else {}
-        previous_val = record_cfg.get("enable_remux")
+        # Determine current value from file to avoid env-masked surprises;
+        # the text is read once and reused for the edit below
+        try:
+            original_text: str | None = cfg_path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            original_text = None
+        try:
+            data = tomllib.loads(original_text) if original_text else {}
+        except Exception as exc:
+            raise RuntimeError(f"failed to read config {cfg_path}: {exc}") from exc
+        record_cfg = data.get("record", {})
+        previous_val = record_cfg.get("enable_remux") if isinstance(record_cfg, dict) else None
         previous_bool = _coerce_bool(previous_val, True)
-        if previous_bool == desired and cfg_path.exists():
-            _emit_mode("encode-mode-unchanged", enabled=desired, config=str(cfg_path))
+        if previous_bool == desired and original_text is not None:
+            _emit_event(ns.json_logs, "encode-mode-unchanged", enabled=desired, config=str(cfg_path))
             sys.exit(0)
 
         # Edit only the specific key in the TOML, preserving comments
-        _set_enable_remux_in_config(cfg_path, desired)
-        _emit_mode("encode-mode-set", enabled=desired, config=str(cfg_path))
+        try:
+            _set_enable_remux_in_config(cfg_path, desired, original_text or "")
+        except ValueError as exc:
+            _emit_event(ns.json_logs, "encode-mode-failed", config=str(cfg_path), error=str(exc))
+            sys.exit(2)
+        _emit_event(ns.json_logs, "encode-mode-set", enabled=desired, config=str(cfg_path))
         sys.exit(0)
 
     elif ns.cmd == "poller":
-        c = cfg
+        import asyncio
 
-        def _emit(event: str, **extra: object) -> None:
-            if ns.json_logs:
-                payload: dict[str, object] = {"event": event}
-                if extra:
-                    payload.update(extra)
-                print(json.dumps(payload))
-            else:
-                if extra:
-                    details = " ".join(f"{k}={extra[k]}" for k in sorted(extra))
-                    print(f"{event}: {details}")
-                else:
-                    print(event)
+        from .poller import PollerOptions, poller, poller_runtime_state, stop_poller_daemon
 
         poller_cmd = ns.poller_cmd or "run"
 
         if poller_cmd == "run":
+            c = effective_config(ns.config)
             opts = PollerOptions(
                 users_file=ns.users_file or Path(c["poller"]["users_file"]),
                 interval=ns.interval or c["poller"]["interval"],
@@ -684,7 +850,8 @@ def main(argv: list[str] | None = None) -> None:
             state = result.get("state", {})
             if res == "stopped":
                 sig = result.get("signal", "SIGTERM")
-                _emit(
+                _emit_event(
+                    ns.json_logs,
                     "poller-stopped",
                     signal=sig,
                     pid=result.get("pid"),
@@ -692,54 +859,55 @@ def main(argv: list[str] | None = None) -> None:
                 )
                 sys.exit(0)
             elif res == "not_running":
-                _emit("poller-not-running", pid=result.get("pid"))
+                _emit_event(ns.json_logs, "poller-not-running", pid=result.get("pid"))
                 sys.exit(0)
             elif res == "timeout":
-                _emit("poller-stop-timeout", pid=result.get("pid"), signal=result.get("signal"))
+                _emit_event(ns.json_logs, "poller-stop-timeout", pid=result.get("pid"), signal=result.get("signal"))
                 sys.exit(2)
             else:
-                _emit("poller-stop-failed", pid=result.get("pid"))
+                _emit_event(ns.json_logs, "poller-stop-failed", pid=result.get("pid"))
                 sys.exit(2)
 
         elif poller_cmd == "status":
             state = poller_runtime_state()
             if ns.json_logs:
-                print(json.dumps({"event": "poller-status", **state}))
+                _write_json_line({"event": "poller-status", **state})
             else:
+                lines: list[str] = []
                 if state.get("running"):
-                    print(
+                    lines.append(
                         f"Poller: running (pid={state.get('pid')}, started={state.get('started_at')})"
                     )
                 else:
-                    print("Poller: not running")
+                    lines.append("Poller: not running")
                 if state.get("last_poll_ts"):
-                    print(f"Last poll: {state.get('last_poll_ts')}")
-                if state.get("next_poll_ts") and state.get("running"):
-                    print(f"Next poll: {state.get('next_poll_ts')}")
-                    try:
-                        from datetime import datetime, timezone
-                        next_dt = datetime.fromisoformat(str(state.get('next_poll_ts')))
-                        minutes = max((next_dt - datetime.now(timezone.utc)).total_seconds(), 0) / 60.0
-                        print(f"Next poll in: {minutes:.1f} minute(s)")
-                    except Exception:
-                        pass
-                elif state.get("next_poll_ts"):
-                    print(f"Next poll (projected): {state.get('next_poll_ts')}")
+                    lines.append(f"Last poll: {state.get('last_poll_ts')}")
+                next_ts = state.get("next_poll_ts")
+                next_dt: datetime | None = None
+                if next_ts and state.get("running"):
+                    lines.append(f"Next poll: {next_ts}")
+                    next_dt = _parse_iso(next_ts)
+                elif next_ts:
+                    lines.append(f"Next poll (projected): {next_ts}")
                 elif state.get("interval"):
-                    last_ts = state.get("last_poll_ts")
+                    last_dt = _parse_iso(state.get("last_poll_ts"))
+                    try:
+                        seconds = int(state["interval"])
+                    except (TypeError, ValueError):
+                        last_dt = None
+                    if last_dt is not None:
+                        next_dt = last_dt + timedelta(seconds=seconds)
+                        lines.append(f"Next poll (projected): {next_dt.isoformat()}")
+                if next_dt is not None:
                     try:
-                        if last_ts:
-                            from datetime import datetime, timezone
-                            last_dt = datetime.fromisoformat(str(last_ts))
-                            next_dt = last_dt + timedelta(seconds=int(state["interval"]))
-                            print(f"Next poll (projected): {next_dt.isoformat()}")
-                            minutes = max((next_dt - datetime.now(timezone.utc)).total_seconds(), 0) / 60.0
-                            print(f"Next poll in: {minutes:.1f} minute(s)")
-                    except Exception:
+                        minutes = max((next_dt - datetime.now(timezone.utc)).total_seconds(), 0) / 60.0
+                        lines.append(f"Next poll in: {minutes:.1f} minute(s)")
+                    except TypeError:  # naive timestamp from an older state file
                         pass
                 interval = state.get("interval")
                 if interval:
-                    print(f"Interval: {interval} seconds")
+                    lines.append(f"Interval: {interval} seconds")
+                sys.stdout.write("\n".join(lines) + "\n")
             sys.exit(0)
 
         else:
@@ -747,14 +915,16 @@ def main(argv: list[str] | None = None) -> None:
             sys.exit(1)
 
     elif ns.cmd == "doctor":
-        c = cfg
+        from .doctor import doctor as doctor_cmd
+
+        c = effective_config(ns.config)
         qd = ns.queue_dir or Path(c["paths"]["queue_dir"])
         ld = ns.logs_dir or Path(c["paths"]["logs_dir"])
         rc = doctor_cmd(qd, ld, c["limits"]["record_limit"])
         sys.exit(rc)
 
     elif ns.cmd == "clean":
-        c = cfg
+        c = effective_config(ns.config)
         record_limit = ns.record_limit or c["limits"]["record_limit"]
         gsm = GlobalSlotManager(record_limit)
         removed = gsm.cleanup_stale_owners()
@@ -769,46 +939,37 @@ def main(argv: list[str] | None = None) -> None:
         sys.exit(0)
 
     elif ns.cmd == "stop":
-        c = cfg
-        record_limit = ns.record_limit or c["limits"]["record_limit"]
-        slot = int(ns.slot)
+        import signal
 
-        def _emit(event: str, **extra: object) -> None:
-            if ns.json_logs:
-                payload: dict[str, object] = {"event": event}
-                if extra:
-                    payload.update(extra)
-                print(json.dumps(payload))
-            else:
-                if extra:
-                    details = " ".join(f"{k}={extra[k]}" for k in sorted(extra))
-                    print(f"{event}: {details}")
-                else:
-                    print(event)
+        record_limit = ns.record_limit or effective_config(ns.config)["limits"]["record_limit"]
+        slot = int(ns.slot)
 
         if slot < 1 or slot > record_limit:
-            _emit("invalid-slot", slot=slot, record_limit=record_limit)
+            _emit_event(ns.json_logs, "invalid-slot", slot=slot, record_limit=record_limit)
             sys.exit(2)
 
         gsm = GlobalSlotManager(record_limit)
         owner = next((o for o in gsm.list_active_owners() if o.slot_index == slot), None)
         if owner is None:
-            _emit("slot-idle", slot=slot)
+            _emit_event(ns.json_logs, "slot-idle", slot=slot)
             sys.exit(1)
 
         sig = signal.SIGINT
         sig_name = signal.Signals(sig).name
         try:
-            os.kill(owner.pid, sig)
+            # One pidfd both signals and awaits the owner, so a recycled pid is never hit
+            proc = ProcessHandle(owner.pid)
+            proc.send_signal(sig)
         except ProcessLookupError:
-            _emit("process-missing", slot=slot, pid=owner.pid)
+            _emit_event(ns.json_logs, "process-missing", slot=slot, pid=owner.pid)
             try:
                 gsm.cleanup_stale_owners()
             except Exception:
                 pass
             sys.exit(1)
 
-        _emit(
+        _emit_event(
+            ns.json_logs,
             "signal-sent",
             slot=slot,
             pid=owner.pid,
@@ -817,52 +978,62 @@ def main(argv: list[str] | None = None) -> None:
         )
 
         timeout = max(0.0, float(ns.timeout)) if hasattr(ns, "timeout") else 0.0
-        if timeout > 0:
-            deadline = time.time() + timeout
-            while time.time() < deadline:
-                if not is_process_alive(owner.pid):
-                    _emit("stopped", slot=slot, pid=owner.pid, method=sig_name)
-                    try:
-                        gsm.cleanup_stale_owners()
-                    except Exception:
-                        pass
-                    sys.exit(0)
-                time.sleep(0.3)
-
-            if ns.force:
-                kill_sig = signal.SIGKILL
-                kill_name = signal.Signals(kill_sig).name
-                try:
-                    os.kill(owner.pid, kill_sig)
-                except ProcessLookupError:
-                    _emit("stopped", slot=slot, pid=owner.pid, method=kill_name)
-                    try:
-                        gsm.cleanup_stale_owners()
-                    except Exception:
-                        pass
-                    sys.exit(0)
-
-                _emit("signal-sent", slot=slot, pid=owner.pid, username=owner.username, signal=kill_name)
-                for _ in range(20):
-                    if not is_process_alive(owner.pid):
-                        _emit("stopped", slot=slot, pid=owner.pid, method=kill_name)
+        try:
+            with proc:
+                if timeout > 0:
+                    if proc.wait(timeout):
+                        _emit_event(ns.json_logs, "stopped", slot=slot, pid=owner.pid, method=sig_name)
                         try:
                             gsm.cleanup_stale_owners()
                         except Exception:
                             pass
                         sys.exit(0)
-                    time.sleep(0.3)
 
-                _emit("still-running", slot=slot, pid=owner.pid)
-                sys.exit(2)
-            else:
-                _emit("still-running", slot=slot, pid=owner.pid)
-                sys.exit(2)
+                    if ns.force:
+                        kill_sig = signal.SIGKILL
+                        kill_name = signal.Signals(kill_sig).name
+                        try:
+                            proc.send_signal(kill_sig)
+                        except ProcessLookupError:
+                            _emit_event(ns.json_logs, "stopped", slot=slot, pid=owner.pid, method=kill_name)
+                            try:
+                                gsm.cleanup_stale_owners()
+                            except Exception:
+                                pass
+                            sys.exit(0)
+
+                        _emit_event(
+                            ns.json_logs,
+                            "signal-sent",
+                            slot=slot,
+                            pid=owner.pid,
+                            username=owner.username,
+                            signal=kill_name,
+                        )
+                        if proc.wait(6.0):
+                            _emit_event(ns.json_logs, "stopped", slot=slot, pid=owner.pid, method=kill_name)
+                            try:
+                                gsm.cleanup_stale_owners()
+                            except Exception:
+                                pass
+                            sys.exit(0)
+
+                        _emit_event(ns.json_logs, "still-running", slot=slot, pid=owner.pid)
+                        sys.exit(2)
+                    else:
+                        _emit_event(ns.json_logs, "still-running", slot=slot, pid=owner.pid)
+                        sys.exit(2)
+        except KeyboardInterrupt:
+            # Ctrl-C only abandons the wait; the recorder already has its signal
+            _emit_event(ns.json_logs, "wait-interrupted", slot=slot, pid=owner.pid)
+            sys.exit(130)
 
         sys.exit(0)
 
     elif ns.cmd == "status":
-        c = cfg
+        from .status import gather_status, print_report
+
+        c = effective_config(ns.config)
         queue_dir = ns.queue_dir or Path(c["paths"]["queue_dir"])
         record_limit = ns.record_limit or c["limits"]["record_limit"]
         report = gather_status(queue_dir, record_limit)
@@ -870,20 +1041,13 @@ def main(argv: list[str] | None = None) -> None:
         sys.exit(0)
 
     elif ns.cmd == "tscompress":
-        c = cfg
+        from .tscompress import TsCompressOptions, default_jobs, emit_event, run_tscompress, setup_event_log
 
-        def _emit(event: str, **extra: object) -> None:
-            if ns.json_logs:
-                payload: dict[str, object] = {"event": event}
-                if extra:
-                    payload.update(extra)
-                print(json.dumps(payload))
-            else:
-                if extra:
-                    details = " ".join(f"{k}={extra[k]}" for k in sorted(extra))
-                    print(f"{event}: {details}")
-                else:
-                    print(event)
+        # Checks below and per-file events share one logger, so --json-logs
+        # output is one line schema and --quiet applies to both
+        setup_event_log(json_logs=bool(ns.json_logs), quiet=bool(ns.quiet))
+
+        c = effective_config(ns.config)
 
         encode_cfg = c.get("encode_daemon", {})
         record_cfg = c.get("record", {})
@@ -893,16 +1057,11 @@ def main(argv: list[str] | None = None) -> None:
         try:
             max_height = int(max_height_raw) if max_height_raw is not None else None
         except (TypeError, ValueError):
-            _emit("invalid-height", value=max_height_raw)
+            emit_event(ns.json_logs, "invalid-height", warn=True, value=max_height_raw)
             sys.exit(2)
 
         preset = ns.preset or encode_cfg.get("preset", "medium")
         crf_val = int(ns.crf or encode_cfg.get("crf", 26))
-        threads_raw = ns.threads if ns.threads is not None else encode_cfg.get("threads", 1)
-        try:
-            threads_val = int(threads_raw)
-        except (TypeError, ValueError):
-            threads_val = 1
         loglevel = ns.loglevel or encode_cfg.get("loglevel", "info")
         video_codec = ns.video_codec or encode_cfg.get("video_codec", "libx265")
         audio_bitrate = ns.audio_bitrate or encode_cfg.get("audio_bitrate", "160k")
@@ -911,6 +1070,10 @@ def main(argv: list[str] | None = None) -> None:
         except (TypeError, ValueError):
             audio_rate_val = 48_000
         x265_params = ns.x265_params or encode_cfg.get("x265_params")
+        if ns.audio_copy is None:
+            audio_copy = _coerce_bool(encode_cfg.get("audio_copy", False), False)
+        else:
+            audio_copy = bool(ns.audio_copy)
         remux_only = bool(ns.remux_only)
         dry_run = bool(ns.dry_run)
         delete_source = bool(ns.delete_source)
@@ -929,15 +1092,42 @@ def main(argv: list[str] | None = None) -> None:
         else:
             delete_input_on_success = bool(ns.delete_input_on_success)
 
+        # --delete-ts-after-remux only makes sense when the intermediate remux is kept
+        fuse_remux_encode = ns.fuse_remux_encode is not False and not delete_ts_after_remux
+
         fps_arg = ns.fps if getattr(ns, "fps", None) is not None else encode_cfg.get("fps", "auto")
         if fps_arg and str(fps_arg).strip().lower() not in {"", "auto"}:
-            _emit("ignoring-fps", requested=str(fps_arg))
+            emit_event(ns.json_logs, "ignoring-fps", warn=True, requested=str(fps_arg))
 
         try:
             ffmpeg_bin = resolve_ffmpeg(ffmpeg_binary)
         except FfmpegNotFound:
-            _emit("ffmpeg-missing", binary=ffmpeg_binary)
+            emit_event(ns.json_logs, "ffmpeg-missing", warn=True, binary=ffmpeg_binary)
+            sys.exit(2)
+
+        two_stage = bool(ns.two_stage)
+        ffprobe_bin = resolve_ffprobe(ffmpeg_bin) if audio_copy or two_stage else None
+        if audio_copy and ffprobe_bin is None:
+            emit_event(ns.json_logs, "ffprobe-missing", warn=True, fallback="reencode-audio")
+        if two_stage and ffprobe_bin is None:
+            emit_event(ns.json_logs, "ffprobe-missing", warn=True, fallback="single-stage")
+
+        hwaccel_req = ns.hwaccel or encode_cfg.get("hwaccel", "none")
+        try:
+            hwaccel = resolve_hwaccel(ffmpeg_bin, hwaccel_req, video_codec)
+        except ValueError:
+            emit_event(ns.json_logs, "invalid-hwaccel", warn=True, value=hwaccel_req)
+            sys.exit(2)
+        gpu_scaler = resolve_gpu_scaler(ffmpeg_bin, hwaccel)
+        nvenc_preset = ns.nvenc_preset or encode_cfg.get("nvenc_preset", "p4")
+        nvenc_tune = ns.nvenc_tune or encode_cfg.get("nvenc_tune", "hq")
+        if nvenc_preset not in NVENC_PRESETS or nvenc_tune not in NVENC_TUNES:
+            emit_event(ns.json_logs, "invalid-nvenc-settings", warn=True, preset=nvenc_preset, tune=nvenc_tune)
             sys.exit(2)
+        if str(hwaccel_req).strip().lower() != "none":
+            emit_event(
+                ns.json_logs, "hwaccel", requested=hwaccel_req, selected=hwaccel, gpu_decode=gpu_scaler is not None
+            )
 
         global_output_dir: Path | None = None
         if ns.output_dir:
@@ -947,156 +1137,105 @@ def main(argv: list[str] | None = None) -> None:
         patterns = list(getattr(ns, "inputs", []) or [])
         inputs, unmatched = normalize_inputs(patterns)
         for pattern in unmatched:
-            _emit("no-match", pattern=pattern)
+            emit_event(ns.json_logs, "no-match", warn=True, pattern=pattern)
 
         if not inputs:
-            _emit("no-inputs")
+            emit_event(ns.json_logs, "no-inputs", warn=True)
             sys.exit(1)
 
-        rc_overall = 0
-        prefix = build_nice_ionice_prefix()
-
-        for raw in inputs:
-            try:
-                src = raw.resolve()
-            except FileNotFoundError:
-                src = raw
-
-            if not src.exists():
-                _emit("skip-missing", path=str(src))
-                rc_overall = rc_overall or 1
-                continue
-            if src.suffix.lower() != ".ts":
-                _emit("skip-non-ts", path=str(src))
-                rc_overall = rc_overall or 1
-                continue
-
-            dst_dir = global_output_dir or src.parent
-            dst_dir.mkdir(parents=True, exist_ok=True)
-            remux_mp4 = dst_dir / f"{src.stem}.mp4"
-            final_mp4 = dst_dir / f"{src.stem}{suffix}.mp4"
-
-            _emit("begin", input=str(src))
-
-            encode_input = src
-
-            need_remux = remux_only or overwrite or not (remux_mp4.exists() and remux_mp4.stat().st_size > 0)
-            if need_remux:
-                remux_cmd = build_remux_cmd(
-                    ffmpeg_bin,
-                    src,
-                    remux_mp4,
-                    loglevel=loglevel,
-                    stats=not ns.json_logs,
-                    overwrite=True,
-                )
-                _emit("remux-start", cmd=shlex.join(remux_cmd))
-                if dry_run:
-                    remux_rc = 0
-                    _emit("remux-dry-run", output=str(remux_mp4))
-                else:
-                    remux_rc = subprocess.run(remux_cmd).returncode
-                if remux_rc == 0 and remux_mp4.exists() and remux_mp4.stat().st_size > 0:
-                    _emit("remux-ok", output=str(remux_mp4))
-                    encode_input = remux_mp4
-                    if delete_ts_after_remux and src.exists():
-                        try:
-                            src.unlink()
-                            _emit("ts-deleted", path=str(src))
-                        except Exception as exc:
-                            _emit("ts-delete-failed", path=str(src), error=str(exc))
-                else:
-                    _emit("remux-failed", rc=remux_rc)
-                    if remux_only:
-                        rc_overall = rc_overall or (remux_rc or 1)
-                        continue
-            else:
-                _emit("remux-skip-exists", output=str(remux_mp4))
-                if remux_mp4.exists():
-                    encode_input = remux_mp4
+        jobs = int(ns.jobs) if ns.jobs is not None else default_jobs()
+        if jobs < 1:
+            emit_event(ns.json_logs, "invalid-jobs", warn=True, value=jobs)
+            sys.exit(2)
+        jobs = min(jobs, len(inputs))
+
+        # [encode_daemon] threads is tuned for background encodes next to live
+        # recordings; tscompress defaults to spreading the cores across jobs.
+        if ns.threads is not None:
+            threads_val = max(0, int(ns.threads))
+        elif jobs == 1:
+            threads_val = 0
+        else:
+            threads_val = max(1, (os.cpu_count() or 1) // jobs)
+        if not x265_params and video_codec == "libx265" and hwaccel == "none":
+            x265_params = default_x265_params((os.cpu_count() or 1) // jobs, whole_machine=jobs == 1)
 
-            if remux_only:
-                if delete_source and src.exists() and remux_mp4.exists() and remux_mp4.stat().st_size > 0 and not dry_run:
-                    try:
-                        src.unlink()
-                        _emit("source-deleted", path=str(src))
-                    except Exception as exc:
-                        _emit("source-delete-failed", path=str(src), error=str(exc))
-                continue
-
-            if final_mp4.exists() and final_mp4.stat().st_size > 0 and not overwrite:
-                _emit("encode-skip-exists", output=str(final_mp4))
-                continue
-
-            encode_cmd = prefix + build_encode_cmd(
-                ffmpeg_bin,
-                encode_input,
-                final_mp4,
-                video_codec=video_codec,
-                preset=preset,
-                crf=crf_val,
-                audio_bitrate=audio_bitrate,
-                audio_rate=audio_rate_val,
-                max_height=max_height,
-                threads=threads_val if threads_val > 0 else None,
-                loglevel=loglevel,
-                x265_params=x265_params,
-                stats=not ns.json_logs,
-                overwrite=True,
-            )
-            _emit("encode-start", cmd=shlex.join(encode_cmd))
-            if dry_run:
-                _emit("encode-dry-run", output=str(final_mp4))
-                continue
-
-            erc = subprocess.run(encode_cmd).returncode
-            if erc != 0 or not final_mp4.exists() or final_mp4.stat().st_size == 0:
-                _emit("encode-failed", rc=erc, input=str(src))
-                rc_overall = rc_overall or (erc or 1)
-                continue
-
-            _emit("encode-ok", output=str(final_mp4))
-
-            if delete_input_on_success and encode_input.exists():
-                try:
-                    src_size = encode_input.stat().st_size
-                    out_size = final_mp4.stat().st_size
-                except OSError as exc:
-                    _emit("input-delete-failed", path=str(encode_input), error=str(exc))
-                else:
-                    if out_size < src_size * 0.1:
-                        _emit("input-delete-skipped", path=str(encode_input), reason="output-too-small")
-                    elif out_size == 0:
-                        _emit("input-delete-skipped", path=str(encode_input), reason="output-zero-bytes")
-                    else:
-                        try:
-                            encode_input.unlink()
-                            _emit("input-deleted", path=str(encode_input))
-                        except Exception as exc:
-                            _emit("input-delete-failed", path=str(encode_input), error=str(exc))
-
-            if delete_source and src.exists():
-                try:
-                    src_size = src.stat().st_size
-                    out_size = final_mp4.stat().st_size
-                except OSError as exc:
-                    _emit("source-delete-failed", path=str(src), error=str(exc))
-                else:
-                    if out_size == 0:
-                        _emit("source-delete-skipped", path=str(src), reason="output-zero-bytes")
-                    elif not remux_only and out_size < src_size * 0.1:
-                        _emit("source-delete-skipped", path=str(src), reason="output-too-small")
-                    else:
-                        try:
-                            src.unlink()
-                            _emit("source-deleted", path=str(src))
-                        except Exception as exc:
-                            _emit("source-delete-failed", path=str(src), error=str(exc))
+        batch = int(ns.batch) if ns.batch is not None else 0
+        if batch < 0:
+            emit_event(ns.json_logs, "invalid-batch", warn=True, value=batch)
+            sys.exit(2)
+        if batch > 1 and not remux_only and not fuse_remux_encode:
+            emit_event(ns.json_logs, "ignoring-keep-remux", warn=True, reason="batch")
 
+        gpu_jobs_raw = ns.gpu_jobs if ns.gpu_jobs is not None else encode_cfg.get("gpu_jobs", 2)
+        try:
+            gpu_jobs = int(gpu_jobs_raw)
+        except (TypeError, ValueError):
+            gpu_jobs = 0
+        if gpu_jobs < 1:
+            emit_event(ns.json_logs, "invalid-gpu-jobs", warn=True, value=gpu_jobs_raw)
+            sys.exit(2)
+        if hwaccel == "nvenc" and not dry_run and not remux_only:
+            in_use = nvenc_sessions_in_use()
+            if in_use is not None:
+                free = NVENC_SESSION_LIMIT - in_use
+                if free < 1:
+                    emit_event(
+                        ns.json_logs, "nvenc-sessions-exhausted", warn=True, in_use=in_use, limit=NVENC_SESSION_LIMIT
+                    )
+                    sys.exit(2)
+                if gpu_jobs > free:
+                    emit_event(
+                        ns.json_logs, "gpu-jobs-capped", warn=True, requested=gpu_jobs, selected=free, in_use=in_use
+                    )
+                    gpu_jobs = free
+
+        opts = TsCompressOptions(
+            ffmpeg_bin=ffmpeg_bin,
+            output_dir=global_output_dir,
+            suffix=suffix,
+            video_codec=video_codec,
+            preset=preset,
+            crf=crf_val,
+            audio_bitrate=audio_bitrate,
+            audio_rate=audio_rate_val,
+            audio_copy=audio_copy,
+            ffprobe_bin=ffprobe_bin,
+            max_height=max_height,
+            threads=threads_val,
+            loglevel=loglevel,
+            x265_params=x265_params,
+            hwaccel=hwaccel,
+            gpu_scaler=gpu_scaler,
+            nvenc_preset=nvenc_preset,
+            nvenc_tune=nvenc_tune,
+            two_stage=two_stage,
+            remux_only=remux_only,
+            fuse_remux_encode=fuse_remux_encode,
+            dry_run=dry_run,
+            delete_source=delete_source,
+            overwrite=overwrite,
+            delete_ts_after_remux=delete_ts_after_remux,
+            delete_input_on_success=delete_input_on_success,
+            json_logs=bool(ns.json_logs),
+            quiet=bool(ns.quiet),
+            preallocate=bool(ns.preallocate),
+            resume=bool(ns.resume),
+            pin_cpus=bool(ns.pin_cpus),
+            # ffmpeg progress lines from several workers would interleave on the terminal
+            stats=not ns.json_logs and jobs == 1,
+            nice_prefix=tuple(build_nice_ionice_prefix()),
+            jobs=jobs,
+            gpu_jobs=gpu_jobs,
+            batch=batch,
+        )
+        rc_overall = run_tscompress(inputs, opts)
         sys.exit(rc_overall)
 
     elif ns.cmd == "users":
-        c = cfg
+        from .users_cli import add_users, list_users, remove_users
+
+        c = effective_config(ns.config)
         users_path = Path(ns.users_file or c["poller"]["users_file"])
         if ns.users_cmd == "list":
             rc = list_users(users_path)
@@ -1,44 +1,73 @@
 from __future__ import annotations
 
+import copy
 import os
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
 
 try:
     import tomllib  # Python 3.11+
 except Exception:  # pragma: no cover
     import tomli as tomllib  # type: ignore[no-redef]
 
+# Expanded once here; callers use it as-is and only expand user-supplied paths
 DEFAULT_CONFIG_PATH = Path("~/.config/twitchtool/config.toml").expanduser()
 
 
-def _env_int(name: str, default: Optional[int]) -> Optional[int]:
-    v = os.getenv(name)
-    if v is None or v == "":
-        return default
+def _as_int(v: str) -> Optional[int]:
     try:
         return int(v)
     except ValueError:
-        return default
+        return None
 
 
-def _env_bool(name: str, default: Optional[bool]) -> Optional[bool]:
-    v = os.getenv(name)
-    if v is None or v == "":
-        return default
+def _as_bool(v: str) -> Optional[bool]:
     if v.lower() in {"1", "true", "yes", "y"}:
         return True
     if v.lower() in {"0", "false", "no", "n"}:
         return False
-    return default
-
-
-def _env_str(name: str, default: Optional[str]) -> Optional[str]:
-    v = os.getenv(name)
-    if v is None or v == "":
-        return default
-    return v
+    return None
+
+
+def _as_gib(v: str) -> Optional[int]:
+    n = _as_int(v)
+    return None if n is None else n * 1024 * 1024 * 1024
+
+
+# (env var, config section, key, parser); a parser returning None ignores the
+# value. DISK_FREE_MIN_GB follows DISK_FREE_MIN_BYTES so it wins when both parse.
+ENV_SCHEMA: Tuple[Tuple[str, str, str, Callable[[str], Any]], ...] = (
+    ("RECORD_LIMIT", "limits", "record_limit", _as_int),
+    ("QUEUE_DIR", "paths", "queue_dir", str),
+    ("DISK_FREE_MIN_BYTES", "storage", "disk_free_min_bytes", _as_int),
+    ("DISK_FREE_MIN_GB", "storage", "disk_free_min_bytes", _as_gib),
+    ("QUALITY", "record", "quality", str),
+    ("RETRY_DELAY", "record", "retry_delay", _as_int),
+    ("RETRY_WINDOW", "record", "retry_window", _as_int),
+    ("LOGLEVEL", "record", "loglevel", str),
+    ("REMUX_ENABLED", "record", "enable_remux", _as_bool),
+    ("DELETE_TS_AFTER_REMUX", "record", "delete_ts_after_remux", _as_bool),
+    ("DELETE_INPUT_ON_SUCCESS", "record", "delete_input_on_success", _as_bool),
+    ("ENCODER_PRESET", "encode_daemon", "preset", str),
+    ("ENCODER_CRF", "encode_daemon", "crf", _as_int),
+    ("ENCODER_THREADS", "encode_daemon", "threads", _as_int),
+    ("ENCODER_HEIGHT", "encode_daemon", "height", _as_int),
+    # accept 'auto' or fraction/numeric strings
+    ("ENCODER_FPS", "encode_daemon", "fps", str),
+    ("ENCODER_LOGLEVEL", "encode_daemon", "loglevel", str),
+    ("ENCODER_VIDEO_CODEC", "encode_daemon", "video_codec", str),
+    ("ENCODER_AUDIO_BITRATE", "encode_daemon", "audio_bitrate", str),
+    ("ENCODER_AUDIO_RATE", "encode_daemon", "audio_rate", _as_int),
+    ("ENCODER_X265_PARAMS", "encode_daemon", "x265_params", str),
+    ("USERS_FILE", "poller", "users_file", str),
+    ("POLL_INTERVAL", "poller", "interval", _as_int),
+    ("DOWNLOAD_CMD", "poller", "download_cmd", str),
+    ("PROBE_TIMEOUT", "poller", "timeout", _as_int),
+    ("PROBE_CONCURRENCY", "poller", "probe_concurrency", _as_int),
+)
 
 
 def _default_record_dir() -> Path:
@@ -97,115 +126,58 @@ DEFAULTS: Dict[str, Any] = {
 }
 
 
-def load_config_file(path: Optional[Path]) -> Dict[str, Any]:
-    p = (path or DEFAULT_CONFIG_PATH).expanduser()
-    if not p.exists():
-        return {}
-    with p.open("rb") as f:
+@lru_cache(maxsize=8)
+def _parse_config(path: str, mtime_ns: int) -> Dict[str, Any]:
+    # mtime_ns is only part of the cache key so edits invalidate the entry
+    with open(path, "rb") as f:
         return tomllib.load(f)
 
 
-def merge_dicts(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+def load_config_file(path: Optional[Path]) -> Mapping[str, Any]:
+    p = path.expanduser() if path else DEFAULT_CONFIG_PATH
+    try:
+        mtime_ns = p.stat().st_mtime_ns
+    except FileNotFoundError:
+        return MappingProxyType({})
+    # Read-only view of the shared cached parse; merge_dicts copies what it keeps
+    return MappingProxyType(_parse_config(str(p), mtime_ns))
+
+
+def merge_dicts(base: Mapping[str, Any], override: Mapping[str, Any]) -> Dict[str, Any]:
+    # Copy-on-write: only levels the override touches get a shallow copy
     out = dict(base)
-    for k, v in override.items():
-        if isinstance(v, dict) and isinstance(base.get(k), dict):
-            out[k] = merge_dicts(base[k], v)  # type: ignore[index]
-        else:
-            out[k] = v
+    stack = [(out, override)]
+    while stack:
+        dst, src = stack.pop()
+        for k, v in src.items():
+            cur = dst.get(k)
+            if isinstance(v, dict) and isinstance(cur, dict):
+                dst[k] = cur = dict(cur)
+                stack.append((cur, v))
+            elif isinstance(v, (dict, list)):
+                # Never alias containers owned by the config cache
+                dst[k] = copy.deepcopy(v)
+            else:
+                dst[k] = v
     return out
 
 
 def apply_env(cfg: Dict[str, Any]) -> Dict[str, Any]:
     out = dict(cfg)
-    # Global
-    rl = _env_int("RECORD_LIMIT", None)
-    if rl is not None:
-        out.setdefault("limits", {})["record_limit"] = rl  # type: ignore[index]
-
-    qdir = _env_str("QUEUE_DIR", None)
-    if qdir:
-        out.setdefault("paths", {})["queue_dir"] = qdir  # type: ignore[index]
-
-    # Storage thresholds
-    s = out.setdefault("storage", {})
-    gb = _env_int("DISK_FREE_MIN_GB", None)
-    if gb is not None:
-        s["disk_free_min_bytes"] = int(gb) * 1024 * 1024 * 1024
-    else:
-        b = _env_int("DISK_FREE_MIN_BYTES", None)
-        if b is not None:
-            s["disk_free_min_bytes"] = int(b)
-
-    # Record
-    r = out.setdefault("record", {})
-    r_quality = _env_str("QUALITY", None)
-    if r_quality:
-        r["quality"] = r_quality
-    r_delay = _env_int("RETRY_DELAY", None)
-    if r_delay is not None:
-        r["retry_delay"] = r_delay
-    r_window = _env_int("RETRY_WINDOW", None)
-    if r_window is not None:
-        r["retry_window"] = r_window
-    r_loglevel = _env_str("LOGLEVEL", None)
-    if r_loglevel:
-        r["loglevel"] = r_loglevel
-    remux_enabled = _env_bool("REMUX_ENABLED", None)
-    if remux_enabled is not None:
-        r["enable_remux"] = remux_enabled
-    del_ts = _env_bool("DELETE_TS_AFTER_REMUX", None)
-    if del_ts is not None:
-        r["delete_ts_after_remux"] = del_ts
-    del_in = _env_bool("DELETE_INPUT_ON_SUCCESS", None)
-    if del_in is not None:
-        r["delete_input_on_success"] = del_in
-
-    # Encoder
-    e = out.setdefault("encode_daemon", {})
-    for env, key in [
-        ("ENCODER_PRESET", "preset"),
-        ("ENCODER_CRF", "crf"),
-        ("ENCODER_THREADS", "threads"),
-        ("ENCODER_HEIGHT", "height"),
-        ("ENCODER_FPS", "fps"),
-        ("ENCODER_LOGLEVEL", "loglevel"),
-        ("ENCODER_VIDEO_CODEC", "video_codec"),
-        ("ENCODER_AUDIO_BITRATE", "audio_bitrate"),
-        ("ENCODER_AUDIO_RATE", "audio_rate"),
-        ("ENCODER_X265_PARAMS", "x265_params"),
-    ]:
-        v = _env_str(env, None)
-        if v is not None:
-            if key in {"crf", "threads", "height", "audio_rate"}:
-                try:
-                    e[key] = int(v)
-                except ValueError:
-                    pass
-            elif key == "fps":
-                # accept 'auto' or fraction/numeric strings
-                e[key] = v
-            else:
-                e[key] = v
-
-    # Poller
-    p = out.setdefault("poller", {})
-    for env, key in [
-        ("USERS_FILE", "users_file"),
-        ("POLL_INTERVAL", "interval"),
-        ("DOWNLOAD_CMD", "download_cmd"),
-        ("PROBE_TIMEOUT", "timeout"),
-        ("PROBE_CONCURRENCY", "probe_concurrency"),
-    ]:
-        v = _env_str(env, None)
-        if v is not None:
-            if key in {"interval", "timeout", "probe_concurrency"}:
-                try:
-                    p[key] = int(v)
-                except ValueError:
-                    pass
-            else:
-                p[key] = v
-
+    env = os.environ
+    copied = set()
+    for name, section, key, parse in ENV_SCHEMA:
+        raw = env.get(name)
+        if not raw:
+            continue
+        value = parse(raw)
+        if value is None:
+            continue
+        if section not in copied:
+            # Sections may still be shared with DEFAULTS; copy before writing
+            out[section] = dict(out.get(section) or {})
+            copied.add(section)
+        out[section][key] = value
     return out
 
 
@@ -1,27 +1,32 @@
 from __future__ import annotations
 
+import fcntl
 import json
 import os
+import select
+import shlex
+import shutil
 import signal
 import subprocess
 import sys
+import threading
 import time
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
 from .ffmpeg_cmds import build_encode_cmd
 from .locks import GlobalSlotManager
-from .queue import JobEntry, oldest_job, write_error_for_job
+from .queue import oldest_job, write_error_for_job
 from .utils import (
+    ProcessHandle,
     abspath,
     build_nice_ionice_prefix,
     ensure_dir,
     is_process_alive,
     setup_logging,
     which,
-    sigcont_if_stopped,
     atomic_write_json,
     now_utc_iso,
     read_json,
@@ -32,6 +37,11 @@ ENCODER_LOCK_PATH = Path("/tmp/twitch-encoderd.lock")
 STATE_DIR = Path("~/.local/state/twitchtool/encoder").expanduser()
 PID_PATH = STATE_DIR / "encoder.pid"
 STATUS_PATH = STATE_DIR / "encoder_status.json"
+# Seconds between active-download checks while an encode runs
+_SUPERVISE_INTERVAL = 2.0
+# Failed jobs are kept this long, and checked for expiry this often (seconds)
+_FAILED_JOB_MAX_AGE = 7 * 86400
+_FAILED_SWEEP_INTERVAL = 3600.0
 
 
 @dataclass
@@ -57,38 +67,42 @@ class EncodeOptions:
 class SingleInstanceLock:
     def __init__(self, path: Path):
         self.path = path
-        self._fh = None
+        self._fd: Optional[int] = None
 
     def acquire(self) -> bool:
-        import fcntl
-
-        self._fh = self.path.open("a+")
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR | os.O_CLOEXEC, 0o644)
         try:
-            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
         except BlockingIOError:
-            self._fh.close()
-            self._fh = None
+            os.close(fd)
             return False
+        self._fd = fd
         return True
 
     def release(self) -> None:
-        if not self._fh:
+        if self._fd is None:
             return
-        import fcntl
-
         try:
-            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
         finally:
-            self._fh.close()
-            self._fh = None
+            os.close(self._fd)
+            self._fd = None
+
+
+# Stand-ins for the per-job paths in the command template; NUL never occurs in a path
+_INPUT_SLOT = "\0input"
+_OUTPUT_SLOT = "\0output"
 
 
-def _build_ffmpeg_cmd(job: JobEntry, opts: EncodeOptions) -> list[str]:
-    ffmpeg_bin = which("ffmpeg") or "ffmpeg"
-    cmd = build_encode_cmd(
-        ffmpeg_bin,
-        Path(job.job.input),
-        Path(job.job.output),
+def _encode_cmd_template(opts: EncodeOptions, *, ffmpeg: str, prefix: list[str]) -> tuple[list[str], int, int]:
+    """Build the encode argv once with placeholder paths.
+
+    Returns (argv, input_index, output_index); only the paths vary per job.
+    """
+    cmd = prefix + build_encode_cmd(
+        ffmpeg,
+        Path(_INPUT_SLOT),
+        Path(_OUTPUT_SLOT),
         video_codec=opts.video_codec,
         preset=opts.preset,
         crf=opts.crf,
@@ -101,14 +115,153 @@ def _build_ffmpeg_cmd(job: JobEntry, opts: EncodeOptions) -> list[str]:
         stats=False,
         overwrite=True,
     )
-    prefix = build_nice_ionice_prefix()
-    return prefix + cmd
+    return cmd, cmd.index(_INPUT_SLOT), cmd.index(_OUTPUT_SLOT)
+
+
+def _build_ffmpeg_cmd(template: tuple[list[str], int, int], in_path: Path, out_path: Path) -> list[str]:
+    argv, input_idx, output_idx = template
+    cmd = list(argv)
+    cmd[input_idx] = str(in_path)
+    cmd[output_idx] = str(out_path)
+    return cmd
+
+
+# Output directory -> (monotonic time, free bytes); queued jobs mostly share one
+_disk_free_cache: dict[str, tuple[float, int]] = {}
+_DISK_FREE_TTL = 2.0
+
+
+def _free_bytes(directory: str) -> int:
+    now = time.monotonic()
+    hit = _disk_free_cache.get(directory)
+    if hit is not None and now - hit[0] < _DISK_FREE_TTL:
+        return hit[1]
+    free = shutil.disk_usage(directory).free
+    _disk_free_cache[directory] = (now, free)
+    return free
 
 
 def _active_downloads(gsm: GlobalSlotManager) -> int:
     return gsm.active_count()
 
 
+def _downloads_changed(gsm: GlobalSlotManager, version: Optional[int], active: int) -> tuple[bool, Optional[int]]:
+    """Return (needs_recount, current_version) for the slot state.
+
+    Owner files only appear or vanish with a slots-dir change, but a recorder
+    that dies keeps its file, so any nonzero count is always rechecked.
+    """
+    current = gsm.state_version()
+    return current is None or current != version or active > 0, current
+
+
+def _spawn_encode(cmd: list[str]) -> subprocess.Popen:
+    """Start ffmpeg in its own session; stderr stays on the daemon's log stream."""
+    return subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def _signal_encode(proc: subprocess.Popen, sig: int) -> bool:
+    """Send *sig* to the encode's whole process group; False once it is gone."""
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def _supervise_encode(
+    proc: subprocess.Popen, gsm: GlobalSlotManager, logger, stopping: Callable[[], bool]
+) -> None:
+    """Pause *proc* while downloads are active; return once it exits or on shutdown.
+
+    Sleeps in poll() on a pidfd for the child plus the signal wakeup fd, so
+    exits and stop signals are seen at once; downloads are rechecked every
+    _SUPERVISE_INTERVAL seconds, skipping the owner scan while the slot state
+    is unchanged. Without pidfds exits wait for the next check.
+    """
+    try:
+        pidfd: Optional[int] = os.pidfd_open(proc.pid)  # type: ignore[attr-defined]
+    except (AttributeError, OSError):
+        pidfd = None
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_r, False)
+    os.set_blocking(wake_w, False)
+    try:
+        # Handlers only flip a flag; the wakeup byte is what ends the poll early
+        prev_wakeup: Optional[int] = signal.set_wakeup_fd(wake_w)
+    except ValueError:  # not the main thread
+        prev_wakeup = None
+    poller = select.poll()
+    poller.register(wake_r, select.POLLIN)
+    if pidfd is not None:
+        poller.register(pidfd, select.POLLIN)
+    paused = False
+    version: Optional[int] = None
+    active = 0
+    try:
+        while proc.poll() is None:
+            recount, version = _downloads_changed(gsm, version, active)
+            if recount:
+                active = _active_downloads(gsm)
+            if active > 0 and not paused:
+                if _signal_encode(proc, signal.SIGSTOP):
+                    paused = True
+                    logger.info("paused encode due to active downloads", extra={"extra": {"active": active}})
+            elif active == 0 and paused:
+                if _signal_encode(proc, signal.SIGCONT):
+                    paused = False
+                    logger.info("resumed encode; no active downloads")
+            if stopping():
+                # Unpause before exit
+                _signal_encode(proc, signal.SIGCONT)
+                _signal_encode(proc, signal.SIGTERM)
+                return
+            # With neither fd available this is a plain sleep
+            poller.poll(int(_SUPERVISE_INTERVAL * 1000))
+            try:
+                while os.read(wake_r, 512):
+                    pass
+            except BlockingIOError:
+                pass
+    finally:
+        if prev_wakeup is not None:
+            signal.set_wakeup_fd(prev_wakeup)
+        for fd in (wake_r, wake_w, pidfd):
+            if fd is not None:
+                os.close(fd)
+
+
+def _sweep_failed_jobs(jobs_dir: Path, logger) -> None:
+    """Delete *.failed.json jobs older than _FAILED_JOB_MAX_AGE in one scandir pass."""
+    cutoff = time.time() - _FAILED_JOB_MAX_AGE
+    try:
+        with os.scandir(jobs_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".failed.json"):
+                    continue
+                try:
+                    if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        logger.info(f"Cleaned old failed job: {entry.name}")
+                except OSError:
+                    pass
+    except OSError:
+        pass
+
+
+def _failed_sweep_loop(jobs_dir: Path, logger, stopping: threading.Event) -> None:
+    # Failed jobs only expire after days; sweeping hourly is plenty
+    while True:
+        _sweep_failed_jobs(jobs_dir, logger)
+        if stopping.wait(_FAILED_SWEEP_INTERVAL):
+            return
+
+
 def _safe_read_json(path: Path) -> Optional[dict]:
     try:
         return read_json(path)
@@ -116,11 +269,28 @@ def _safe_read_json(path: Path) -> Optional[dict]:
         return None
 
 
-def _write_status(update: dict) -> None:
-    ensure_dir(STATE_DIR)
-    data = _safe_read_json(STATUS_PATH) or {}
+# The running daemon's view of STATUS_PATH. It is the only writer while it
+# runs, so updates never re-read the file and deferred ones share a write.
+_status_cache: Optional[dict] = None
+_status_dirty = False
+
+
+def _write_status(update: dict, *, defer: bool = False) -> None:
+    global _status_dirty
+    data = _status_cache if _status_cache is not None else (_safe_read_json(STATUS_PATH) or {})
     data.update(update)
+    if defer and _status_cache is not None:
+        _status_dirty = True
+        return
+    ensure_dir(STATE_DIR)
     atomic_write_json(STATUS_PATH, data)
+    _status_dirty = False
+
+
+def _flush_status() -> None:
+    """Write out updates held back by _write_status(defer=True)."""
+    if _status_dirty and _status_cache is not None:
+        _write_status({})
 
 
 class EncoderAlreadyRunning(RuntimeError):
@@ -128,6 +298,7 @@ class EncoderAlreadyRunning(RuntimeError):
 
 
 def register_encoder_process() -> None:
+    global _status_cache
     ensure_dir(STATE_DIR)
     existing = _safe_read_json(PID_PATH)
     if existing:
@@ -140,6 +311,8 @@ def register_encoder_process() -> None:
             pass
     payload = {"pid": os.getpid(), "started_at": now_utc_iso()}
     atomic_write_json(PID_PATH, payload)
+    # Start from the canonical fields; nothing from a previous run is kept
+    _status_cache = {}
     _write_status({
         "running": True,
         "pid": os.getpid(),
@@ -164,10 +337,18 @@ def encoder_runtime_state() -> dict:
         "current_job": None,
         "last_job": None,
     }
+    # Each pid is probed at most once, however many of the checks below name it
+    alive: dict[int, bool] = {}
+
+    def _alive(pid: int) -> bool:
+        if pid not in alive:
+            alive[pid] = is_process_alive(pid)
+        return alive[pid]
+
     info = _safe_read_json(PID_PATH)
     if info:
         pid = int(info.get("pid", -1)) if info.get("pid") is not None else -1
-        if pid > 0 and is_process_alive(pid):
+        if pid > 0 and _alive(pid):
             state["running"] = True
             state["pid"] = pid
             state["started_at"] = info.get("started_at")
@@ -180,10 +361,10 @@ def encoder_runtime_state() -> dict:
                 state[key] = status.get(key)
         if status.get("pid") and not state.get("pid"):
             pid = int(status.get("pid", -1))
-            if pid > 0 and is_process_alive(pid):
+            if pid > 0 and _alive(pid):
                 state["running"] = True
                 state["pid"] = pid
-    if state.get("pid") and not is_process_alive(int(state["pid"])):
+    if state.get("pid") and not _alive(int(state["pid"])):
         state["running"] = False
     return state
 
@@ -192,23 +373,25 @@ def stop_encoder_daemon(timeout: float = 10.0, force: bool = False) -> dict:
     state = encoder_runtime_state()
     pid = state.get("pid")
     target_pid = int(pid) if pid else None
-    if not pid or not is_process_alive(int(pid)):
+    # encoder_runtime_state only reports a pid as running after probing it
+    if not pid or not state.get("running"):
         clear_encoder_pid()
         _write_status({"running": False, "pid": None})
         state = encoder_runtime_state()
         return {"result": "not_running", "state": state, "pid": target_pid}
     pid = int(pid)
     try:
-        os.kill(pid, signal.SIGTERM)
+        # The pidfd pins the process, so neither signal can reach a recycled pid
+        proc = ProcessHandle(pid)
+        proc.send_signal(signal.SIGTERM)
     except ProcessLookupError:
         clear_encoder_pid()
         _write_status({"running": False, "pid": None})
         state = encoder_runtime_state()
         return {"result": "not_running", "state": state, "pid": target_pid}
 
-    deadline = time.time() + max(0.0, float(timeout))
-    while time.time() < deadline:
-        if not is_process_alive(pid):
+    with proc:
+        if proc.wait(max(0.0, float(timeout))):
             clear_encoder_pid()
             _write_status({"running": False, "pid": None, "stopped_at": now_utc_iso(), "current_job": None})
             state = encoder_runtime_state()
@@ -218,32 +401,30 @@ def stop_encoder_daemon(timeout: float = 10.0, force: bool = False) -> dict:
                 "signal": "SIGTERM",
                 "pid": target_pid,
             }
-        time.sleep(0.2)
 
-    if not force:
-        state = encoder_runtime_state()
-        return {
-            "result": "timeout",
-            "state": state,
-            "signal": "SIGTERM",
-            "pid": target_pid,
-        }
+        if not force:
+            state = encoder_runtime_state()
+            return {
+                "result": "timeout",
+                "state": state,
+                "signal": "SIGTERM",
+                "pid": target_pid,
+            }
 
-    try:
-        os.kill(pid, signal.SIGKILL)
-    except ProcessLookupError:
-        clear_encoder_pid()
-        _write_status({"running": False, "pid": None, "stopped_at": now_utc_iso(), "current_job": None})
-        state = encoder_runtime_state()
-        return {
-            "result": "stopped",
-            "state": state,
-            "signal": "SIGTERM",
-            "pid": target_pid,
-        }
-
-    for _ in range(50):
-        if not is_process_alive(pid):
+        try:
+            proc.send_signal(signal.SIGKILL)
+        except ProcessLookupError:
+            clear_encoder_pid()
+            _write_status({"running": False, "pid": None, "stopped_at": now_utc_iso(), "current_job": None})
+            state = encoder_runtime_state()
+            return {
+                "result": "stopped",
+                "state": state,
+                "signal": "SIGTERM",
+                "pid": target_pid,
+            }
+
+        if proc.wait(10.0):
             clear_encoder_pid()
             _write_status({"running": False, "pid": None, "stopped_at": now_utc_iso(), "current_job": None})
             state = encoder_runtime_state()
@@ -253,7 +434,6 @@ def stop_encoder_daemon(timeout: float = 10.0, force: bool = False) -> dict:
                 "signal": "SIGKILL",
                 "pid": target_pid,
             }
-        time.sleep(0.2)
 
     state = encoder_runtime_state()
     return {
@@ -265,8 +445,10 @@ def stop_encoder_daemon(timeout: float = 10.0, force: bool = False) -> dict:
 
 
 def encode_daemon(opts: EncodeOptions) -> int:
+    global _status_cache
     logger = setup_logging("twitchtool.encoderd", json_logs=opts.json_logs)
-    if not which("ffmpeg"):
+    ffmpeg = which("ffmpeg")
+    if not ffmpeg:
         logger.error("ffmpeg not found in PATH")
         return 2
 
@@ -320,6 +502,10 @@ def encode_daemon(opts: EncodeOptions) -> int:
     if sanitized:
         logger.warning("sanitized encode options", extra={"extra": sanitized})
 
+    # Options are final from here on, so every job shares one command template;
+    # the PATH lookups behind it would otherwise repeat per job as well.
+    cmd_template = _encode_cmd_template(opts, ffmpeg=ffmpeg, prefix=build_nice_ionice_prefix())
+
     qdir = abspath(opts.queue_dir)
     ensure_dir(qdir)
     ensure_dir(qdir / "jobs")
@@ -335,12 +521,12 @@ def encode_daemon(opts: EncodeOptions) -> int:
         logger.error("encoder daemon already running")
         return 3
 
-    stopping = False
+    # An Event so the failed-job sweeper thread sees shutdown too
+    stopping = threading.Event()
 
     def _sig_handler(signum, frame):
-        nonlocal stopping
-        if not stopping:
-            stopping = True
+        if not stopping.is_set():
+            stopping.set()
             logger.info("received signal, stopping daemon", extra={"extra": {"signal": signum}})
 
     signal.signal(signal.SIGINT, _sig_handler)
@@ -350,23 +536,17 @@ def encode_daemon(opts: EncodeOptions) -> int:
 
     logger.info("encode daemon started", extra={"extra": {"queue_dir": str(qdir)}})
 
-    try:
-        while not stopping:
-            # Clean up old failed jobs (older than 7 days)
-            try:
-                jobs_dir = qdir / "jobs"
-                for failed in jobs_dir.glob("*.failed.json"):
-                    try:
-                        if (time.time() - failed.stat().st_mtime) > (7 * 86400):
-                            failed.unlink()
-                            logger.info(f"Cleaned old failed job: {failed.name}")
-                    except Exception:
-                        pass
-            except Exception:
-                pass
+    sweeper = threading.Thread(
+        target=_failed_sweep_loop, args=(qdir / "jobs", logger, stopping), name="failed-sweep", daemon=True
+    )
+    sweeper.start()
 
+    try:
+        while not stopping.is_set():
             job = oldest_job(qdir)
             if not job:
+                # The end of the last job was held back in case another followed
+                _flush_status()
                 time.sleep(2)
                 continue
 
@@ -385,24 +565,9 @@ def encode_daemon(opts: EncodeOptions) -> int:
 
             ensure_dir(out_path.parent)
 
-            cmd = _build_ffmpeg_cmd(job, opts)
-            logger.info(
-                "starting encode",
-                extra={"extra": {"job": job.path.name, "cmd": " ".join(cmd)}},
-            )
-            _write_status(
-                {
-                    "running": True,
-                    "pid": os.getpid(),
-                    "current_job": job.path.name,
-                    "last_job": job.path.name,
-                }
-            )
             # Low-space check before starting
             try:
-                import shutil
-
-                free = shutil.disk_usage(str(out_path.parent)).free
+                free = _free_bytes(str(out_path.parent))
                 if free < int(opts.disk_free_min_bytes):
                     logger.warning(
                         "low free space on output volume; delaying encode",
@@ -413,53 +578,42 @@ def encode_daemon(opts: EncodeOptions) -> int:
                             }
                         },
                     )
+                    _flush_status()
                     time.sleep(5)
                     continue
             except Exception:
                 pass
+            cmd = _build_ffmpeg_cmd(cmd_template, in_path, out_path)
+            logger.info(
+                "starting encode",
+                extra={"extra": {"job": job.path.name, "cmd": shlex.join(cmd)}},
+            )
+            _write_status(
+                {
+                    "running": True,
+                    "pid": os.getpid(),
+                    "current_job": job.path.name,
+                    "last_job": job.path.name,
+                }
+            )
             try:
-                proc = subprocess.Popen(cmd)
+                proc = _spawn_encode(cmd)
             except OSError as e:
                 write_error_for_job(job.path, f"spawn failed: {e}")
                 logger.error("failed to start ffmpeg", extra={"extra": {"error": str(e)}})
                 time.sleep(1)
                 continue
 
-            paused = False
             start_ts = time.time()
-            while True:
-                rc = proc.poll()
-                if rc is not None:
-                    break
-                # Pause/resume logic
-                active = _active_downloads(gsm)
-                if active > 0 and not paused:
-                    try:
-                        os.kill(proc.pid, signal.SIGSTOP)
-                        paused = True
-                        logger.info("paused encode due to active downloads", extra={"extra": {"active": active}})
-                    except ProcessLookupError:
-                        pass
-                elif active == 0 and paused:
-                    try:
-                        os.kill(proc.pid, signal.SIGCONT)
-                        paused = False
-                        logger.info("resumed encode; no active downloads")
-                    except ProcessLookupError:
-                        pass
-                if stopping:
-                    # Unpause before exit
-                    sigcont_if_stopped(proc.pid)
-                    try:
-                        proc.terminate()
-                    except ProcessLookupError:
-                        pass
-                    break
-                time.sleep(2)
+            _supervise_encode(proc, gsm, logger, stopping.is_set)
 
             rc = proc.wait()
             dur = int(time.time() - start_ts)
-            if rc == 0 and out_path.exists() and out_path.stat().st_size > 0:
+            try:
+                out_size = out_path.stat().st_size
+            except OSError:
+                out_size = 0
+            if rc == 0 and out_size > 0:
                 logger.info("encode complete", extra={"extra": {"job": job.path.name, "seconds": dur}})
                 # Post-success cleanup
                 if bool(job.job.delete_input_on_success):
@@ -487,11 +641,14 @@ def encode_daemon(opts: EncodeOptions) -> int:
                     "pid": os.getpid(),
                     "current_job": None,
                     "last_job": job.path.name,
-                }
+                },
+                defer=True,
             )
     finally:
+        stopping.set()
         clear_encoder_pid()
         _write_status({"running": False, "pid": None, "stopped_at": now_utc_iso(), "current_job": None})
+        _status_cache = None
         inst.release()
         logger.info("encode daemon stopped")
     return 0
@@ -1,17 +1,46 @@
 from __future__ import annotations
 
+import fnmatch
+import functools
+import os
+import select
 import shutil
-import glob
+import signal
+import stat
+import subprocess
+import sys
+import threading
 from pathlib import Path
-from typing import List, Sequence
+from typing import Any, List, Sequence
 
+# Probe limits for every TS input, remuxes included. ffmpeg stops probing as
+# soon as each stream has its codec parameters, so the cap only costs time when
+# a stream shows up late; a smaller cap (e.g. 1M) would then silently drop the
+# late stream, such as audio whose PID first appears after an ad break, and
+# "-map 0:a?" would remux the file without sound.
 _MAX_INT = str(2_147_483_647)
 
+# Hardware HEVC encoders by --hwaccel backend name, in auto-detection order.
+HW_ENCODERS = {
+    "nvenc": "hevc_nvenc",
+    "qsv": "hevc_qsv",
+    "vaapi": "hevc_vaapi",
+    "amf": "hevc_amf",
+}
+HWACCEL_CHOICES = ("auto", "none", *HW_ENCODERS)
+VAAPI_DEVICE = "/dev/dri/renderD128"
+# p1 = fastest ... p7 = best quality; ll/ull trade quality for throughput.
+NVENC_PRESETS = ("p1", "p2", "p3", "p4", "p5", "p6", "p7")
+NVENC_TUNES = ("hq", "ll", "ull", "lossless")
+# Concurrent NVENC sessions allowed by current consumer drivers.
+NVENC_SESSION_LIMIT = 8
+
 
 class FfmpegNotFound(RuntimeError):
     """Raised when the requested ffmpeg binary cannot be located."""
 
 
+@functools.lru_cache(maxsize=None)
 def resolve_ffmpeg(binary: str) -> str:
     """Return the absolute path to *binary* or raise if not found."""
     path = shutil.which(binary)
@@ -20,8 +49,358 @@ def resolve_ffmpeg(binary: str) -> str:
     return path
 
 
-def build_scale_filter(max_height: int | None) -> str | None:
-    """Return a scale filter that caps height while preserving aspect ratio."""
+# stderr lines after which ffmpeg will not produce a usable output file.
+FFMPEG_FATAL_MARKERS = (
+    b"Error opening input",
+    b"Error opening output",
+    b"Error initializing output stream",
+    b"Output file is empty, nothing was encoded",
+    b"Conversion failed!",
+)
+
+
+class _StderrScanner:
+    """Pass ffmpeg's stderr through and SIGTERM it on the first fatal marker."""
+
+    def __init__(self, pid: int, markers: Sequence[bytes]) -> None:
+        self.pid = pid
+        self.markers = tuple(markers)
+        self.aborted = threading.Event()
+        self._keep = max((len(m) for m in self.markers), default=1) - 1
+        self._tail = b""
+        self._out = getattr(sys.stderr, "buffer", None)
+
+    def feed(self, chunk: bytes) -> None:
+        if self._out is not None:
+            self._out.write(chunk)
+            self._out.flush()
+        else:
+            sys.stderr.write(chunk.decode(errors="replace"))
+        if self.aborted.is_set() or not self.markers:
+            return
+        window = self._tail + chunk
+        if any(m in window for m in self.markers):
+            self.aborted.set()
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self._tail = window[-self._keep :] if self._keep else b""
+
+
+def _watch_stderr(fd: int, scanner: _StderrScanner) -> None:
+    with os.fdopen(fd, "rb", buffering=0) as stream:
+        while chunk := stream.read(65536):
+            scanner.feed(chunk)
+
+
+def _pump_until_exit(read_fd: int, pidfd: int, scanner: _StderrScanner) -> None:
+    """Relay stderr and wait for exit on the calling thread via poll(2).
+
+    Exit is taken from the pidfd rather than pipe EOF, so a grandchild that
+    inherited stderr cannot hold the wait open; whatever is already buffered
+    in the pipe is drained afterwards.
+    """
+    poller = select.poll()
+    poller.register(read_fd, select.POLLIN)
+    poller.register(pidfd, select.POLLIN)
+    exited = False
+    while not exited:
+        for fd, _ in poller.poll():
+            if fd == pidfd:
+                exited = True
+                continue
+            chunk = os.read(read_fd, 65536)
+            if chunk:
+                scanner.feed(chunk)
+            else:
+                poller.unregister(read_fd)
+    os.set_blocking(read_fd, False)
+    try:
+        while chunk := os.read(read_fd, 65536):
+            scanner.feed(chunk)
+    except BlockingIOError:
+        pass
+
+
+def run_ffmpeg(cmd: Sequence[str], *, abort_markers: Sequence[bytes] = FFMPEG_FATAL_MARKERS) -> int:
+    """Run *cmd* to completion and return its exit code (negative on signal).
+
+    Uses posix_spawn where available, which skips Popen's fork overhead.
+    stderr is watched for *abort_markers*: ffmpeg is stopped on the first
+    one, and a run that still exits 0 after a marker reports 1. On Linux the
+    child is awaited on a pidfd in the calling thread; elsewhere a helper
+    thread relays stderr while waitpid blocks.
+    """
+    argv = list(cmd)
+    if not hasattr(os, "posix_spawnp"):
+        return subprocess.run(argv).returncode
+    read_fd, write_fd = os.pipe()
+    try:
+        pid = os.posix_spawnp(argv[0], argv, os.environ, file_actions=[(os.POSIX_SPAWN_DUP2, write_fd, 2)])
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    scanner = _StderrScanner(pid, abort_markers)
+    try:
+        pidfd: int | None = os.pidfd_open(pid)  # type: ignore[attr-defined]
+    except (AttributeError, OSError):
+        pidfd = None
+    reader = None
+    if pidfd is None:
+        reader = threading.Thread(target=_watch_stderr, args=(read_fd, scanner), name="ffmpeg-stderr", daemon=True)
+        reader.start()
+    try:
+        if pidfd is not None:
+            _pump_until_exit(read_fd, pidfd, scanner)
+        _, status = os.waitpid(pid, 0)
+    except BaseException:
+        # Mirror subprocess.run: never leave the child running behind us
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(pid, 0)
+        raise
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+            os.close(read_fd)
+    if reader is not None:
+        reader.join()
+    rc = os.waitstatus_to_exitcode(status)
+    if scanner.aborted.is_set() and rc == 0:
+        return 1
+    return rc
+
+
+@functools.lru_cache(maxsize=None)
+def _ffmpeg_listing(ffmpeg_bin: str, flag: str) -> str:
+    """Return stdout of `ffmpeg -hide_banner <flag>` (cached; empty on error)."""
+    try:
+        return subprocess.run(
+            [ffmpeg_bin, "-hide_banner", flag],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            timeout=15,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _codec_names(listing: str) -> frozenset[str]:
+    names: set[str] = set()
+    for line in listing.splitlines():
+        parts = line.split()
+        # Codec rows look like " V....D hevc_nvenc  NVIDIA NVENC hevc encoder"
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in "VAS":
+            names.add(parts[1])
+    return frozenset(names)
+
+
+def list_encoders(ffmpeg_bin: str) -> frozenset[str]:
+    """Return the encoder names compiled into *ffmpeg_bin*."""
+    return _codec_names(_ffmpeg_listing(ffmpeg_bin, "-encoders"))
+
+
+def list_decoders(ffmpeg_bin: str) -> frozenset[str]:
+    """Return the decoder names compiled into *ffmpeg_bin*."""
+    return _codec_names(_ffmpeg_listing(ffmpeg_bin, "-decoders"))
+
+
+def list_filters(ffmpeg_bin: str) -> frozenset[str]:
+    """Return the filter names compiled into *ffmpeg_bin*."""
+    names: set[str] = set()
+    for line in _ffmpeg_listing(ffmpeg_bin, "-filters").splitlines():
+        parts = line.split()
+        # Filter rows look like " ... scale_cuda  V->V  GPU accelerated video resizer"
+        if len(parts) >= 3 and "->" in parts[2]:
+            names.add(parts[1])
+    return frozenset(names)
+
+
+def list_hwaccels(ffmpeg_bin: str) -> frozenset[str]:
+    """Return the hardware decode methods reported by `ffmpeg -hwaccels`."""
+    lines = _ffmpeg_listing(ffmpeg_bin, "-hwaccels").splitlines()
+    return frozenset(line.strip() for line in lines[1:] if line.strip())
+
+
+@functools.lru_cache(maxsize=None)
+def _hw_encoder_works(ffmpeg_bin: str, backend: str) -> bool:
+    """Run a tiny test encode; being compiled in does not mean the device exists."""
+    cmd = [ffmpeg_bin, "-hide_banner", "-nostdin", "-loglevel", "error"]
+    if backend == "vaapi":
+        cmd += ["-vaapi_device", VAAPI_DEVICE]
+    cmd += ["-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.1"]
+    if backend == "vaapi":
+        cmd += ["-vf", "format=nv12,hwupload"]
+    cmd += ["-frames:v", "1", "-c:v", HW_ENCODERS[backend], "-f", "null", "-"]
+    try:
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30).returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+
+def detect_hwenc(ffmpeg_bin: str) -> str:
+    """Return the first usable hardware HEVC backend, or "none"."""
+    available = list_encoders(ffmpeg_bin)
+    for backend, encoder in HW_ENCODERS.items():
+        if encoder in available and _hw_encoder_works(ffmpeg_bin, backend):
+            return backend
+    return "none"
+
+
+def resolve_hwaccel(ffmpeg_bin: str, requested: str | None, video_codec: str) -> str:
+    """Map a --hwaccel choice to a concrete backend ("none" keeps the software codec).
+
+    Hardware backends only replace libx265 (they are all HEVC encoders).
+    """
+    choice = (requested or "none").strip().lower()
+    if choice not in HWACCEL_CHOICES:
+        raise ValueError(f"unknown hwaccel '{requested}'")
+    if choice == "none" or video_codec != "libx265":
+        return "none"
+    if choice == "auto":
+        return detect_hwenc(ffmpeg_bin)
+    return choice
+
+
+def nvenc_sessions_in_use() -> int | None:
+    """Return active NVENC sessions on the first GPU via nvidia-smi (None if unknown)."""
+    smi = shutil.which("nvidia-smi")
+    if not smi:
+        return None
+    try:
+        out = subprocess.run(
+            [smi, "--query-gpu=encoder.stats.sessionCount", "--format=csv,noheader,nounits"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            timeout=10,
+        ).stdout
+        return int(out.splitlines()[0].strip())
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+        return None
+
+
+def resolve_gpu_scaler(ffmpeg_bin: str, hwaccel: str) -> str | None:
+    """Return the on-GPU scale filter for a full hardware pipeline, or None.
+
+    When a scaler is returned, decoding also runs on the GPU and frames never
+    leave device memory; otherwise frames are decoded on the CPU and uploaded.
+    """
+    if hwaccel == "nvenc":
+        if "cuda" not in list_hwaccels(ffmpeg_bin):
+            return None
+        filters = list_filters(ffmpeg_bin)
+        for scaler in ("scale_cuda", "scale_npp"):
+            if scaler in filters:
+                return scaler
+        return None
+    if hwaccel == "vaapi":
+        if "vaapi" in list_hwaccels(ffmpeg_bin) and "scale_vaapi" in list_filters(ffmpeg_bin):
+            return "scale_vaapi"
+    return None
+
+
+def default_x265_params(cores: int, *, whole_machine: bool = True) -> str | None:
+    """Thread-pool tuning for libx265 on large-core boxes (None below 17 cores).
+
+    x265's own defaults leave big machines idle; *whole_machine* spans every
+    NUMA node with one pool, otherwise the pool is sized to *cores*.
+    """
+    if cores <= 16:
+        return None
+    pools = "+" if whole_machine else str(cores)
+    return f"pools={pools}:frame-threads={min(6, cores // 8)}"
+
+
+def resolve_ffprobe(ffmpeg_bin: str) -> str | None:
+    """Return the ffprobe next to *ffmpeg_bin*, else the one on PATH (or None)."""
+    sibling = Path(ffmpeg_bin).with_name("ffprobe")
+    if sibling.is_file() and os.access(sibling, os.X_OK):
+        return str(sibling)
+    return shutil.which("ffprobe")
+
+
+@functools.lru_cache(maxsize=256)
+def probe_audio_codecs(ffprobe_bin: str, src: str) -> tuple[str, ...]:
+    """Return the codec name of every audio stream in *src* (empty on error)."""
+    try:
+        out = subprocess.run(
+            [
+                ffprobe_bin,
+                "-v",
+                "error",
+                "-select_streams",
+                "a",
+                "-show_entries",
+                "stream=codec_name",
+                "-of",
+                "default=nk=1:nw=1",
+                src,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            timeout=60,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ()
+    return tuple(line.strip() for line in out.splitlines() if line.strip())
+
+
+@functools.lru_cache(maxsize=256)
+def probe_video_stream(ffprobe_bin: str, src: str) -> tuple[str, int, int] | None:
+    """Return (codec_name, width, height) of the first video stream, or None."""
+    try:
+        out = subprocess.run(
+            [
+                ffprobe_bin,
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "stream=codec_name,width,height",
+                "-of",
+                "csv=p=0",
+                src,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            timeout=60,
+        ).stdout
+        codec, width, height = out.strip().splitlines()[0].split(",")[:3]
+        return codec, int(width), int(height)
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+        return None
+
+
+def resolve_cuvid(ffmpeg_bin: str, codec: str) -> str | None:
+    """Return the CUVID decoder for *codec* if ffmpeg has it (e.g. h264_cuvid)."""
+    decoder = f"{codec}_cuvid"
+    return decoder if decoder in list_decoders(ffmpeg_bin) else None
+
+
+def cuvid_resize(width: int, height: int, max_height: int | None) -> str | None:
+    """Return a CUVID -resize WxH that caps *height* (None when no resize is needed).
+
+    Unlike scale filters, the decoder needs explicit even dimensions.
+    """
+    cap = _capped_height(max_height)
+    if cap is None or height <= cap or width <= 0 or height <= 0:
+        return None
+    out_w = max(2, int(round(width * cap / height / 2)) * 2)
+    return f"{out_w}x{cap}"
+
+
+def _capped_height(max_height: int | None) -> int | None:
+    """Normalize a max height to an even positive value (None disables scaling)."""
     if max_height is None:
         return None
     if max_height < 0:
@@ -32,20 +411,21 @@ def build_scale_filter(max_height: int | None) -> str | None:
         max_height -= 1
     if max_height <= 0:
         return None
+    return max_height
+
+
+def build_scale_filter(max_height: int | None) -> str | None:
+    """Return a scale filter that caps height while preserving aspect ratio."""
+    height = _capped_height(max_height)
+    if height is None:
+        return None
     return (
-        f"scale=-2:{max_height}:"
+        f"scale=-2:{height}:"
         "flags=lanczos:force_original_aspect_ratio=decrease:force_divisible_by=2"
     )
 
 
-def _base_ts_args(
-    src: Path,
-    *,
-    loglevel: str,
-    stats: bool,
-    overwrite: bool,
-    ffmpeg_bin: str,
-) -> List[str]:
+def _global_args(ffmpeg_bin: str, *, loglevel: str, stats: bool, copyts: bool = True) -> List[str]:
     parts: List[str] = [
         ffmpeg_bin,
         "-hide_banner",
@@ -55,30 +435,56 @@ def _base_ts_args(
     ]
     if stats:
         parts.append("-stats")
-    parts.extend(
-        [
-            "-copyts",
-            "-start_at_zero",
-            "-fflags",
-            "+discardcorrupt",
-            "-analyzeduration",
-            _MAX_INT,
-            "-probesize",
-            _MAX_INT,
-            "-i",
-            str(src),
-            "-map",
-            "0:v:0",
-            "-map",
-            "0:a?",
-            "-dn",
-        ]
-    )
+    if copyts:
+        parts.extend(["-copyts", "-start_at_zero"])
+    return parts
+
+
+def _ts_input_args(src: Path, *, pre_input: Sequence[str] = (), genpts: bool = False) -> List[str]:
+    return [
+        "-fflags",
+        "+discardcorrupt+genpts" if genpts else "+discardcorrupt",
+        "-analyzeduration",
+        _MAX_INT,
+        "-probesize",
+        _MAX_INT,
+        *pre_input,
+        "-i",
+        str(src),
+    ]
+
+
+def _base_ts_args(
+    src: Path,
+    *,
+    loglevel: str,
+    stats: bool,
+    overwrite: bool,
+    ffmpeg_bin: str,
+    pre_input: Sequence[str] = (),
+    genpts: bool = False,
+    copyts: bool = True,
+) -> List[str]:
+    parts = _global_args(ffmpeg_bin, loglevel=loglevel, stats=stats, copyts=copyts)
+    parts.extend(_ts_input_args(src, pre_input=pre_input, genpts=genpts))
+    parts.extend(["-map", "0:v:0", "-map", "0:a?", "-dn"])
     if overwrite:
         parts.extend(["-y"])
     return parts
 
 
+_REMUX_OUTPUT_ARGS = (
+    "-c",
+    "copy",
+    "-bsf:a",
+    "aac_adtstoasc",
+    "-movflags",
+    "+faststart",
+    "-video_track_timescale",
+    "90000",
+)
+
+
 def build_remux_cmd(
     ffmpeg_bin: str,
     src: Path,
@@ -88,20 +494,181 @@ def build_remux_cmd(
     stats: bool = False,
     overwrite: bool = True,
 ) -> List[str]:
-    cmd = _base_ts_args(src, loglevel=loglevel, stats=stats, overwrite=overwrite, ffmpeg_bin=ffmpeg_bin)
+    # Reading the TS as non-seekable avoids ffmpeg 6+ rescanning long inputs,
+    # which can make a stream-copy remux many times slower
+    cmd = _base_ts_args(
+        src,
+        loglevel=loglevel,
+        stats=stats,
+        overwrite=overwrite,
+        ffmpeg_bin=ffmpeg_bin,
+        pre_input=("-seekable", "0"),
+        genpts=True,
+    )
+    cmd.extend(_REMUX_OUTPUT_ARGS)
+    cmd.append(str(dst))
+    return cmd
+
+
+def build_concat_remux_cmd(
+    ffmpeg_bin: str,
+    list_path: Path,
+    dst: Path,
+    *,
+    loglevel: str,
+    overwrite: bool = True,
+) -> List[str]:
+    """Remux the files named in a concat demuxer list straight into one MP4."""
+    cmd = _base_ts_args(
+        list_path,
+        loglevel=loglevel,
+        stats=False,
+        overwrite=overwrite,
+        ffmpeg_bin=ffmpeg_bin,
+        pre_input=("-f", "concat", "-safe", "0"),
+        genpts=True,
+    )
+    cmd.extend(_REMUX_OUTPUT_ARGS)
+    cmd.append(str(dst))
+    return cmd
+
+
+def _hw_pre_input(
+    hwaccel: str,
+    gpu_scaler: str | None,
+    cuvid_decoder: str | None = None,
+    cuvid_resize: str | None = None,
+) -> List[str]:
+    """Input options that put decoding (or just the device) on the GPU."""
+    if hwaccel == "nvenc" and cuvid_decoder:
+        args = ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda", "-c:v", cuvid_decoder]
+        if cuvid_resize:
+            args += ["-resize", cuvid_resize]
+        return args
+    gpu_frames = hwaccel in ("nvenc", "vaapi") and gpu_scaler is not None
+    if gpu_frames and hwaccel == "nvenc":
+        return ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"]
+    if gpu_frames:
+        return ["-hwaccel", "vaapi", "-hwaccel_device", VAAPI_DEVICE, "-hwaccel_output_format", "vaapi"]
+    if hwaccel == "vaapi":
+        return ["-vaapi_device", VAAPI_DEVICE]
+    return []
+
+
+def _encode_output_args(
+    *,
+    video_codec: str,
+    preset: str,
+    crf: int,
+    audio_bitrate: str,
+    audio_rate: int,
+    max_height: int | None,
+    threads: int | None,
+    x265_params: str | None = None,
+    hwaccel: str = "none",
+    gpu_scaler: str | None = None,
+    audio_copy: bool = False,
+    nvenc_preset: str = "p4",
+    nvenc_tune: str = "hq",
+    cuvid_decoder: str | None = None,
+    pad_audio_start: bool = True,
+    segment_seconds: int | None = None,
+    segment_start: int = 0,
+) -> List[str]:
+    """Codec, filter and muxer options for one encoded output (without its path).
+
+    *preset* applies to software and QSV encodes; NVENC uses *nvenc_preset*
+    and *nvenc_tune* instead. With *cuvid_decoder* the decoder already
+    resized the frames, so no scale filter is added. *segment_seconds*
+    switches to the segment muxer (numbered from *segment_start*).
+    """
+    cuvid = hwaccel == "nvenc" and cuvid_decoder is not None
+    gpu_frames = cuvid or (hwaccel in ("nvenc", "vaapi") and gpu_scaler is not None)
+    cmd: List[str] = []
+    if hwaccel == "nvenc":
+        cmd.extend(["-c:v", "hevc_nvenc", "-preset", nvenc_preset, "-tune", nvenc_tune])
+        cmd.extend(["-rc", "vbr", "-cq", str(crf), "-b:v", "0"])
+        if not gpu_frames:
+            cmd.extend(["-pix_fmt", "yuv420p"])
+    elif hwaccel == "amf":
+        cmd.extend(["-c:v", "hevc_amf", "-quality", "balanced", "-rc", "cqp", "-qp_i", str(crf), "-qp_p", str(crf)])
+        cmd.extend(["-pix_fmt", "yuv420p"])
+    elif hwaccel == "qsv":
+        cmd.extend(["-c:v", "hevc_qsv", "-preset", preset, "-global_quality", str(crf)])
+        cmd.extend(["-pix_fmt", "nv12"])
+    elif hwaccel == "vaapi":
+        # Frames are uploaded to the GPU by the filter chain below; no -pix_fmt.
+        cmd.extend(["-c:v", "hevc_vaapi", "-rc_mode", "CQP", "-qp", str(crf)])
+    else:
+        cmd.extend(["-c:v", video_codec, "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p"])
+
+    if gpu_frames:
+        height = _capped_height(max_height)
+        # CUVID already resized while decoding
+        if height is not None and not cuvid:
+            fmt = "nv12" if hwaccel == "vaapi" else "yuv420p"
+            cmd.extend(["-vf", f"{gpu_scaler}=w=-2:h={height}:format={fmt}"])
+    elif hwaccel == "vaapi":
+        vaapi_chain = "format=nv12,hwupload"
+        height = _capped_height(max_height)
+        if height is not None:
+            vaapi_chain += f",scale_vaapi=w=-2:h={height}:force_original_aspect_ratio=decrease:force_divisible_by=2"
+        cmd.extend(["-vf", vaapi_chain])
+    else:
+        scale_filter = build_scale_filter(max_height)
+        if scale_filter:
+            cmd.extend(["-vf", scale_filter])
+    if hwaccel == "none":
+        if video_codec == "libx265" and x265_params:
+            cmd.extend(["-x265-params", x265_params])
+        if threads and threads > 0:
+            cmd.extend(["-threads", str(threads)])
     cmd.extend(
         [
-            "-c",
-            "copy",
-            "-bsf:a",
-            "aac_adtstoasc",
-            "-movflags",
-            "+faststart",
-            "-video_track_timescale",
-            "90000",
-            str(dst),
+            "-enc_time_base:v",
+            "demux",
+            "-fps_mode:v",
+            "vfr",
         ]
     )
+    if audio_copy:
+        cmd.extend(["-c:a", "copy", "-bsf:a", "aac_adtstoasc"])
+    else:
+        cmd.extend(
+            [
+                "-c:a",
+                "aac",
+                "-b:a",
+                audio_bitrate,
+                "-ar",
+                str(audio_rate),
+                "-af",
+                "aresample=async=1000:min_hard_comp=0.100" + (":first_pts=0" if pad_audio_start else ""),
+            ]
+        )
+    cmd.extend(["-max_muxing_queue_size", "4000"])
+    if segment_seconds:
+        cmd.extend(
+            [
+                # Keyframes on the segment grid so cuts land exactly where a resume seeks
+                "-force_key_frames",
+                f"expr:gte(t,n_forced*{segment_seconds})",
+                "-f",
+                "segment",
+                "-segment_time",
+                str(segment_seconds),
+                "-segment_start_number",
+                str(segment_start),
+                "-reset_timestamps",
+                "1",
+                "-segment_format",
+                "mp4",
+                "-segment_format_options",
+                "movflags=+faststart:video_track_timescale=90000",
+            ]
+        )
+    else:
+        cmd.extend(["-movflags", "+faststart", "-video_track_timescale", "90000"])
     return cmd
 
 
@@ -121,83 +688,295 @@ def build_encode_cmd(
     x265_params: str | None = None,
     stats: bool = False,
     overwrite: bool = True,
+    hwaccel: str = "none",
+    gpu_scaler: str | None = None,
+    audio_copy: bool = False,
+    nvenc_preset: str = "p4",
+    nvenc_tune: str = "hq",
+    truncate_output: bool = True,
+    cuvid_decoder: str | None = None,
+    cuvid_resize: str | None = None,
+    seek: float = 0.0,
+    segment_seconds: int | None = None,
+    segment_start: int = 0,
 ) -> List[str]:
-    cmd = _base_ts_args(src, loglevel=loglevel, stats=stats, overwrite=overwrite, ffmpeg_bin=ffmpeg_bin)
-    cmd.extend(
-        [
-            "-c:v",
-            video_codec,
-            "-preset",
-            preset,
-            "-crf",
-            str(crf),
-            "-pix_fmt",
-            "yuv420p",
-        ]
+    """Build the encode argv.
+
+    *hwaccel* must already be resolved (see resolve_hwaccel). *gpu_scaler*
+    (see resolve_gpu_scaler) keeps decode + scale on the GPU as well.
+    *audio_copy* passes AAC audio through instead of re-encoding it.
+    *truncate_output=False* keeps blocks preallocated on *dst* (the caller
+    must have emptied it). *cuvid_decoder*/*cuvid_resize* (NVENC only)
+    decode and resize on the GPU in one stage (see resolve_cuvid).
+    *seek* starts decoding that many seconds in; with *segment_seconds*,
+    *dst* is a segment filename pattern such as seg_%05d.mp4.
+    """
+    cmd = _base_ts_args(
+        src,
+        loglevel=loglevel,
+        stats=stats,
+        overwrite=overwrite,
+        ffmpeg_bin=ffmpeg_bin,
+        pre_input=[
+            *_hw_pre_input(hwaccel, gpu_scaler, cuvid_decoder, cuvid_resize),
+            *(["-ss", f"{seek:g}"] if seek > 0 else []),
+        ],
+        # Segment runs count time from the seek point, so the keyframe and
+        # segment grids (both from t=0) line up with seg_N = seek + N*interval
+        copyts=not segment_seconds,
     )
-    scale_filter = build_scale_filter(max_height)
-    if scale_filter:
-        cmd.extend(["-vf", scale_filter])
-    if video_codec == "libx265" and x265_params:
-        cmd.extend(["-x265-params", x265_params])
-    if threads and threads > 0:
-        cmd.extend(["-threads", str(threads)])
     cmd.extend(
-        [
-            "-enc_time_base:v",
-            "demux",
-            "-fps_mode:v",
-            "vfr",
-            "-c:a",
-            "aac",
-            "-b:a",
-            audio_bitrate,
-            "-ar",
-            str(audio_rate),
-            "-af",
-            "aresample=async=1000:min_hard_comp=0.100:first_pts=0",
-            "-max_muxing_queue_size",
-            "4000",
-            "-movflags",
-            "+faststart",
-            "-video_track_timescale",
-            "90000",
-            str(dst),
-        ]
+        _encode_output_args(
+            video_codec=video_codec,
+            preset=preset,
+            crf=crf,
+            audio_bitrate=audio_bitrate,
+            audio_rate=audio_rate,
+            max_height=max_height,
+            threads=threads,
+            x265_params=x265_params,
+            hwaccel=hwaccel,
+            gpu_scaler=gpu_scaler,
+            audio_copy=audio_copy,
+            nvenc_preset=nvenc_preset,
+            nvenc_tune=nvenc_tune,
+            cuvid_decoder=cuvid_decoder,
+            # Padding back to t=0 after a seek would prepend silence
+            pad_audio_start=seek <= 0,
+            segment_seconds=segment_seconds,
+            segment_start=segment_start,
+        )
     )
+    if not truncate_output:
+        cmd.extend(["-truncate", "0"])
+    cmd.append(str(dst))
     return cmd
 
 
+def build_concat_cmd(
+    ffmpeg_bin: str,
+    list_file: Path,
+    dst: Path,
+    *,
+    loglevel: str,
+    overwrite: bool = True,
+) -> List[str]:
+    """Join the files named in a concat demuxer *list_file* into *dst* without re-encoding."""
+    cmd = [ffmpeg_bin, "-hide_banner", "-nostdin", "-loglevel", loglevel]
+    cmd.extend(["-f", "concat", "-safe", "0", "-i", str(list_file), "-map", "0", "-c", "copy"])
+    cmd.extend(["-movflags", "+faststart", "-video_track_timescale", "90000"])
+    if overwrite:
+        cmd.append("-y")
+    cmd.append(str(dst))
+    return cmd
+
+
+def build_batch_encode_cmd(
+    ffmpeg_bin: str,
+    pairs: Sequence[tuple[Path, Path]],
+    *,
+    loglevel: str,
+    stats: bool = False,
+    overwrite: bool = True,
+    audio_copy: Sequence[bool] = (),
+    **encode_opts: Any,
+) -> List[str]:
+    """Build one argv that encodes every (src, dst) pair in a single ffmpeg run.
+
+    Each input gets its own output mapped from it, so startup and encoder
+    init are paid once for the whole batch. *audio_copy* is per pair;
+    the remaining options match build_encode_cmd.
+    """
+    hwaccel = encode_opts.get("hwaccel", "none")
+    pre_input = _hw_pre_input(hwaccel, encode_opts.get("gpu_scaler"))
+    cmd = _global_args(ffmpeg_bin, loglevel=loglevel, stats=stats)
+    if overwrite:
+        cmd.append("-y")
+    for src, _ in pairs:
+        cmd.extend(_ts_input_args(src, pre_input=pre_input))
+    for idx, (_, dst) in enumerate(pairs):
+        copy = audio_copy[idx] if idx < len(audio_copy) else False
+        cmd.extend(["-map", f"{idx}:v:0", "-map", f"{idx}:a?", "-dn"])
+        cmd.extend(_encode_output_args(audio_copy=copy, **encode_opts))
+        cmd.append(str(dst))
+    return cmd
+
+
+def build_remux_encode_cmd(
+    ffmpeg_bin: str,
+    src: Path,
+    remux_dst: Path,
+    dst: Path,
+    *,
+    loglevel: str,
+    stats: bool = False,
+    overwrite: bool = True,
+    audio_copy: bool = False,
+    cuvid_decoder: str | None = None,
+    cuvid_resize: str | None = None,
+    **encode_opts: Any,
+) -> List[str]:
+    """Build one argv that writes the stream-copy remux and the encode of *src*.
+
+    The input is demuxed once and feeds both outputs; the remaining options
+    match build_encode_cmd.
+    """
+    hwaccel = encode_opts.get("hwaccel", "none")
+    pre_input = _hw_pre_input(hwaccel, encode_opts.get("gpu_scaler"), cuvid_decoder, cuvid_resize)
+    cmd = _global_args(ffmpeg_bin, loglevel=loglevel, stats=stats)
+    if overwrite:
+        cmd.append("-y")
+    cmd.extend(_ts_input_args(src, pre_input=pre_input))
+    cmd.extend(["-map", "0:v:0", "-map", "0:a?", "-dn", *_REMUX_OUTPUT_ARGS, str(remux_dst)])
+    cmd.extend(["-map", "0:v:0", "-map", "0:a?", "-dn"])
+    cmd.extend(_encode_output_args(audio_copy=audio_copy, cuvid_decoder=cuvid_decoder, **encode_opts))
+    cmd.append(str(dst))
+    return cmd
+
+
+def _hidden_ok(name: str, pattern: str) -> bool:
+    """Like glob.glob, wildcards only match a leading dot the pattern spells out."""
+    return not name.startswith(".") or pattern.startswith(".")
+
+
+def _glob(pattern: Path) -> list[Path]:
+    """Expand *pattern* with pathlib (os.scandir based) rather than glob.glob."""
+    if pattern.is_absolute():
+        matches = list(Path(pattern.anchor).glob(str(pattern.relative_to(pattern.anchor))))
+    else:
+        matches = list(Path().glob(str(pattern)))
+    parts = pattern.parts
+    dotted = [part for part in parts if part.startswith(".")]
+    kept: list[Path] = []
+    for match in matches:
+        if len(match.parts) == len(parts):
+            ok = all(_hidden_ok(name, part) for name, part in zip(match.parts, parts))
+        else:
+            # "**" recursed, so components no longer line up with the pattern
+            ok = all(
+                any(fnmatch.fnmatchcase(name, part) for part in dotted)
+                for name in match.parts
+                if name.startswith(".")
+            )
+        if ok:
+            kept.append(match)
+    return kept
+
+
+def _file_key(st: os.stat_result) -> tuple[int, int]:
+    return (st.st_dev, st.st_ino)
+
+
+def _scan_glob(pattern: Path, keys: dict[str, object]) -> list[Path] | None:
+    """Match a wildcard in the last path component with one os.scandir pass.
+
+    Dedupe keys for the matches are recorded in *keys* (absolute path ->
+    (st_dev, st_ino)) straight from the directory entries, so plain files need
+    no extra stat. Returns None when the directory part itself has wildcards.
+    """
+    parent = pattern.parent
+    if any(ch in str(parent) for ch in "*?["):
+        return None
+    try:
+        dev = os.stat(parent).st_dev
+        with os.scandir(parent) as it:
+            entries = [
+                e for e in it if _hidden_ok(e.name, pattern.name) and fnmatch.fnmatchcase(e.name, pattern.name)
+            ]
+    except OSError:
+        return []
+    matches: list[Path] = []
+    for entry in entries:
+        match = parent / entry.name
+        absolute = os.path.abspath(match)
+        try:
+            # d_type tells us about symlinks for free; only those need a stat
+            keys[absolute] = _file_key(os.stat(absolute)) if entry.is_symlink() else (dev, entry.inode())
+        except OSError:
+            keys[absolute] = absolute
+        matches.append(match)
+    return matches
+
+
+def _scan_tree(root: Path, dev: int, keys: dict[str, object]) -> list[Path]:
+    """Find *.ts under *root* like Path.rglob, recording dedupe keys in *keys*.
+
+    Walks with an explicit stack of (directory, st_dev) rather than recursion.
+    Keys come from directory entries as in _scan_glob; each subdirectory costs
+    one lstat (its st_dev may differ at a mount point), files cost nothing
+    unless they are symlinks. Symlinked directories are not followed.
+    """
+    found: list[Path] = []
+    stack = [(os.fspath(root), dev)]
+    while stack:
+        top, top_dev = stack.pop()
+        try:
+            with os.scandir(top) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            if fnmatch.fnmatchcase(entry.name, "*.ts"):
+                absolute = os.path.abspath(entry.path)
+                try:
+                    keys[absolute] = _file_key(os.stat(absolute)) if entry.is_symlink() else (top_dev, entry.inode())
+                except OSError:
+                    keys[absolute] = absolute
+                found.append(Path(entry.path))
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, entry.stat(follow_symlinks=False).st_dev))
+            except OSError:
+                continue
+    return found
+
+
 def normalize_inputs(raw_inputs: Sequence[str]) -> tuple[list[Path], list[str]]:
     """Resolve .ts inputs from paths, globs, or directories and dedupe results.
 
-    Returns a tuple of (paths, unmatched_patterns).
+    Returns a tuple of (absolute_paths, unmatched_patterns).
     """
     results: list[Path] = []
     unmatched: list[str] = []
+    # absolute path -> dedupe key, filled from stats we already had to make
+    keys: dict[str, object] = {}
     for item in raw_inputs:
         path = Path(item).expanduser()
-        if path.is_dir():
-            results.extend(sorted(path.rglob("*.ts")))
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is not None and stat.S_ISDIR(st.st_mode):
+            results.extend(sorted(_scan_tree(path, st.st_dev, keys)))
             continue
-        if path.exists():
+        if st is not None:
+            keys[os.path.abspath(path)] = _file_key(st)
             results.append(path)
             continue
-        matches = [Path(x) for x in glob.glob(str(path))]
+        matches: list[Path] | None = []
+        if any(ch in item for ch in "*?["):
+            matches = _scan_glob(path, keys)
+            if matches is None:
+                matches = _glob(path)
         if matches:
             results.extend(sorted(matches))
         else:
             unmatched.append(item)
             results.append(path)
     unique: list[Path] = []
-    seen: set[Path] = set()
+    seen: set[object] = set()
     for candidate in results:
-        try:
-            resolved = candidate.resolve()
-        except FileNotFoundError:
-            resolved = candidate
-        if resolved in seen:
+        # One stat per file instead of resolve()'s realpath walk; (dev, ino)
+        # also folds hardlinks and symlink aliases. Missing paths key by name.
+        absolute = os.path.abspath(candidate)
+        key = keys.get(absolute)
+        if key is None:
+            try:
+                key = _file_key(os.stat(absolute))
+            except OSError:
+                key = absolute
+        if key in seen:
             continue
-        seen.add(resolved)
-        unique.append(candidate)
+        seen.add(key)
+        unique.append(Path(absolute))
     return unique, unmatched
@@ -202,6 +202,22 @@ class GlobalSlotManager:
     def active_count(self) -> int:
         return len(self.list_active_owners())
 
+    def state_version(self) -> Optional[int]:
+        """Return a token that changes whenever an owner file is added or removed.
+
+        This is the slots directory mtime. None means the caller must not trust
+        it: the directory is unreadable, or it changed so recently that a
+        second change within the same timestamp tick could go unnoticed.
+        Owners that die without releasing do not change it.
+        """
+        try:
+            mtime_ns = self.dir.stat().st_mtime_ns
+        except OSError:
+            return None
+        if time.time_ns() - mtime_ns < 2_000_000_000:
+            return None
+        return mtime_ns
+
     def cleanup_stale_owners(self) -> int:
         """Remove owner files whose PIDs are not alive OR whose slots are not locked.
         Returns number removed.
@@ -5,16 +5,14 @@ import os
 import shlex
 import signal
 import sys
-import time
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Iterable, Optional
 
-import shutil
-
 from .locks import GlobalSlotManager, PerUserLock
 from .utils import (
+    ProcessHandle,
     abspath,
     ensure_dir,
     is_process_alive,
@@ -59,14 +57,20 @@ def _safe_read_json(path: Path) -> Optional[dict]:
         return None
 
 
+# The running poller's view of STATUS_PATH. It is the only writer while it
+# runs, so its updates never re-read the file.
+_status_cache: Optional[dict] = None
+
+
 def _write_status(update: dict) -> None:
     ensure_dir(STATE_DIR)
-    data = _safe_read_json(STATUS_PATH) or {}
+    data = _status_cache if _status_cache is not None else (_safe_read_json(STATUS_PATH) or {})
     data.update(update)
     atomic_write_json(STATUS_PATH, data)
 
 
 def _register_poller_process(interval: int, logger) -> str:
+    global _status_cache
     ensure_dir(STATE_DIR)
     existing = _safe_read_json(PID_PATH)
     if existing:
@@ -87,6 +91,8 @@ def _register_poller_process(interval: int, logger) -> str:
     started_at = now_utc_iso()
     payload = {"pid": os.getpid(), "started_at": started_at, "interval": int(interval)}
     atomic_write_json(PID_PATH, payload)
+    # Start from the canonical fields; nothing from a previous run is kept
+    _status_cache = {}
     _write_status({
         "running": True,
         "pid": os.getpid(),
@@ -127,10 +133,18 @@ def poller_runtime_state() -> dict:
         "next_poll_ts": None,
         "interval": None,
     }
+    # Each pid is probed at most once, however many of the checks below name it
+    alive: dict[int, bool] = {}
+
+    def _alive(pid: int) -> bool:
+        if pid not in alive:
+            alive[pid] = is_process_alive(pid)
+        return alive[pid]
+
     info = _safe_read_json(PID_PATH)
     if info:
         pid = int(info.get("pid", -1)) if info.get("pid") is not None else -1
-        if pid > 0 and is_process_alive(pid):
+        if pid > 0 and _alive(pid):
             state["running"] = True
             state["pid"] = pid
             state["started_at"] = info.get("started_at")
@@ -146,7 +160,7 @@ def poller_runtime_state() -> dict:
             state["running"] = False if not state["pid"] else state["running"]
         if status.get("pid") and not state["pid"]:
             pid = int(status.get("pid", -1))
-            if pid > 0 and is_process_alive(pid):
+            if pid > 0 and _alive(pid):
                 state["running"] = True
                 state["pid"] = pid
     if not state["next_poll_ts"] and state["last_poll_ts"] and state["interval"]:
@@ -156,7 +170,7 @@ def poller_runtime_state() -> dict:
             state["next_poll_ts"] = next_dt.isoformat()
         except Exception:
             pass
-    if state["pid"] and not is_process_alive(int(state["pid"])):
+    if state["pid"] and not _alive(int(state["pid"])):
         state["running"] = False
     return state
 
@@ -165,23 +179,25 @@ def stop_poller_daemon(timeout: float = 10.0, force: bool = False) -> dict:
     state = poller_runtime_state()
     pid = state.get("pid")
     target_pid = int(pid) if pid else None
-    if not pid or not is_process_alive(int(pid)):
+    # poller_runtime_state only reports a pid as running after probing it
+    if not pid or not state.get("running"):
         _clear_pid_file()
         _write_status({"running": False, "pid": None})
         state = poller_runtime_state()
         return {"result": "not_running", "state": state, "pid": target_pid}
     pid = int(pid)
     try:
-        os.kill(pid, signal.SIGTERM)
+        # The pidfd pins the process, so neither signal can reach a recycled pid
+        proc = ProcessHandle(pid)
+        proc.send_signal(signal.SIGTERM)
     except ProcessLookupError:
         _clear_pid_file()
         _write_status({"running": False, "pid": None})
         state = poller_runtime_state()
         return {"result": "not_running", "state": state, "pid": target_pid}
 
-    deadline = time.time() + max(0.0, float(timeout))
-    while time.time() < deadline:
-        if not is_process_alive(pid):
+    with proc:
+        if proc.wait(max(0.0, float(timeout))):
             _clear_pid_file()
             _write_status({"running": False, "pid": None, "stopped_at": now_utc_iso(), "next_poll_ts": None})
             state = poller_runtime_state()
@@ -191,32 +207,30 @@ def stop_poller_daemon(timeout: float = 10.0, force: bool = False) -> dict:
                 "signal": "SIGTERM",
                 "pid": target_pid,
             }
-        time.sleep(0.2)
 
-    if not force:
-        state = poller_runtime_state()
-        return {
-            "result": "timeout",
-            "state": state,
-            "signal": "SIGTERM",
-            "pid": target_pid,
-        }
+        if not force:
+            state = poller_runtime_state()
+            return {
+                "result": "timeout",
+                "state": state,
+                "signal": "SIGTERM",
+                "pid": target_pid,
+            }
 
-    try:
-        os.kill(pid, signal.SIGKILL)
-    except ProcessLookupError:
-        _clear_pid_file()
-        _write_status({"running": False, "pid": None, "stopped_at": now_utc_iso(), "next_poll_ts": None})
-        state = poller_runtime_state()
-        return {
-            "result": "stopped",
-            "state": state,
-            "signal": "SIGTERM",
-            "pid": target_pid,
-        }
+        try:
+            proc.send_signal(signal.SIGKILL)
+        except ProcessLookupError:
+            _clear_pid_file()
+            _write_status({"running": False, "pid": None, "stopped_at": now_utc_iso(), "next_poll_ts": None})
+            state = poller_runtime_state()
+            return {
+                "result": "stopped",
+                "state": state,
+                "signal": "SIGTERM",
+                "pid": target_pid,
+            }
 
-    for _ in range(50):
-        if not is_process_alive(pid):
+        if proc.wait(10.0):
             _clear_pid_file()
             _write_status({"running": False, "pid": None, "stopped_at": now_utc_iso(), "next_poll_ts": None})
             state = poller_runtime_state()
@@ -226,7 +240,6 @@ def stop_poller_daemon(timeout: float = 10.0, force: bool = False) -> dict:
                 "signal": "SIGKILL",
                 "pid": target_pid,
             }
-        time.sleep(0.2)
 
     state = poller_runtime_state()
     return {
@@ -237,32 +250,36 @@ def stop_poller_daemon(timeout: float = 10.0, force: bool = False) -> dict:
     }
 
 
+async def _run_probe(cmd: list[str], timeout: float) -> Optional[int]:
+    """Run cmd with output discarded; return its exit code, or None on timeout."""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        # Ensure the process is reaped to avoid resource leaks
+        try:
+            await proc.wait()
+        except Exception:
+            pass
+        return None
+    return proc.returncode
+
+
 async def _probe_user_live(user: str, quality: str, timeout: int) -> bool:
     """Return True if streamlink reports user is live (via --stream-url)."""
     if not which("streamlink"):
         return False
     url = f"https://twitch.tv/{user}"
-    cmd = ["streamlink", "--stream-url", url, quality]
     try:
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.DEVNULL,
-            stderr=asyncio.subprocess.DEVNULL,
-        )
-        try:
-            await asyncio.wait_for(proc.wait(), timeout=timeout)
-        except asyncio.TimeoutError:
-            try:
-                proc.kill()
-            except ProcessLookupError:
-                pass
-            # Ensure the process is reaped to avoid resource leaks
-            try:
-                await proc.wait()
-            except Exception:
-                pass
-            return False
-        return proc.returncode == 0
+        return await _run_probe(["streamlink", "--stream-url", url, quality], timeout) == 0
     except Exception:
         return False
 
@@ -336,7 +353,7 @@ def _resolve_download_cmd(download_cmd: str) -> tuple[list[str] | None, str]:
     if not parts:
         return None, "empty download_cmd"
     exe = parts[0]
-    resolved = shutil.which(exe)
+    resolved = which(exe)
     if resolved is None:
         p = Path(exe)
         if p.is_absolute() and p.exists():
@@ -352,6 +369,7 @@ def _resolve_download_cmd(download_cmd: str) -> tuple[list[str] | None, str]:
 
 
 async def poller(opts: PollerOptions) -> int:
+    global _status_cache
     logger = setup_logging("twitchtool.poller", json_logs=opts.json_logs)
     users_path = abspath(opts.users_file)
     logs_dir = abspath(opts.logs_dir)
@@ -479,5 +497,6 @@ async def poller(opts: PollerOptions) -> int:
             "stopped_at": now_utc_iso(),
             "next_poll_ts": None,
         })
+        _status_cache = None
         logger.info("poller stopped")
     return 0
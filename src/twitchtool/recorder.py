@@ -1,18 +1,21 @@
 from __future__ import annotations
 
+import contextlib
+import errno
 import os
+import select
 import shlex
+import shutil
 import signal
 import subprocess
 import sys
 import tempfile
 import time
 from dataclasses import dataclass
-from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
-from .ffmpeg_cmds import build_remux_cmd
+from .ffmpeg_cmds import build_concat_remux_cmd, build_remux_cmd, run_ffmpeg
 from .locks import GlobalSlotManager, PerUserLock, SlotUnavailable, UserAlreadyRecording
 from .config import DEFAULTS
 from .queue import Job, write_job
@@ -49,38 +52,177 @@ class RecordOptions:
 class GracefulTerm:
     def __init__(self):
         self.stop = False
+        # Self-pipe written by the handler so waits can block without a timeout
+        self._r: Optional[int] = None
+        self._w: Optional[int] = None
+        self._prev: Optional[tuple] = None
 
     def install(self, logger):
+        self._r, self._w = os.pipe()
+        os.set_blocking(self._r, False)
+        os.set_blocking(self._w, False)
+
         def _handler(signum, frame):
             if not self.stop:
                 logger.info("received signal, finishing current part then finalizing", extra={"extra": {"signal": signum}})
                 self.stop = True
+            if self._w is None:
+                return
+            try:
+                os.write(self._w, b"x")
+            except (BlockingIOError, OSError):
+                pass
 
+        self._prev = (signal.getsignal(signal.SIGINT), signal.getsignal(signal.SIGTERM))
         signal.signal(signal.SIGINT, _handler)
         signal.signal(signal.SIGTERM, _handler)
 
+    def fileno(self) -> Optional[int]:
+        """Read end of the wakeup pipe, or None before install()."""
+        return self._r
 
-def _fmt_basename(username: str, start: datetime) -> str:
-    return f"{username}_{start.strftime('%Y-%m-%d_%H-%M')}"
-
+    def drain(self) -> None:
+        if self._r is None:
+            return
+        try:
+            while os.read(self._r, 512):
+                pass
+        except BlockingIOError:
+            pass
 
-def _streamlink_cmd(username: str, quality: str, outfile: Path, loglevel: str) -> list[str]:
+    def sleep(self, seconds: float) -> None:
+        """Sleep up to *seconds*, returning early once a stop signal arrives."""
+        if self._r is None:
+            time.sleep(seconds)
+            return
+        if not self.stop:
+            select.select([self._r], [], [], seconds)
+        self.drain()
+
+    def close(self) -> None:
+        """Restore the previous SIGINT/SIGTERM handlers and close the wakeup pipe."""
+        if self._prev is not None:
+            signal.signal(signal.SIGINT, self._prev[0])
+            signal.signal(signal.SIGTERM, self._prev[1])
+            self._prev = None
+        for fd in (self._r, self._w):
+            if fd is not None:
+                os.close(fd)
+        self._r = self._w = None
+
+
+def _fmt_basename(username: str, start: float) -> str:
+    """Base name for a recording that started at epoch *start* (local time)."""
+    return f"{username}_{time.strftime('%Y-%m-%d_%H-%M', time.localtime(start))}"
+
+
+def _streamlink_cmd(
+    username: str, quality: str, outfile: Path, loglevel: str, streamlink: str = "streamlink"
+) -> list[str]:
     url = f"https://twitch.tv/{username}"
     # Streamlink must exist
-    sl = which("streamlink") or "streamlink"
-    return [sl, url, quality, "-o", str(outfile), "--loglevel", loglevel]
+    return [streamlink, url, quality, "-o", str(outfile), "--loglevel", loglevel]
+
+
+def _start_part(cmd: list[str]) -> subprocess.Popen:
+    """Start a capture process as the leader of its own session."""
+    return subprocess.Popen(cmd, start_new_session=True)
+
+
+# Seconds after a stop request at which each signal goes to the capture group
+_STOP_STEPS = ((0.0, signal.SIGINT), (5.0, signal.SIGTERM), (10.0, signal.SIGKILL))
+
+
+def _escalate(proc: subprocess.Popen, started_at: float, sent: int) -> tuple[int, Optional[float]]:
+    """Send the stop signals that are due and not yet sent.
+
+    Returns the number sent so far and the seconds until the next one is
+    due (None once SIGKILL went out). Stops early if *proc* has exited.
+    """
+    waited = time.monotonic() - started_at
+    while sent < len(_STOP_STEPS) and waited >= _STOP_STEPS[sent][0]:
+        if proc.poll() is not None:
+            break
+        try:
+            # The part runs in its own session, so this reaches its children too
+            os.killpg(proc.pid, _STOP_STEPS[sent][1])
+        except ProcessLookupError:
+            pass
+        sent += 1
+    if sent < len(_STOP_STEPS):
+        return sent, _STOP_STEPS[sent][0] - waited
+    return sent, None
+
+
+def _wait_part(proc: subprocess.Popen, gt: GracefulTerm) -> int:
+    """Wait for a capture process started by _start_part, escalating
+    SIGINT/SIGTERM/SIGKILL to its process group after a stop.
+
+    Blocks in poll() on a pidfd for the child plus the stop wakeup pipe, so
+    both are seen at once; after a stop it wakes only when the next signal
+    is due. Without pidfds the child is checked once a second.
+    """
+    try:
+        pidfd: Optional[int] = os.pidfd_open(proc.pid)  # type: ignore[attr-defined]
+    except (AttributeError, OSError):
+        pidfd = None
+    poller = select.poll()
+    if pidfd is not None:
+        poller.register(pidfd, select.POLLIN)
+    wake_fd = gt.fileno()
+    if wake_fd is not None:
+        poller.register(wake_fd, select.POLLIN)
+    stop_mark: Optional[float] = None
+    sent = 0
+    try:
+        while True:
+            ret = proc.poll()
+            if ret is not None:
+                return ret
+            timeout_ms: Optional[int] = None if pidfd is not None else 1000
+            if gt.stop:
+                if stop_mark is None:
+                    stop_mark = time.monotonic()
+                sent, next_in = _escalate(proc, stop_mark, sent)
+                if next_in is not None:
+                    next_ms = max(1, int(next_in * 1000) + 1)
+                    timeout_ms = next_ms if timeout_ms is None else min(timeout_ms, next_ms)
+            poller.poll(timeout_ms)
+            gt.drain()
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
 
 
-def _ffmpeg_concat(parts: list[Path], out_ts: Path, loglevel: str) -> int:
+def _write_concat_list(parts: list[Path], directory: Path) -> str:
+    """Write an ffmpeg concat demuxer list for *parts*; returns its path."""
+    # Escape single quotes for ffmpeg concat demuxer quoting rules
+    blob = "".join("file '%s'\n" % p.as_posix().replace("'", "'\\''") for p in parts).encode("utf-8")
+    fd, list_path = tempfile.mkstemp(dir=str(directory))
+    try:
+        view = memoryview(blob)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    return list_path
+
+
+def _run_with_list(cmd: list[str], list_path: str) -> int:
+    ret = 1
+    try:
+        ret = run_ffmpeg(cmd)
+    finally:
+        try:
+            os.unlink(list_path)
+        except FileNotFoundError:
+            pass
+    return ret
+
+
+def _ffmpeg_concat(parts: list[Path], out_ts: Path, loglevel: str, ffmpeg: str = "ffmpeg") -> int:
     """Concatenate TS parts using ffmpeg concat demuxer (stream copy)."""
-    ffmpeg = which("ffmpeg") or "ffmpeg"
-    with tempfile.NamedTemporaryFile("w", delete=False, dir=str(out_ts.parent)) as tf:
-        for p in parts:
-            # Escape single quotes for ffmpeg concat demuxer quoting rules
-            sp = p.as_posix().replace("'", "'\\''")
-            tf.write(f"file '{sp}'\n")
-        tf.flush()
-        list_path = tf.name
+    list_path = _write_concat_list(parts, out_ts.parent)
     cmd = [
         ffmpeg,
         "-hide_banner",
@@ -98,23 +240,33 @@ def _ffmpeg_concat(parts: list[Path], out_ts: Path, loglevel: str) -> int:
         "-y",
         str(out_ts),
     ]
-    ret = 1
-    try:
-        proc = subprocess.Popen(cmd)
-        ret = proc.wait()
-    finally:
-        try:
-            os.unlink(list_path)
-        except FileNotFoundError:
-            pass
-    return ret
+    return _run_with_list(cmd, list_path)
+
 
+def _ffmpeg_concat_remux(parts: list[Path], out_mp4: Path, loglevel: str, ffmpeg: str = "ffmpeg") -> int:
+    """Remux TS parts straight into one MP4, without a merged TS in between."""
+    list_path = _write_concat_list(parts, out_mp4.parent)
+    cmd = build_concat_remux_cmd(ffmpeg, Path(list_path), out_mp4, loglevel=loglevel)
+    return _run_with_list(cmd, list_path)
 
-def _ffmpeg_remux_to_mp4(in_ts: Path, out_mp4: Path, loglevel: str) -> int:
-    ffmpeg = which("ffmpeg") or "ffmpeg"
+
+def _ffmpeg_remux_to_mp4(in_ts: Path, out_mp4: Path, loglevel: str, ffmpeg: str = "ffmpeg") -> int:
     cmd = build_remux_cmd(ffmpeg, in_ts, out_mp4, loglevel=loglevel, stats=False, overwrite=True)
-    proc = subprocess.Popen(cmd)
-    return proc.wait()
+    return run_ffmpeg(cmd)
+
+
+def _move_final(src: Path, dst: Path, logger) -> None:
+    """Rename *src* to *dst*, copying only if they are on different filesystems."""
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        logger.warning(
+            "temp dir is on another filesystem; copying instead of renaming",
+            extra={"extra": {"src": str(src), "dst": str(dst)}},
+        )
+        shutil.move(src, dst)
 
 
 def record(opts: RecordOptions) -> int:
@@ -128,11 +280,13 @@ def record(opts: RecordOptions) -> int:
     if not is_valid_twitch_username(opts.username):
         logger.error("invalid twitch username", extra={"extra": {"user": opts.username}})
         return 2
-    # Validate tools
-    if not which("streamlink"):
+    # Validate tools; the resolved paths are reused for every part and merge
+    streamlink_bin = which("streamlink")
+    if not streamlink_bin:
         logger.error("streamlink not found in PATH")
         return 2
-    if not which("ffmpeg"):
+    ffmpeg_bin = which("ffmpeg")
+    if not ffmpeg_bin:
         logger.error("ffmpeg not found in PATH")
         return 2
 
@@ -152,8 +306,6 @@ def record(opts: RecordOptions) -> int:
     temp_dir = ensure_dir(temp_base / "temp")
     # Low-space warning
     try:
-        import shutil
-
         free = shutil.disk_usage(str(out_dir)).free
         if free < int(opts.disk_free_min_bytes):
             logger.error(
@@ -163,8 +315,7 @@ def record(opts: RecordOptions) -> int:
             return 7
     except Exception:
         pass
-    base_dt = datetime.now()
-    base = _fmt_basename(opts.username, base_dt)
+    base = _fmt_basename(opts.username, time.time())
     part_idx = 1
     parts: list[Path] = []
 
@@ -176,175 +327,167 @@ def record(opts: RecordOptions) -> int:
         logger.error(str(e))
         return 3
 
-    # Global slot
-    gsm = GlobalSlotManager(opts.record_limit, logger=logger)
-    try:
-        gsm.acquire_slot(opts.username, fail_fast=opts.fail_fast)
-    except SlotUnavailable as e:
-        logger.error(str(e))
-        user_lock.release()
-        return 4
+    with contextlib.ExitStack() as stack:
+        # Both locks are dropped on every return path and on unexpected errors
+        stack.callback(user_lock.release)
 
-    # Capture loop
-    gt = GracefulTerm()
-    gt.install(logger)
-    deadline = time.time() + float(opts.retry_window)
+        # Global slot
+        gsm = GlobalSlotManager(opts.record_limit, logger=logger)
+        try:
+            gsm.acquire_slot(opts.username, fail_fast=opts.fail_fast)
+        except SlotUnavailable as e:
+            logger.error(str(e))
+            return 4
+        stack.callback(gsm.release_slot)
+
+        # Capture loop
+        gt = GracefulTerm()
+        gt.install(logger)
+        stack.callback(gt.close)
+        deadline = time.monotonic() + float(opts.retry_window)
 
-    logger.info(
-        "begin capture loop",
-        extra={"extra": {"quality": opts.quality, "retry_delay": opts.retry_delay, "retry_window": opts.retry_window}},
-    )
+        logger.info(
+            "begin capture loop",
+            extra={"extra": {"quality": opts.quality, "retry_delay": opts.retry_delay, "retry_window": opts.retry_window}},
+        )
 
-    while True:
-        if gt.stop and not parts:
-            # If user requested stop before any data, just exit
-            break
+        while True:
+            if gt.stop and not parts:
+                # If user requested stop before any data, just exit
+                break
 
-        part = temp_dir / f"{base}_part{part_idx:02d}.ts"
-        cmd = _streamlink_cmd(opts.username, opts.quality, part, opts.loglevel)
-        logger.info("start part", extra={"extra": {"part": part.name, "cmd": " ".join(shlex.quote(c) for c in cmd)}})
-        try:
-            proc = subprocess.Popen(cmd)
-            stop_mark = None  # type: Optional[float]
-            while True:
-                try:
-                    ret = proc.wait(timeout=1)
+            part = temp_dir / f"{base}_part{part_idx:02d}.ts"
+            cmd = _streamlink_cmd(opts.username, opts.quality, part, opts.loglevel, streamlink_bin)
+            logger.info("start part", extra={"extra": {"part": part.name, "cmd": " ".join(shlex.quote(c) for c in cmd)}})
+            try:
+                proc = _start_part(cmd)
+                ret = _wait_part(proc, gt)
+                logger.info("part finished", extra={"extra": {"part": part.name, "exit": ret}})
+            except Exception as e:
+                logger.error("failed to run streamlink", extra={"extra": {"error": str(e)}})
+                ret = 1
+
+            size = part.stat().st_size if part.exists() else 0
+            if ret == 0 and size > 0:
+                # success, reset deadline
+                parts.append(part)
+                part_idx += 1
+                deadline = time.monotonic() + float(opts.retry_window)
+                if gt.stop:
                     break
-                except subprocess.TimeoutExpired:
-                    if gt.stop:
-                        # escalate signals over time to ensure child exit
-                        if stop_mark is None:
-                            stop_mark = time.time()
-                            try:
-                                proc.send_signal(signal.SIGINT)
-                            except ProcessLookupError:
-                                pass
-                        else:
-                            waited = time.time() - stop_mark
-                            if waited > 10:
-                                try:
-                                    proc.kill()
-                                except ProcessLookupError:
-                                    pass
-                            elif waited > 5:
-                                try:
-                                    proc.terminate()
-                                except ProcessLookupError:
-                                    pass
-            logger.info("part finished", extra={"extra": {"part": part.name, "exit": ret}})
-        except Exception as e:
-            logger.error("failed to run streamlink", extra={"extra": {"error": str(e)}})
-            ret = 1
-
-        size = part.stat().st_size if part.exists() else 0
-        if ret == 0 and size > 0:
-            # success, reset deadline
-            parts.append(part)
-            part_idx += 1
-            deadline = time.time() + float(opts.retry_window)
-            if gt.stop:
-                break
+                else:
+                    # Immediately continue to try capturing next contiguous segment
+                    continue
             else:
-                # Immediately continue to try capturing next contiguous segment
+                # failure / offline
+                if gt.stop or time.monotonic() > deadline:
+                    break
+                gt.sleep(float(opts.retry_delay))
                 continue
-        else:
-            # failure / offline
-            if gt.stop or time.time() > deadline:
-                break
-            time.sleep(float(opts.retry_delay))
-            continue
 
-    # Merge if any parts
-    merged_ts = temp_dir / f"{base}.ts"
-    if not parts:
-        logger.warning("no parts captured; exiting without outputs")
-        gsm.release_slot()
-        user_lock.release()
-        return 5
+        # Merge if any parts
+        merged_ts = temp_dir / f"{base}.ts"
+        if not parts:
+            logger.warning("no parts captured; exiting without outputs")
+            return 5
+
+        remux_mp4 = temp_dir / f"{base}.mp4"
+        remuxed = False
+        # Without a kept TS, remux the parts straight into the MP4 so the
+        # recording is written once instead of twice
+        if opts.enable_remux and opts.delete_ts_after_remux:
+            remux_rc = _ffmpeg_concat_remux(parts, remux_mp4, opts.loglevel, ffmpeg_bin)
+            remuxed = remux_rc == 0 and remux_mp4.exists() and remux_mp4.stat().st_size > 0
+            if not remuxed:
+                logger.warning("direct remux failed, merging to TS first", extra={"extra": {"rc": remux_rc}})
+                safe_unlink(remux_mp4)
+
+        if not remuxed:
+            merge_rc = _ffmpeg_concat(parts, merged_ts, opts.loglevel, ffmpeg_bin)
+            if merge_rc != 0 or not merged_ts.exists() or merged_ts.stat().st_size == 0:
+                logger.error("merge failed", extra={"extra": {"rc": merge_rc}})
+                # Keep parts for inspection
+                return 6
+
+        # Remove parts to save space
+        removed = 0
+        for p in parts:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(p)
+                removed += 1
+        merged = remux_mp4 if remuxed else merged_ts
+        logger.info("merged parts", extra={"extra": {"out": merged.name, "parts_removed": removed}})
 
-    merge_rc = _ffmpeg_concat(parts, merged_ts, opts.loglevel)
-    if merge_rc != 0 or not merged_ts.exists() or merged_ts.stat().st_size == 0:
-        logger.error("merge failed", extra={"extra": {"rc": merge_rc}})
+        # Release global slot immediately after merging
         gsm.release_slot()
-        # Keep parts for inspection
-        user_lock.release()
-        return 6
-
-    # Remove parts to save space
-    removed = 0
-    for p in parts:
-        try:
-            p.unlink()
-            removed += 1
-        except FileNotFoundError:
-            pass
-    logger.info("merged parts", extra={"extra": {"out": merged_ts.name, "parts_removed": removed}})
 
-    # Release global slot immediately after merging
-    gsm.release_slot()
+        if not bool(opts.enable_remux):
+            # Move merged TS to final directory before exiting
+            final_ts = out_dir / merged_ts.name
+            try:
+                _move_final(merged_ts, final_ts, logger)
+                logger.info("finalized output", extra={"extra": {"moved_to": final_ts.name}})
+            except Exception as e:
+                logger.error("failed to move final TS", extra={"extra": {"error": str(e), "src": str(merged_ts), "dst": str(final_ts)}})
+                final_ts = merged_ts  # fallback: keep in temp
+            logger.info(
+                "remux disabled; leaving merged TS and skipping encode queue",
+                extra={"extra": {"output": final_ts.name}},
+            )
+            logger.info("recorder done")
+            return 0
 
-    if not bool(opts.enable_remux):
-        # Move merged TS to final directory before exiting
-        final_ts = out_dir / merged_ts.name
+        # Try remux
+        remux_rc: Optional[int] = 0
+        if remuxed:
+            pass
+        elif opts.delete_ts_after_remux and opts.delete_input_on_success:
+            # Nothing keeps the MP4 past the encode, so another full copy
+            # pass would be wasted; the encoder reads the TS just as well
+            remux_rc = None
+            logger.info("skipping remux; encoding from the merged TS", extra={"extra": {"input": merged_ts.name}})
+        else:
+            remux_rc = _ffmpeg_remux_to_mp4(merged_ts, remux_mp4, opts.loglevel, ffmpeg_bin)
+        use_input = merged_ts
+        if remux_rc == 0 and remux_mp4.exists() and remux_mp4.stat().st_size > 0:
+            logger.info("remux success", extra={"extra": {"out": remux_mp4.name}})
+            use_input = remux_mp4
+            if opts.delete_ts_after_remux and merged_ts.exists():
+                try:
+                    merged_ts.unlink()
+                except Exception:
+                    pass
+        elif remux_rc is not None:
+            logger.warning("remux failed, keeping TS for encode", extra={"extra": {"rc": remux_rc}})
+
+        # Move final input(s) from temp to the configured output directory
+        moved_input = out_dir / use_input.name
         try:
-            merged_ts.replace(final_ts)
-            logger.info("finalized output", extra={"extra": {"moved_to": final_ts.name}})
+            _move_final(use_input, moved_input, logger)
+            logger.info("finalized input for encode", extra={"extra": {"moved_to": moved_input.name}})
         except Exception as e:
-            logger.error("failed to move final TS", extra={"extra": {"error": str(e), "src": str(merged_ts), "dst": str(final_ts)}})
-            final_ts = merged_ts  # fallback: keep in temp
-        logger.info(
-            "remux disabled; leaving merged TS and skipping encode queue",
-            extra={"extra": {"output": final_ts.name}},
-        )
-        user_lock.release()
-        logger.info("recorder done")
-        return 0
+            logger.error("failed to move input to final directory", extra={"extra": {"error": str(e), "src": str(use_input), "dst": str(moved_input)}})
+            moved_input = use_input  # fallback: encode from temp
 
-    # Try remux
-    remux_mp4 = temp_dir / f"{base}.mp4"
-    remux_rc = _ffmpeg_remux_to_mp4(merged_ts, remux_mp4, opts.loglevel)
-    use_input = merged_ts
-    if remux_rc == 0 and remux_mp4.exists() and remux_mp4.stat().st_size > 0:
-        logger.info("remux success", extra={"extra": {"out": remux_mp4.name}})
-        use_input = remux_mp4
-        if opts.delete_ts_after_remux and merged_ts.exists():
+        # If we kept the TS alongside a successful remux, also move it to final dir
+        if use_input == remux_mp4 and merged_ts.exists() and not opts.delete_ts_after_remux:
+            ts_final = out_dir / merged_ts.name
             try:
-                merged_ts.unlink()
-            except Exception:
-                pass
-    else:
-        logger.warning("remux failed, keeping TS for encode", extra={"extra": {"rc": remux_rc}})
-
-    # Move final input(s) from temp to the configured output directory
-    moved_input = out_dir / use_input.name
-    try:
-        use_input.replace(moved_input)
-        logger.info("finalized input for encode", extra={"extra": {"moved_to": moved_input.name}})
-    except Exception as e:
-        logger.error("failed to move input to final directory", extra={"extra": {"error": str(e), "src": str(use_input), "dst": str(moved_input)}})
-        moved_input = use_input  # fallback: encode from temp
-
-    # If we kept the TS alongside a successful remux, also move it to final dir
-    if use_input == remux_mp4 and merged_ts.exists() and not opts.delete_ts_after_remux:
-        ts_final = out_dir / merged_ts.name
-        try:
-            merged_ts.replace(ts_final)
-            logger.info("kept TS alongside MP4", extra={"extra": {"moved_to": ts_final.name}})
-        except Exception as e:
-            logger.error("failed to move TS to final directory", extra={"extra": {"error": str(e), "src": str(merged_ts), "dst": str(ts_final)}})
-
-    # Enqueue encode job
-    final_out = out_dir / f"{base}_compressed.mp4"
-    job = Job(
-        input=str(moved_input.resolve()),
-        output=str(final_out.resolve()),
-        loglevel=opts.loglevel,
-        delete_input_on_success=bool(opts.delete_input_on_success),
-    )
-    job_path = write_job(opts.queue_dir.expanduser(), job)
-    logger.info("enqueued encode job", extra={"extra": {"job": str(job_path)}})
+                _move_final(merged_ts, ts_final, logger)
+                logger.info("kept TS alongside MP4", extra={"extra": {"moved_to": ts_final.name}})
+            except Exception as e:
+                logger.error("failed to move TS to final directory", extra={"extra": {"error": str(e), "src": str(merged_ts), "dst": str(ts_final)}})
+
+        # Enqueue encode job
+        final_out = out_dir / f"{base}_compressed.mp4"
+        job = Job(
+            input=str(moved_input.resolve()),
+            output=str(final_out.resolve()),
+            loglevel=opts.loglevel,
+            delete_input_on_success=bool(opts.delete_input_on_success),
+        )
+        job_path = write_job(opts.queue_dir.expanduser(), job)
+        logger.info("enqueued encode job", extra={"extra": {"job": str(job_path)}})
 
-    # Release per-user lock
-    user_lock.release()
-    logger.info("recorder done")
-    return 0
+        logger.info("recorder done")
+        return 0
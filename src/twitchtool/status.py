@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import fcntl
+import os
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
@@ -29,17 +30,21 @@ class StatusReport:
 
 
 def _detect_encoder_running() -> bool:
-    path = ENCODER_LOCK_PATH
-    ensure_dir(path.parent)
-    with path.open("a+") as f:
-        try:
-            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-        except BlockingIOError:
-            # Already locked by running daemon
-            return True
-        else:
-            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-            return False
+    # Read-only shared probe: never creates the file or touches its mtime
+    try:
+        fd = os.open(ENCODER_LOCK_PATH, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        # Already locked by running daemon
+        return True
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return False
+    finally:
+        os.close(fd)
 
 
 def gather_status(queue_dir: Path, record_limit: int) -> StatusReport:
@@ -57,8 +62,17 @@ def gather_status(queue_dir: Path, record_limit: int) -> StatusReport:
     jobs = list_jobs(qdir)
     jobs_dir = qdir / "jobs"
     ensure_dir(jobs_dir)
-    failed = sorted(jobs_dir.glob("*.failed.json"))
-    errors = sorted(jobs_dir.glob("*.error.json"))
+    # One directory pass for both sidecar kinds
+    failed: list[Path] = []
+    errors: list[Path] = []
+    with os.scandir(jobs_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".failed.json"):
+                failed.append(Path(entry.path))
+            elif entry.name.endswith(".error.json"):
+                errors.append(Path(entry.path))
+    failed.sort()
+    errors.sort()
 
     encoder_running: Optional[bool] = None
     encoder_error: Optional[str] = None
@@ -97,17 +111,18 @@ def format_report(report: StatusReport) -> str:
     queue_path = q.queue_dir / "jobs"
     if total_jobs:
         lines.append(f"Pending encode jobs ({total_jobs}):")
+        # One string per job; blocks are separated by a blank line
+        blocks = []
         for idx, entry in enumerate(q.jobs, start=1):
             job = entry.job
             input_path = Path(job.input)
-            output_path = Path(job.output)
-            lines.append(f"  {idx}. {input_path.stem}")
-            lines.append(f"     input:  {input_path.name}")
-            lines.append(f"     output: {output_path.name}")
-            lines.append(f"     (created {job.created_at or 'n/a'})")
-            lines.append("")
-        if lines and lines[-1] == "":
-            lines.pop()
+            blocks.append(
+                f"  {idx}. {input_path.stem}\n"
+                f"     input:  {input_path.name}\n"
+                f"     output: {Path(job.output).name}\n"
+                f"     (created {job.created_at or 'n/a'})"
+            )
+        lines.append("\n\n".join(blocks))
     else:
         lines.append("Pending encode jobs: none")
     lines.append("")
@@ -115,13 +130,11 @@ def format_report(report: StatusReport) -> str:
 
     if q.failed:
         lines.append(f"Failed jobs ({len(q.failed)}):")
-        for path in q.failed:
-            lines.append(f"  {path}")
+        lines.extend([f"  {path}" for path in q.failed])
 
     if q.errors:
         lines.append(f"Errored jobs ({len(q.errors)}):")
-        for path in q.errors:
-            lines.append(f"  {path}")
+        lines.extend([f"  {path}" for path in q.errors])
 
     lines.append("")
     if report.encoder_running is None:
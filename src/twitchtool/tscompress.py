@@ -0,0 +1,704 @@
+from __future__ import annotations
+
+import ctypes
+import logging
+import os
+import shlex
+import shutil
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from queue import SimpleQueue
+from typing import Any, Optional, Sequence
+
+from .ffmpeg_cmds import (
+    build_batch_encode_cmd,
+    build_concat_cmd,
+    build_encode_cmd,
+    build_remux_cmd,
+    build_remux_encode_cmd,
+    cuvid_resize,
+    probe_audio_codecs,
+    probe_video_stream,
+    resolve_cuvid,
+    run_ffmpeg,
+)
+from .utils import setup_logging
+
+
+def default_jobs() -> int:
+    """Default worker count for parallel tscompress runs (half the cores, at least 1)."""
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+@dataclass(frozen=True, slots=True)
+class TsCompressOptions:
+    ffmpeg_bin: str
+    output_dir: Optional[Path] = None
+    suffix: str = "_compressed"
+    video_codec: str = "libx265"
+    preset: str = "medium"
+    crf: int = 26
+    audio_bitrate: str = "160k"
+    audio_rate: int = 48_000
+    # Stream-copy audio when every input audio track is already AAC (needs ffprobe)
+    audio_copy: bool = False
+    ffprobe_bin: Optional[str] = None
+    max_height: Optional[int] = 480
+    threads: int = 0  # 0 leaves -threads to ffmpeg's auto detection
+    loglevel: str = "info"
+    x265_params: Optional[str] = None
+    # Resolved backend from ffmpeg_cmds.resolve_hwaccel ("none" = software codec)
+    hwaccel: str = "none"
+    # On-GPU scaler from ffmpeg_cmds.resolve_gpu_scaler; None decodes on the CPU
+    gpu_scaler: Optional[str] = None
+    nvenc_preset: str = "p4"
+    nvenc_tune: str = "hq"
+    # NVENC: decode + resize with the matching CUVID decoder (needs ffprobe)
+    two_stage: bool = False
+    remux_only: bool = False
+    # Encode straight from the .ts instead of writing and re-reading a remuxed .mp4
+    fuse_remux_encode: bool = False
+    dry_run: bool = False
+    delete_source: bool = False
+    overwrite: bool = False
+    delete_ts_after_remux: bool = False
+    delete_input_on_success: bool = False
+    json_logs: bool = False
+    quiet: bool = False  # only log skips and failures
+    # Reserve disk blocks for the encode output up front (Linux only)
+    preallocate: bool = False
+    # Encode in fixed-length segments so an interrupted run continues where it stopped
+    resume: bool = False
+    stats: bool = True
+    nice_prefix: tuple[str, ...] = ()
+    jobs: int = 1
+    # Max concurrent hardware encodes across workers (ignored for software encodes)
+    gpu_jobs: int = 2
+    # Inputs per multi-output ffmpeg run; 0/1 runs one ffmpeg per input
+    batch: int = 0
+    # Pin each pool worker (and its ffmpeg children) to its own share of the CPUs
+    pin_cpus: bool = False
+
+
+log = logging.getLogger("twitchtool.tscompress")
+
+_FALLOC_FL_KEEP_SIZE = 0x01
+# Expected output size relative to the .ts (480p CRF 26 HEVC from a 1080p stream)
+_PREALLOC_RATIO = 0.15
+# Chunk length for --resume; at most this much encode work is redone after a crash
+_RESUME_SEGMENT_SECONDS = 30
+
+# Set in pool workers so concurrent event lines do not interleave.
+_EMIT_LOCK: Any = None
+# Set in pool workers when hardware encodes must be capped below the worker count.
+_GPU_SEM: Any = None
+
+
+def setup_event_log(*, json_logs: bool, quiet: bool = False) -> None:
+    """Configure the logger every tscompress event goes through (CLI checks included)."""
+    setup_logging(log.name, level=logging.WARNING if quiet else logging.INFO, json_logs=json_logs)
+
+
+def _setup_log(opts: TsCompressOptions) -> None:
+    setup_event_log(json_logs=opts.json_logs, quiet=opts.quiet)
+
+
+def _pool_init(
+    lock: Any,
+    gpu_sem: Any = None,
+    opts: Optional[TsCompressOptions] = None,
+    pin: Optional[tuple[Any, int]] = None,
+) -> None:
+    global _EMIT_LOCK, _GPU_SEM
+    _EMIT_LOCK = lock
+    _GPU_SEM = gpu_sem
+    if opts is not None:
+        # Workers started with "spawn" do not inherit the parent's handlers
+        _setup_log(opts)
+    if pin is not None:
+        counter, workers = pin
+        with counter.get_lock():
+            slot = counter.value
+            counter.value += 1
+        _pin_worker(slot, workers)
+
+
+def _worker_cpus(allowed: Sequence[int], slot: int, workers: int) -> set[int]:
+    """Return the disjoint share of *allowed* CPUs for worker *slot* of *workers*."""
+    cpus = sorted(allowed)
+    per_worker = max(1, len(cpus) // max(1, workers))
+    start = (slot * per_worker) % len(cpus)
+    return set(cpus[start : start + per_worker])
+
+
+def _pin_worker(slot: int, workers: int) -> None:
+    # ffmpeg children inherit the mask, so pinning the worker pins its encodes
+    try:
+        os.sched_setaffinity(0, _worker_cpus(os.sched_getaffinity(0), slot, workers))
+    except (AttributeError, OSError):
+        pass
+
+
+def emit_event(json_logs: bool, event: str, *, warn: bool = False, **extra: object) -> None:
+    """Log one tscompress event; skips, failures and *warn* events log at WARNING."""
+    failed = warn or event.startswith("skip-") or event.endswith(("-failed", "-skipped"))
+    level = logging.WARNING if failed else logging.INFO
+    if not log.isEnabledFor(level):
+        return
+    # Callables defer costly values (joined command lines) until we know they log
+    extra = {k: v() if callable(v) else v for k, v in extra.items()}
+    if json_logs or not extra:
+        msg = event
+    else:
+        details = " ".join(f"{k}={v}" for k, v in extra.items())
+        msg = f"{event}: {details}"
+    log.log(level, msg, extra={"extra": {"event": event, **extra}})
+
+
+def _emit(opts: TsCompressOptions, event: str, **extra: object) -> None:
+    if _EMIT_LOCK is None:
+        emit_event(opts.json_logs, event, **extra)
+        return
+    with _EMIT_LOCK:
+        emit_event(opts.json_logs, event, **extra)
+
+
+def _preallocate(path: Path, size: int) -> bool:
+    """Empty *path* and reserve *size* bytes of blocks past EOF.
+
+    Uses fallocate(FALLOC_FL_KEEP_SIZE) so the visible size still grows with
+    what ffmpeg writes; posix_fallocate would extend the file itself.
+    """
+    if not sys.platform.startswith("linux") or size <= 0:
+        return False
+    try:
+        fallocate = ctypes.CDLL(None, use_errno=True).fallocate
+    except (OSError, AttributeError):
+        return False
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    except OSError:
+        return False
+    try:
+        return fallocate(fd, _FALLOC_FL_KEEP_SIZE, 0, size) == 0
+    finally:
+        os.close(fd)
+
+
+def _stat_or_none(path: Path) -> Optional[os.stat_result]:
+    """One stat(2) standing in for paired exists()/stat() checks."""
+    try:
+        return os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _resolve_input(raw: Path, opts: TsCompressOptions) -> Optional[Path]:
+    """Resolve *raw* (unless already absolute) and reject missing or non-.ts inputs."""
+    # The name alone rules out non-.ts inputs; no need to resolve or stat them
+    if raw.suffix.lower() != ".ts":
+        _emit(opts, "skip-non-ts", path=str(raw))
+        return None
+    if raw.is_absolute():
+        src = raw
+    else:
+        try:
+            src = raw.resolve()
+        except FileNotFoundError:
+            src = raw
+
+    if _stat_or_none(src) is None:
+        _emit(opts, "skip-missing", path=str(src))
+        return None
+    return src
+
+
+def _output_paths(src: Path, opts: TsCompressOptions) -> tuple[Path, Path]:
+    """Return (remux_mp4, final_mp4) for *src*, creating the output directory."""
+    if opts.output_dir is None:
+        dst_dir = src.parent
+    else:
+        dst_dir = opts.output_dir
+        dst_dir.mkdir(parents=True, exist_ok=True)
+    name = src.name
+    # String slicing instead of Path.stem; a resolved symlink may lack the .ts
+    stem = name[:-3] if name[-3:].lower() == ".ts" else os.path.splitext(name)[0]
+    return dst_dir / f"{stem}.mp4", dst_dir / f"{stem}{opts.suffix}.mp4"
+
+
+def _should_copy_audio(encode_input: Path, opts: TsCompressOptions) -> bool:
+    if not (opts.audio_copy and opts.ffprobe_bin):
+        return False
+    codecs = probe_audio_codecs(opts.ffprobe_bin, str(encode_input))
+    audio_copy = bool(codecs) and all(codec == "aac" for codec in codecs)
+    _emit(opts, "audio-copy" if audio_copy else "audio-reencode", codecs=",".join(codecs) or "unknown")
+    return audio_copy
+
+
+def _cuvid_settings(encode_input: Path, opts: TsCompressOptions) -> tuple[Optional[str], Optional[str]]:
+    """Return (decoder, resize) for a CUVID decode stage, or (None, None)."""
+    if not (opts.two_stage and opts.hwaccel == "nvenc" and opts.ffprobe_bin):
+        return None, None
+    info = probe_video_stream(opts.ffprobe_bin, str(encode_input))
+    decoder = resolve_cuvid(opts.ffmpeg_bin, info[0]) if info else None
+    if info is None or decoder is None:
+        _emit(opts, "cuvid-unavailable", input=str(encode_input), codec=info[0] if info else "unknown")
+        return None, None
+    resize = cuvid_resize(info[1], info[2], opts.max_height)
+    _emit(opts, "cuvid", decoder=decoder, resize=resize or "none")
+    return decoder, resize
+
+
+def _encode_segments(encode_input: Path, final_mp4: Path, opts: TsCompressOptions, **per_file: Any) -> int:
+    """Encode *encode_input* as numbered segments next to *final_mp4*, then join them.
+
+    Segments finished by an earlier run are kept; encoding restarts at the
+    last one (it may have been cut short) by seeking the input.
+    """
+    parts = final_mp4.with_name(f".{final_mp4.stem}.parts")
+    complete = parts / "complete"
+    if opts.overwrite and parts.is_dir() and not opts.dry_run:
+        shutil.rmtree(parts)
+
+    if _stat_or_none(complete) is None:
+        existing = sorted(parts.glob("seg_*.mp4")) if parts.is_dir() else []
+        finished = 0
+        for seg in existing:
+            seg_st = _stat_or_none(seg)
+            if seg.name != f"seg_{finished:05d}.mp4" or seg_st is None or seg_st.st_size == 0:
+                break
+            finished += 1
+        start = max(0, finished - 1)
+        if not opts.dry_run:
+            for seg in existing[start:]:
+                seg.unlink()
+        if start:
+            _emit(opts, "resume", input=str(encode_input), segment=start, seconds=start * _RESUME_SEGMENT_SECONDS)
+
+        encode_cmd = list(opts.nice_prefix) + build_encode_cmd(
+            opts.ffmpeg_bin,
+            encode_input,
+            parts / "seg_%05d.mp4",
+            loglevel=opts.loglevel,
+            stats=opts.stats,
+            overwrite=True,
+            seek=start * _RESUME_SEGMENT_SECONDS,
+            segment_seconds=_RESUME_SEGMENT_SECONDS,
+            segment_start=start,
+            **per_file,
+            **_encode_settings(opts),
+        )
+        _emit(opts, "encode-start", cmd=lambda: shlex.join(encode_cmd))
+        if opts.dry_run:
+            _emit(opts, "encode-dry-run", output=str(final_mp4))
+            return 0
+        parts.mkdir(parents=True, exist_ok=True)
+        erc = _run_encode(encode_cmd, opts)
+        if erc != 0:
+            return erc
+        complete.touch()
+
+    list_file = parts / "concat.txt"
+    with list_file.open("w", encoding="utf-8") as fh:
+        for seg in sorted(parts.glob("seg_*.mp4")):
+            quoted = str(seg).replace("'", "'\\''")
+            fh.write(f"file '{quoted}'\n")
+    concat_cmd = build_concat_cmd(opts.ffmpeg_bin, list_file, final_mp4, loglevel=opts.loglevel)
+    _emit(opts, "concat-start", cmd=lambda: shlex.join(concat_cmd))
+    if opts.dry_run:
+        return 0
+    rc = run_ffmpeg(concat_cmd)
+    if rc == 0:
+        shutil.rmtree(parts, ignore_errors=True)
+    return rc
+
+
+def _encode_settings(opts: TsCompressOptions) -> dict[str, Any]:
+    """Encoder keyword arguments shared by build_encode_cmd and build_batch_encode_cmd."""
+    return {
+        "video_codec": opts.video_codec,
+        "preset": opts.preset,
+        "crf": opts.crf,
+        "audio_bitrate": opts.audio_bitrate,
+        "audio_rate": opts.audio_rate,
+        "max_height": opts.max_height,
+        "threads": opts.threads if opts.threads > 0 else None,
+        "x265_params": opts.x265_params,
+        "hwaccel": opts.hwaccel,
+        "gpu_scaler": opts.gpu_scaler,
+        "nvenc_preset": opts.nvenc_preset,
+        "nvenc_tune": opts.nvenc_tune,
+    }
+
+
+def _run_encode(cmd: list[str], opts: TsCompressOptions) -> int:
+    if _GPU_SEM is not None and opts.hwaccel != "none":
+        with _GPU_SEM:
+            return run_ffmpeg(cmd)
+    return run_ffmpeg(cmd)
+
+
+def _cleanup_after_encode(opts: TsCompressOptions, src: Path, encode_input: Path, out_size: int) -> None:
+    """Apply --delete-input-on-success / --delete-source once *src* encoded OK."""
+    # The source .ts is only ever removed by --delete-source
+    input_st = _stat_or_none(encode_input) if opts.delete_input_on_success and encode_input != src else None
+    if input_st is not None:
+        if out_size < input_st.st_size * 0.1:
+            _emit(opts, "input-delete-skipped", path=str(encode_input), reason="output-too-small")
+        else:
+            try:
+                encode_input.unlink()
+                _emit(opts, "input-deleted", path=str(encode_input))
+            except Exception as exc:
+                _emit(opts, "input-delete-failed", path=str(encode_input), error=str(exc))
+
+    src_st = _stat_or_none(src) if opts.delete_source else None
+    if src_st is not None:
+        if out_size < src_st.st_size * 0.1:
+            _emit(opts, "source-delete-skipped", path=str(src), reason="output-too-small")
+        else:
+            try:
+                src.unlink()
+                _emit(opts, "source-deleted", path=str(src))
+            except Exception as exc:
+                _emit(opts, "source-delete-failed", path=str(src), error=str(exc))
+
+
+def process_one(raw: Path, opts: TsCompressOptions) -> int:
+    """Remux and/or encode a single .ts input. Returns a process-style exit code.
+
+    *raw* is resolved here unless it is already absolute (normalize_inputs
+    hands out absolute paths).
+    """
+    src = _resolve_input(raw, opts)
+    if src is None:
+        return 1
+    remux_mp4, final_mp4 = _output_paths(src, opts)
+
+    _emit(opts, "begin", input=str(src))
+
+    # A finished encode makes the remux moot; decide that before any ffmpeg run
+    if not opts.remux_only and not opts.overwrite:
+        final_st = _stat_or_none(final_mp4)
+        if final_st is not None and final_st.st_size > 0:
+            _emit(opts, "encode-skip-exists", output=str(final_mp4))
+            return 0
+
+    encode_input = src
+
+    fused = opts.fuse_remux_encode and not opts.remux_only
+    remux_st = None if fused else _stat_or_none(remux_mp4)
+    need_remux = opts.remux_only or opts.overwrite or not (remux_st is not None and remux_st.st_size > 0)
+    if fused:
+        _emit(opts, "remux-skip-fused", input=str(src))
+    elif need_remux and not opts.remux_only and not opts.resume and not opts.preallocate:
+        return _remux_and_encode(src, remux_mp4, final_mp4, opts)
+    elif need_remux:
+        remux_cmd = build_remux_cmd(
+            opts.ffmpeg_bin,
+            src,
+            remux_mp4,
+            loglevel=opts.loglevel,
+            stats=opts.stats,
+            overwrite=True,
+        )
+        _emit(opts, "remux-start", cmd=lambda: shlex.join(remux_cmd))
+        if opts.dry_run:
+            remux_rc = 0
+            _emit(opts, "remux-dry-run", output=str(remux_mp4))
+        else:
+            remux_rc = run_ffmpeg(remux_cmd)
+        remux_st = _stat_or_none(remux_mp4)
+        if remux_rc == 0 and remux_st is not None and remux_st.st_size > 0:
+            _emit(opts, "remux-ok", output=str(remux_mp4))
+            encode_input = remux_mp4
+            if opts.delete_ts_after_remux:
+                try:
+                    src.unlink()
+                    _emit(opts, "ts-deleted", path=str(src))
+                except FileNotFoundError:
+                    pass
+                except Exception as exc:
+                    _emit(opts, "ts-delete-failed", path=str(src), error=str(exc))
+        else:
+            _emit(opts, "remux-failed", rc=remux_rc)
+            if opts.remux_only:
+                return remux_rc or 1
+    else:
+        _emit(opts, "remux-skip-exists", output=str(remux_mp4))
+        if remux_st is not None:
+            encode_input = remux_mp4
+
+    if opts.remux_only:
+        remux_ok = remux_st is not None and remux_st.st_size > 0
+        if opts.delete_source and remux_ok and not opts.dry_run:
+            try:
+                src.unlink()
+                _emit(opts, "source-deleted", path=str(src))
+            except FileNotFoundError:
+                pass
+            except Exception as exc:
+                _emit(opts, "source-delete-failed", path=str(src), error=str(exc))
+        return 0
+
+    audio_copy = _should_copy_audio(encode_input, opts)
+    cuvid_decoder, resize = _cuvid_settings(encode_input, opts)
+    if opts.resume:
+        erc = _encode_segments(
+            encode_input,
+            final_mp4,
+            opts,
+            audio_copy=audio_copy,
+            cuvid_decoder=cuvid_decoder,
+            cuvid_resize=resize,
+        )
+        if opts.dry_run:
+            return 0
+        return _finish_encode(opts, src, encode_input, final_mp4, erc)
+
+    preallocated = False
+    if opts.preallocate and not opts.dry_run:
+        # The remux was just stat'ed; only a direct .ts input needs a fresh stat
+        input_st = remux_st if encode_input == remux_mp4 else _stat_or_none(encode_input)
+        if input_st is not None:
+            preallocated = _preallocate(final_mp4, int(input_st.st_size * _PREALLOC_RATIO))
+    encode_cmd = list(opts.nice_prefix) + build_encode_cmd(
+        opts.ffmpeg_bin,
+        encode_input,
+        final_mp4,
+        loglevel=opts.loglevel,
+        stats=opts.stats,
+        overwrite=True,
+        audio_copy=audio_copy,
+        truncate_output=not preallocated,
+        cuvid_decoder=cuvid_decoder,
+        cuvid_resize=resize,
+        **_encode_settings(opts),
+    )
+    _emit(opts, "encode-start", cmd=lambda: shlex.join(encode_cmd))
+    if opts.dry_run:
+        _emit(opts, "encode-dry-run", output=str(final_mp4))
+        return 0
+
+    erc = _run_encode(encode_cmd, opts)
+    if preallocated and erc == 0:
+        # Hand back whatever part of the reservation the encode did not use
+        final_st = _stat_or_none(final_mp4)
+        if final_st is not None:
+            try:
+                os.truncate(final_mp4, final_st.st_size)
+            except OSError:
+                pass
+    return _finish_encode(opts, src, encode_input, final_mp4, erc)
+
+
+def _remux_and_encode(src: Path, remux_mp4: Path, final_mp4: Path, opts: TsCompressOptions) -> int:
+    """Write the remux and the encode from one ffmpeg run that demuxes *src* once."""
+    cuvid_decoder, resize = _cuvid_settings(src, opts)
+    cmd = list(opts.nice_prefix) + build_remux_encode_cmd(
+        opts.ffmpeg_bin,
+        src,
+        remux_mp4,
+        final_mp4,
+        loglevel=opts.loglevel,
+        stats=opts.stats,
+        overwrite=True,
+        audio_copy=_should_copy_audio(src, opts),
+        cuvid_decoder=cuvid_decoder,
+        cuvid_resize=resize,
+        **_encode_settings(opts),
+    )
+    _emit(opts, "remux-encode-start", cmd=lambda: shlex.join(cmd))
+    if opts.dry_run:
+        _emit(opts, "remux-dry-run", output=str(remux_mp4))
+        _emit(opts, "encode-dry-run", output=str(final_mp4))
+        return 0
+
+    erc = _run_encode(cmd, opts)
+    remux_st = _stat_or_none(remux_mp4)
+    remux_ok = erc == 0 and remux_st is not None and remux_st.st_size > 0
+    if remux_ok:
+        _emit(opts, "remux-ok", output=str(remux_mp4))
+    else:
+        _emit(opts, "remux-failed", rc=erc)
+        # A partial remux would be picked up as finished by the next run
+        try:
+            remux_mp4.unlink()
+        except OSError:
+            pass
+    rc = _finish_encode(opts, src, remux_mp4 if remux_ok else src, final_mp4, erc)
+    if rc == 0 and remux_ok and opts.delete_ts_after_remux:
+        try:
+            src.unlink()
+            _emit(opts, "ts-deleted", path=str(src))
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            _emit(opts, "ts-delete-failed", path=str(src), error=str(exc))
+    return rc
+
+
+def _finish_encode(opts: TsCompressOptions, src: Path, encode_input: Path, final_mp4: Path, erc: int) -> int:
+    final_st = _stat_or_none(final_mp4)
+    if erc != 0 or final_st is None or final_st.st_size == 0:
+        _emit(opts, "encode-failed", rc=erc, input=str(src))
+        return erc or 1
+    _emit(opts, "encode-ok", output=str(final_mp4))
+    _cleanup_after_encode(opts, src, encode_input, final_st.st_size)
+    return 0
+
+
+def process_batch(raws: Sequence[Path], opts: TsCompressOptions) -> int:
+    """Encode several .ts inputs with one multi-output ffmpeg run (no remux).
+
+    Returns the first non-zero per-input exit code, like run_tscompress.
+    """
+    rc_overall = 0
+    pairs: list[tuple[Path, Path]] = []
+    for raw in raws:
+        src = _resolve_input(raw, opts)
+        if src is None:
+            rc_overall = rc_overall or 1
+            continue
+        _, final_mp4 = _output_paths(src, opts)
+        final_st = _stat_or_none(final_mp4)
+        if final_st is not None and final_st.st_size > 0 and not opts.overwrite:
+            _emit(opts, "encode-skip-exists", output=str(final_mp4))
+            continue
+        pairs.append((src, final_mp4))
+    if not pairs:
+        return rc_overall
+
+    audio_copy = [_should_copy_audio(src, opts) for src, _ in pairs]
+    encode_cmd = list(opts.nice_prefix) + build_batch_encode_cmd(
+        opts.ffmpeg_bin,
+        pairs,
+        loglevel=opts.loglevel,
+        stats=opts.stats,
+        overwrite=True,
+        audio_copy=audio_copy,
+        **_encode_settings(opts),
+    )
+    _emit(opts, "batch-encode-start", inputs=len(pairs), cmd=lambda: shlex.join(encode_cmd))
+    if opts.dry_run:
+        for _, final_mp4 in pairs:
+            _emit(opts, "encode-dry-run", output=str(final_mp4))
+        return rc_overall
+
+    erc = _run_encode(encode_cmd, opts)
+    for src, final_mp4 in pairs:
+        final_st = _stat_or_none(final_mp4)
+        if erc != 0 or final_st is None or final_st.st_size == 0:
+            _emit(opts, "encode-failed", rc=erc, input=str(src))
+            rc_overall = rc_overall or erc or 1
+            continue
+        _emit(opts, "encode-ok", output=str(final_mp4))
+        _cleanup_after_encode(opts, src, src, final_st.st_size)
+    return rc_overall
+
+
+def _prefetch(path: Path) -> None:
+    """Ask the kernel to start reading *path* into the page cache (best effort)."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _prefetch_worker(pending: SimpleQueue) -> None:
+    while (path := pending.get()) is not None:
+        _prefetch(path)
+
+
+def _run_serial(inputs: Sequence[Path], opts: TsCompressOptions) -> list[int]:
+    """Process inputs in order, warming the page cache for the next one meanwhile."""
+    if opts.dry_run or len(inputs) < 2:
+        return [process_one(p, opts) for p in inputs]
+    pending: SimpleQueue = SimpleQueue()
+    worker = threading.Thread(target=_prefetch_worker, args=(pending,), name="tscompress-prefetch", daemon=True)
+    worker.start()
+    results: list[int] = []
+    try:
+        for idx, path in enumerate(inputs):
+            if idx + 1 < len(inputs):
+                pending.put(inputs[idx + 1])
+            results.append(process_one(path, opts))
+    finally:
+        pending.put(None)
+    return results
+
+
+def _largest_first(units: Sequence[Any]) -> list[int]:
+    """Indices of *units* ordered by input size, biggest first.
+
+    Starting the longest encodes first keeps one large file from running
+    alone at the tail of a parallel run. Batch units count their total size.
+    """
+
+    def _size(unit: Any) -> int:
+        total = 0
+        for path in unit if isinstance(unit, list) else (unit,):
+            st = _stat_or_none(path)
+            total += st.st_size if st else 0
+        return total
+
+    sizes = [_size(unit) for unit in units]
+    return sorted(range(len(units)), key=lambda idx: -sizes[idx])
+
+
+def run_tscompress(inputs: Sequence[Path], opts: TsCompressOptions) -> int:
+    """Process all inputs, fanning out across a process pool when opts.jobs > 1.
+
+    With opts.batch > 1, inputs are encoded in groups of that size, one
+    ffmpeg run per group (see process_batch).
+
+    Returns the first non-zero exit code in input order (0 if all succeeded).
+    """
+    _setup_log(opts)
+    if opts.batch > 1 and not opts.remux_only:
+        units: Sequence[Any] = [list(inputs[i : i + opts.batch]) for i in range(0, len(inputs), opts.batch)]
+        worker_fn: Any = process_batch
+    else:
+        units = inputs
+        worker_fn = process_one
+    workers = max(1, min(int(opts.jobs), len(units)))
+    if opts.threads > 0 and not opts.remux_only:
+        # Keep jobs * threads within the core count; oversubscribed encoders thrash
+        workers = min(workers, max(1, (os.cpu_count() or 1) // opts.threads))
+    if len(units) > 1:
+        _emit(opts, "parallel-plan", workers=workers, threads_per_job=opts.threads or "auto")
+    if workers == 1 and worker_fn is process_batch:
+        results = [process_batch(group, opts) for group in units]
+    elif workers == 1:
+        results = _run_serial(inputs, opts)
+    else:
+        import multiprocessing
+
+        lock = multiprocessing.Lock()
+        gpu_sem = None
+        if opts.hwaccel != "none" and opts.gpu_jobs < workers:
+            gpu_sem = multiprocessing.BoundedSemaphore(max(1, opts.gpu_jobs))
+        pin = (multiprocessing.Value("i", 0), workers) if opts.pin_cpus else None
+        results = [0] * len(units)
+        initargs = (lock, gpu_sem, opts, pin)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_pool_init, initargs=initargs) as ex:
+            futures = {idx: ex.submit(worker_fn, units[idx], opts) for idx in _largest_first(units)}
+            for idx, fut in futures.items():
+                results[idx] = fut.result()
+
+    rc_overall = 0
+    for rc in results:
+        rc_overall = rc_overall or rc
+    return rc_overall
@@ -8,16 +8,11 @@ from .utils import ensure_dir, is_valid_twitch_username
 
 
 def _read_users(path: Path) -> list[str]:
-    users: list[str] = []
-    if not path.exists():
-        return users
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            name = line.strip()
-            if not name or name.startswith("#"):
-                continue
-            users.append(name)
-    return users
+    try:
+        raw = path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return []
+    return [name for name in map(str.strip, raw.splitlines()) if name and not name.startswith("#")]
 
 
 def _normalize(name: str) -> str:
@@ -26,13 +21,13 @@ def _normalize(name: str) -> str:
 
 def list_users(path: Path) -> int:
     path = path.expanduser()
-    users = sorted(_read_users(path), key=_normalize)
+    users = _read_users(path)
     if not users:
         print(f"No users configured (source: {path}).")
         return 0
-    print(f"Users file: {path}")
-    for user in users:
-        print(user)
+    # str.lower is what _normalize does, without the Python-level call per key
+    users.sort(key=str.lower)
+    sys.stdout.write(f"Users file: {path}\n" + "\n".join(users) + "\n")
     return 0
 
 
@@ -40,7 +35,7 @@ def add_users(path: Path, names: Sequence[str]) -> int:
     path = path.expanduser()
     ensure_dir(path.parent)
     existing = _read_users(path)
-    existing_norm = {_normalize(u) for u in existing}
+    existing_norm = {u.lower() for u in existing}
 
     added: list[str] = []
     added_norm: set[str] = set()
@@ -83,13 +78,12 @@ def remove_users(path: Path, names: Iterable[str]) -> int:
 
     removed: list[str] = []
     lines_out: list[str] = []
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            stripped = line.strip()
-            if stripped and not stripped.startswith("#") and _normalize(stripped) in targets:
-                removed.append(stripped)
-                continue
-            lines_out.append(line.rstrip("\n"))
+    for line in path.read_text(encoding="utf-8").splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith("#") and stripped.lower() in targets:
+            removed.append(stripped)
+        else:
+            lines_out.append(line)
 
     if removed:
         if lines_out:
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import functools
 import json
 import logging
 import os
+import select
 import shutil
 import signal
 import subprocess
@@ -16,6 +18,11 @@ from pathlib import Path
 from typing import Any, Iterable, Optional
 import re
 
+try:
+    import orjson  # optional; same output, faster on the small state files
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
 
 ISO = "%Y-%m-%dT%H:%M:%S%z"
 
@@ -29,19 +36,34 @@ def ensure_dir(p: Path) -> Path:
     return p
 
 
+def _dump_json_bytes(data: dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
 def atomic_write_json(path: Path, data: dict[str, Any]) -> None:
+    payload = _dump_json_bytes(data)
     path.parent.mkdir(parents=True, exist_ok=True)
-    with tempfile.NamedTemporaryFile("w", delete=False, dir=str(path.parent)) as tf:
-        json.dump(data, tf, ensure_ascii=False, separators=(",", ":"))
-        tf.flush()
-        os.fsync(tf.fileno())
-        tmpname = tf.name
+    fd, tmpname = tempfile.mkstemp(dir=str(path.parent))
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmpname)
+        raise
+    os.close(fd)
     os.replace(tmpname, path)
 
 
 def read_json(path: Path) -> dict[str, Any]:
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    data = path.read_bytes()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def is_process_alive(pid: int) -> bool:
@@ -58,8 +80,81 @@ def is_process_alive(pid: int) -> bool:
         return True
 
 
+class ProcessHandle:
+    """A process reference that survives pid reuse where pidfds are available.
+
+    The pidfd is opened once (Linux 5.3+) and used both to signal and to
+    await the process; elsewhere this falls back to os.kill and polling.
+    Raises ProcessLookupError if *pid* is already gone.
+    """
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self._fd: Optional[int] = None
+        try:
+            self._fd = os.pidfd_open(pid)  # type: ignore[attr-defined]
+        except (AttributeError, OSError) as exc:
+            if isinstance(exc, ProcessLookupError):
+                raise
+            if not is_process_alive(pid):
+                raise ProcessLookupError(pid) from None
+
+    def __enter__(self) -> "ProcessHandle":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def send_signal(self, sig: int) -> None:
+        if self._fd is not None and hasattr(signal, "pidfd_send_signal"):
+            signal.pidfd_send_signal(self._fd, sig)
+        else:
+            os.kill(self.pid, sig)
+
+    def wait(self, timeout: float, poll_interval: float = 0.3) -> bool:
+        """Wait up to ``timeout`` seconds for the process to exit; True once it is gone."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        if self._fd is not None:
+            poller = select.poll()
+            poller.register(self._fd, select.POLLIN)
+            remaining_ms = max(0, int((deadline - time.monotonic()) * 1000))
+            # A pidfd becomes readable when the process exits, zombie or not
+            return bool(poller.poll(remaining_ms))
+        while True:
+            if not is_process_alive(self.pid):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(poll_interval, remaining))
+
+
+def wait_for_exit(pid: int, timeout: float, poll_interval: float = 0.3) -> bool:
+    """Wait up to ``timeout`` seconds for ``pid`` to exit; True once it is gone."""
+    try:
+        proc = ProcessHandle(pid)
+    except ProcessLookupError:
+        return True
+    with proc:
+        return proc.wait(timeout, poll_interval)
+
+
+_WHICH_HITS: dict[str, str] = {}
+
+
 def which(cmd: str) -> Optional[str]:
-    return shutil.which(cmd)
+    """shutil.which with found paths memoized; misses are retried so later installs are seen."""
+    path = _WHICH_HITS.get(cmd)
+    if path is None:
+        path = shutil.which(cmd)
+        if path:
+            _WHICH_HITS[cmd] = path
+    return path
 
 
 @dataclass
@@ -69,29 +164,38 @@ class Completed:
     stderr: str
 
 
+def run_capture_bytes(cmd: list[str], timeout: Optional[int] = None) -> subprocess.CompletedProcess[bytes]:
+    """Run command and capture raw stdout/err bytes.
+
+    Raises subprocess.TimeoutExpired on timeout, after killing the command.
+    """
+    return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+
+
 def run_capture(cmd: list[str], timeout: Optional[int] = None) -> Completed:
-    """Run command, capture stdout/err, return Completed.
+    """Run command, capture stdout/err as UTF-8 text, return Completed.
 
-    Raises subprocess.TimeoutExpired on timeout.
+    Raises subprocess.TimeoutExpired on timeout, after killing the command.
     """
-    proc = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    try:
-        out, err = proc.communicate(timeout=timeout)
-    finally:
-        # nothing special
-        pass
-    return Completed(proc.returncode, out or "", err or "")
+    r = run_capture_bytes(cmd, timeout)
+    return Completed(r.returncode, r.stdout.decode("utf-8", "replace"), r.stderr.decode("utf-8", "replace"))
 
 
 class JsonFormatter(logging.Formatter):
+    # The "YYYY-MM-DDTHH:MM:SS" part only changes once a second
+    _ts_second = -1
+    _ts_prefix = ""
+
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        if second != self._ts_second:
+            self._ts_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._ts_second = second
+        return "%s.%06d+00:00" % (self._ts_prefix, (created - second) * 1_000_000)
+
     def format(self, record: logging.LogRecord) -> str:  # type: ignore[override]
         payload = {
-            "ts": datetime.utcfromtimestamp(record.created).replace(tzinfo=timezone.utc).isoformat(),
+            "ts": self._timestamp(record.created),
             "level": record.levelname,
             "name": record.name,
             "msg": record.getMessage(),
@@ -144,14 +248,19 @@ def setup_logging(
     return logger
 
 
-def build_nice_ionice_prefix() -> list[str]:
+@functools.lru_cache(maxsize=None)
+def _nice_ionice_prefix() -> tuple[str, ...]:
     parts: list[str] = []
     if which("nice"):
         parts += ["nice", "-n", "10"]
     if which("ionice"):
         # Best effort idle-ish
         parts += ["ionice", "-c", "2", "-n", "7"]
-    return parts
+    return tuple(parts)
+
+
+def build_nice_ionice_prefix() -> list[str]:
+    return list(_nice_ionice_prefix())
 
 
 def abspath(p: Path) -> Path:
@@ -182,7 +291,8 @@ def human_size(n: int) -> str:
     return f"{n}PB"
 
 
-_TWITCH_USERNAME_RE = re.compile(r"^[A-Za-z0-9_]{3,25}$")
+_TWITCH_USERNAME_RE = re.compile(r"[A-Za-z0-9_]{3,25}")
+_username_fullmatch = _TWITCH_USERNAME_RE.fullmatch
 
 
 def is_valid_twitch_username(name: str) -> bool:
@@ -190,4 +300,7 @@ def is_valid_twitch_username(name: str) -> bool:
 
     Twitch allows letters, numbers, underscores; typical length 3-25.
     """
-    return bool(_TWITCH_USERNAME_RE.match(name))
+    # fullmatch also rejects a trailing newline, which "$" would let through
+    if not 3 <= len(name) <= 25:
+        return False
+    return _username_fullmatch(name) is not None
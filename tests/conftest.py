@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import pytest
+
+from twitchtool import poller as _pol
+
+# Patches every poller test needs: no state files, streamlink and the
+# recorder command always resolve, and no user is already being recorded
+_POLLER_PATCHES = (
+    (_pol, "_register_poller_process", lambda interval, logger: "now"),
+    (_pol, "_clear_pid_file", lambda: None),
+    (_pol, "_write_status", lambda update: None),
+    (_pol, "which", {"streamlink": "/usr/bin/streamlink", "twitchtool": "/usr/bin/twitchtool"}.get),
+    (_pol.PerUserLock, "is_user_locked", staticmethod(lambda user: False)),
+)
+
+
+@pytest.fixture
+def patched_poller(monkeypatch):
+    """The poller module with the common patches applied; tests add the rest."""
+    for target, name, value in _POLLER_PATCHES:
+        monkeypatch.setattr(target, name, value)
+    return _pol
@@ -35,3 +35,94 @@ def test_dump_toml_round_trip():
     assert parsed["b"]["arr"] == [1, "z"]
     assert parsed["b"]["flag"] is False
 
+
+
+def test_set_enable_remux_keeps_comments_and_handles_dotted_keys(tmp_path):
+    from twitchtool.cli import _set_enable_remux_in_config
+
+    cfg = tmp_path / "config.toml"
+    cfg.write_text("# keep me\n[record]\nenable_remux = true  # inline\nquality = \"best\"\n")
+    _set_enable_remux_in_config(cfg, False)
+    text = cfg.read_text()
+    assert "# keep me" in text and "# inline" in text
+    assert tomllib.loads(text)["record"] == {"enable_remux": False, "quality": "best"}
+
+    # Dotted keys are edited in place, next to an array of tables
+    dotted = "# keep me\nrecord.enable_remux = true # x\n[paths]\nqueue_dir = \"/q\" # c\n[[extra]]\nn = 1\n"
+    cfg.write_text(dotted)
+    _set_enable_remux_in_config(cfg, False)
+    assert cfg.read_text() == dotted.replace("= true # x", "= false # x")
+    cfg.write_text("record.quality = \"best\" # q\n[[extra]]\nn = 1\n")
+    _set_enable_remux_in_config(cfg, True)
+    text = cfg.read_text()
+    assert "# q" in text
+    assert tomllib.loads(text) == {"record": {"quality": "best", "enable_remux": True}, "extra": [{"n": 1}]}
+
+
+def test_set_enable_remux_leaves_unsupported_layout_untouched(tmp_path):
+    import pytest
+
+    from twitchtool.cli import _set_enable_remux_in_config
+
+    cfg = tmp_path / "config.toml"
+    # A quoted table key is valid TOML the text editor does not recognise
+    quoted = "# keep me\n\"record\" = { quality = \"best\" }\n"
+    cfg.write_text(quoted)
+    with pytest.raises(ValueError, match="edit it by hand"):
+        _set_enable_remux_in_config(cfg, False)
+    assert cfg.read_text() == quoted
+
+
+def test_load_config_file_caches_by_mtime(tmp_path):
+    import os
+
+    import pytest
+
+    from twitchtool.config import effective_config, load_config_file
+
+    cfg = tmp_path / "config.toml"
+    cfg.write_text("[record]\nenable_remux = true\n[extra]\nnames = [\"a\"]\n")
+    first = load_config_file(cfg)
+    assert load_config_file(cfg) is not first and dict(load_config_file(cfg)) == dict(first)
+    with pytest.raises(TypeError):
+        first["record"] = {}  # type: ignore[index]
+    # Effective configs are private copies, so mutating one leaves the cache intact
+    merged = effective_config(cfg)
+    merged["record"]["enable_remux"] = "mutated"
+    merged["extra"]["names"].append("b")
+    assert load_config_file(cfg) == {"record": {"enable_remux": True}, "extra": {"names": ["a"]}}
+
+    cfg.write_text("[record]\nenable_remux = false\n")
+    st = cfg.stat()
+    os.utime(cfg, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert load_config_file(cfg) == {"record": {"enable_remux": False}}
+
+
+def test_set_enable_remux_text_reports_noop_when_value_matches():
+    from twitchtool.cli import _set_enable_remux_in_config_text
+
+    table = "[record]\nenable_remux = false  # off\n"
+    assert _set_enable_remux_in_config_text(table, False) == (table, False)
+    inline = "record = { quality = \"best\", enable_remux = true }\n"
+    assert _set_enable_remux_in_config_text(inline, True) == (inline, False)
+    assert _set_enable_remux_in_config_text(table, True)[1] is True
+    commented = "[record] # main\nenable_remux = true\n"
+    assert _set_enable_remux_in_config_text(commented, True) == (commented, False)
+
+
+def test_merge_dicts_copies_only_touched_levels(monkeypatch):
+    import copy
+
+    from twitchtool.config import DEFAULTS, apply_env, merge_dicts
+
+    before = copy.deepcopy(DEFAULTS)
+    merged = merge_dicts(DEFAULTS, {"record": {"quality": "720p"}, "new": {"k": 1}})
+    assert merged["record"]["quality"] == "720p"
+    assert merged["record"] is not DEFAULTS["record"]
+    assert merged["storage"] is DEFAULTS["storage"]
+    assert merged["new"] == {"k": 1}
+
+    monkeypatch.setenv("DISK_FREE_MIN_GB", "3")
+    env_cfg = apply_env(merged)
+    assert env_cfg["storage"]["disk_free_min_bytes"] == 3 * 1024**3
+    assert DEFAULTS == before
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import logging
+import subprocess
+import time
+
+from twitchtool import encoder_daemon
+
+
+class _Slots:
+    def __init__(self, active: int = 0) -> None:
+        self.active = active
+
+    def active_count(self) -> int:
+        return self.active
+
+    def state_version(self):
+        return None
+
+
+def test_supervise_encode_returns_when_child_exits():
+    proc = encoder_daemon._spawn_encode(["sleep", "0.2"])
+    start = time.monotonic()
+    encoder_daemon._supervise_encode(proc, _Slots(), logging.getLogger("test"), lambda: False)
+    # The pidfd wakes us well before the next download check
+    assert time.monotonic() - start < encoder_daemon._SUPERVISE_INTERVAL
+    assert proc.wait() == 0
+
+
+def test_supervise_encode_terminates_child_on_shutdown():
+    proc = encoder_daemon._spawn_encode(["sh", "-c", "sleep 30 & wait"])
+    try:
+        encoder_daemon._supervise_encode(proc, _Slots(active=1), logging.getLogger("test"), lambda: True)
+        assert proc.wait(timeout=5) != 0
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def test_deferred_status_updates_coalesce_until_flush(tmp_path, monkeypatch):
+    import json
+
+    status = tmp_path / "encoder_status.json"
+    monkeypatch.setattr(encoder_daemon, "STATE_DIR", tmp_path)
+    monkeypatch.setattr(encoder_daemon, "STATUS_PATH", status)
+    monkeypatch.setattr(encoder_daemon, "_status_cache", {})
+
+    encoder_daemon._write_status({"current_job": "a.json"})
+    encoder_daemon._write_status({"current_job": None, "last_job": "a.json"}, defer=True)
+    assert json.loads(status.read_text())["current_job"] == "a.json"
+    encoder_daemon._flush_status()
+    assert json.loads(status.read_text()) == {"current_job": None, "last_job": "a.json"}
+
+
+def test_sweep_failed_jobs_removes_only_expired_failures(tmp_path):
+    import os
+
+    old_failed = tmp_path / "a.failed.json"
+    new_failed = tmp_path / "b.failed.json"
+    old_job = tmp_path / "c.json"
+    for p in (old_failed, new_failed, old_job):
+        p.write_text("{}")
+    stale = time.time() - encoder_daemon._FAILED_JOB_MAX_AGE - 60
+    os.utime(old_failed, (stale, stale))
+    os.utime(old_job, (stale, stale))
+
+    encoder_daemon._sweep_failed_jobs(tmp_path, logging.getLogger("test"))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.failed.json", "c.json"]
+    encoder_daemon._sweep_failed_jobs(tmp_path / "missing", logging.getLogger("test"))
+
+
+def test_runtime_state_probes_each_pid_once(tmp_path, monkeypatch):
+    import json
+
+    monkeypatch.setattr(encoder_daemon, "PID_PATH", tmp_path / "encoder.pid")
+    monkeypatch.setattr(encoder_daemon, "STATUS_PATH", tmp_path / "encoder_status.json")
+    (tmp_path / "encoder.pid").write_text(json.dumps({"pid": 4242, "started_at": "t0"}))
+    (tmp_path / "encoder_status.json").write_text(json.dumps({"pid": 4242, "current_job": "a.json"}))
+    probes = []
+    monkeypatch.setattr(encoder_daemon, "is_process_alive", lambda pid: probes.append(pid) or True)
+
+    state = encoder_daemon.encoder_runtime_state()
+    assert state["running"] and state["pid"] == 4242 and state["current_job"] == "a.json"
+    assert probes == [4242]
+
+
+def test_stop_encoder_daemon_returns_as_soon_as_target_exits(tmp_path, monkeypatch):
+    import json
+
+    monkeypatch.setattr(encoder_daemon, "STATE_DIR", tmp_path)
+    monkeypatch.setattr(encoder_daemon, "PID_PATH", tmp_path / "encoder.pid")
+    monkeypatch.setattr(encoder_daemon, "STATUS_PATH", tmp_path / "encoder_status.json")
+    proc = subprocess.Popen(["sleep", "30"])
+    try:
+        (tmp_path / "encoder.pid").write_text(json.dumps({"pid": proc.pid}))
+        start = time.monotonic()
+        result = encoder_daemon.stop_encoder_daemon(timeout=10.0)
+        assert result["result"] == "stopped" and result["signal"] == "SIGTERM"
+        assert time.monotonic() - start < 2.0
+        assert not (tmp_path / "encoder.pid").exists()
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def test_register_starts_status_from_canonical_fields(tmp_path, monkeypatch):
+    import json
+
+    status = tmp_path / "encoder_status.json"
+    monkeypatch.setattr(encoder_daemon, "STATE_DIR", tmp_path)
+    monkeypatch.setattr(encoder_daemon, "PID_PATH", tmp_path / "encoder.pid")
+    monkeypatch.setattr(encoder_daemon, "STATUS_PATH", status)
+    monkeypatch.setattr(encoder_daemon, "_status_cache", None)
+    status.write_text(json.dumps({"stopped_at": "earlier", "current_job": "old.json"}))
+
+    encoder_daemon.register_encoder_process()
+    data = json.loads(status.read_text())
+    assert "stopped_at" not in data and data["current_job"] is None and data["running"]
+    # Later updates merge into memory, not into whatever is on disk
+    status.write_text("{}")
+    encoder_daemon._write_status({"last_job": "a.json"})
+    assert json.loads(status.read_text())["pid"] == data["pid"]
+
+
+def test_encode_cmd_template_matches_a_direct_build():
+    from pathlib import Path
+
+    from twitchtool.ffmpeg_cmds import build_encode_cmd
+
+    opts = encoder_daemon.EncodeOptions(queue_dir=Path("/q"), threads=2)
+    template = encoder_daemon._encode_cmd_template(opts, ffmpeg="/usr/bin/ffmpeg", prefix=["nice", "-n", "10"])
+    direct = build_encode_cmd(
+        "/usr/bin/ffmpeg",
+        Path("/rec/a.mp4"),
+        Path("/rec/a_c.mp4"),
+        video_codec=opts.video_codec,
+        preset=opts.preset,
+        crf=opts.crf,
+        audio_bitrate=opts.audio_bitrate,
+        audio_rate=opts.audio_rate,
+        max_height=opts.height,
+        threads=opts.threads,
+        loglevel=opts.loglevel,
+        x265_params=opts.x265_params,
+        stats=False,
+        overwrite=True,
+    )
+    assert encoder_daemon._build_ffmpeg_cmd(template, Path("/rec/a.mp4"), Path("/rec/a_c.mp4")) == ["nice", "-n", "10", *direct]
+    # Jobs get their own copy; the template is never mutated
+    assert "\0input" in template[0]
+
+
+def test_free_bytes_is_cached_briefly(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+
+    calls = []
+    monkeypatch.setattr(encoder_daemon, "_disk_free_cache", {})
+    monkeypatch.setattr(encoder_daemon.shutil, "disk_usage", lambda p: calls.append(p) or SimpleNamespace(free=7))
+    assert encoder_daemon._free_bytes(str(tmp_path)) == 7
+    assert encoder_daemon._free_bytes(str(tmp_path)) == 7
+    assert calls == [str(tmp_path)]
+    monkeypatch.setattr(encoder_daemon, "_DISK_FREE_TTL", 0.0)
+    encoder_daemon._free_bytes(str(tmp_path))
+    assert len(calls) == 2
+
+
+def test_failed_sweep_loop_sweeps_then_exits_on_shutdown(tmp_path, monkeypatch):
+    import threading
+
+    swept = []
+    monkeypatch.setattr(encoder_daemon, "_sweep_failed_jobs", lambda d, log: swept.append(d))
+    stopping = threading.Event()
+    stopping.set()
+    encoder_daemon._failed_sweep_loop(tmp_path, logging.getLogger("test"), stopping)
+    assert swept == [tmp_path]
+
+
+def test_single_instance_lock_excludes_a_second_holder(tmp_path):
+    path = tmp_path / "encoderd.lock"
+    first = encoder_daemon.SingleInstanceLock(path)
+    second = encoder_daemon.SingleInstanceLock(path)
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+    second.release()
+
+
+def test_downloads_changed_skips_recount_only_for_idle_unchanged_state():
+    class _Versioned(_Slots):
+        version = 7
+
+        def state_version(self):
+            return self.version
+
+    gsm = _Versioned()
+    assert encoder_daemon._downloads_changed(gsm, None, 0) == (True, 7)
+    assert encoder_daemon._downloads_changed(gsm, 7, 0) == (False, 7)
+    # A nonzero count may hide a dead recorder, so it is always rechecked
+    assert encoder_daemon._downloads_changed(gsm, 7, 1) == (True, 7)
+    gsm.version = None
+    assert encoder_daemon._downloads_changed(gsm, 7, 0) == (True, None)
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+from twitchtool import ffmpeg_cmds
+from twitchtool.ffmpeg_cmds import build_encode_cmd, resolve_hwaccel
+
+
+def _encode(**overrides):
+    kwargs = dict(
+        video_codec="libx265",
+        preset="medium",
+        crf=26,
+        audio_bitrate="160k",
+        audio_rate=48_000,
+        max_height=480,
+        threads=1,
+        loglevel="error",
+    )
+    kwargs.update(overrides)
+    return build_encode_cmd("ffmpeg", Path("/in.ts"), Path("/out.mp4"), **kwargs)
+
+
+def test_encode_cmd_software_default():
+    cmd = _encode(x265_params="pools=4")
+    assert cmd[cmd.index("-c:v") + 1] == "libx265"
+    assert cmd[cmd.index("-x265-params") + 1] == "pools=4"
+    assert cmd[cmd.index("-threads") + 1] == "1"
+
+
+def test_encode_cmd_nvenc():
+    cmd = _encode(hwaccel="nvenc", x265_params="pools=4")
+    assert cmd[cmd.index("-c:v") + 1] == "hevc_nvenc"
+    assert cmd[cmd.index("-cq") + 1] == "26"
+    assert "-x265-params" not in cmd
+    assert "-crf" not in cmd
+
+
+def test_encode_cmd_vaapi_uploads_and_scales_on_gpu():
+    cmd = _encode(hwaccel="vaapi")
+    assert cmd.index("-vaapi_device") < cmd.index("-i")
+    vf = cmd[cmd.index("-vf") + 1]
+    assert vf.startswith("format=nv12,hwupload,scale_vaapi=w=-2:h=480")
+    assert "-pix_fmt" not in cmd
+
+
+def test_resolve_hwaccel(monkeypatch):
+    monkeypatch.setattr(ffmpeg_cmds, "detect_hwenc", lambda ffmpeg_bin: "qsv")
+    assert resolve_hwaccel("ffmpeg", "auto", "libx265") == "qsv"
+    # Hardware backends only replace libx265
+    assert resolve_hwaccel("ffmpeg", "auto", "libx264") == "none"
+    assert resolve_hwaccel("ffmpeg", "nvenc", "libx265") == "nvenc"
+    assert resolve_hwaccel("ffmpeg", None, "libx265") == "none"
+    with pytest.raises(ValueError):
+        resolve_hwaccel("ffmpeg", "cuda", "libx265")
+
+
+def test_encode_cmd_nvenc_full_gpu_pipeline():
+    cmd = _encode(hwaccel="nvenc", gpu_scaler="scale_cuda")
+    i = cmd.index("-i")
+    assert cmd[cmd.index("-hwaccel") + 1] == "cuda"
+    assert cmd.index("-hwaccel_output_format") < i
+    assert cmd[cmd.index("-vf") + 1] == "scale_cuda=w=-2:h=480:format=yuv420p"
+    # Forcing a CPU pixel format would download frames from the GPU again
+    assert "-pix_fmt" not in cmd
+
+
+def test_resolve_gpu_scaler(monkeypatch):
+    monkeypatch.setattr(ffmpeg_cmds, "list_hwaccels", lambda ffmpeg_bin: frozenset({"cuda", "vaapi"}))
+    monkeypatch.setattr(ffmpeg_cmds, "list_filters", lambda ffmpeg_bin: frozenset({"scale_npp", "scale_vaapi"}))
+    assert ffmpeg_cmds.resolve_gpu_scaler("ffmpeg", "nvenc") == "scale_npp"
+    assert ffmpeg_cmds.resolve_gpu_scaler("ffmpeg", "vaapi") == "scale_vaapi"
+    assert ffmpeg_cmds.resolve_gpu_scaler("ffmpeg", "qsv") is None
+    assert ffmpeg_cmds.resolve_gpu_scaler("ffmpeg", "none") is None
+
+
+def test_run_ffmpeg_returns_exit_code():
+    assert ffmpeg_cmds.run_ffmpeg(["true"]) == 0
+    assert ffmpeg_cmds.run_ffmpeg(["sh", "-c", "exit 3"]) == 3
+    assert ffmpeg_cmds.run_ffmpeg(["sh", "-c", "kill -TERM $$"]) == -15
+
+
+def test_remux_cmd_keeps_full_probe_and_generates_pts():
+    remux = ffmpeg_cmds.build_remux_cmd("ffmpeg", Path("in.ts"), Path("out.mp4"), loglevel="error")
+    # A short probe can miss an audio PID that first appears late in the TS
+    assert remux[remux.index("-probesize") + 1] == "2147483647"
+    assert remux[remux.index("-analyzeduration") + 1] == "2147483647"
+    assert remux[remux.index("-fflags") + 1] == "+discardcorrupt+genpts"
+    assert remux.index("-probesize") < remux.index("-i")
+    assert remux[remux.index("-seekable") + 1] == "0"
+    assert remux.index("-seekable") < remux.index("-i")
+
+    encode = _encode()
+    assert encode[encode.index("-probesize") + 1] == "2147483647"
+    assert encode[encode.index("-fflags") + 1] == "+discardcorrupt"
+
+
+def test_default_x265_params_scales_with_cores():
+    assert ffmpeg_cmds.default_x265_params(16) is None
+    assert ffmpeg_cmds.default_x265_params(32) == "pools=+:frame-threads=4"
+    assert ffmpeg_cmds.default_x265_params(128) == "pools=+:frame-threads=6"
+    assert ffmpeg_cmds.default_x265_params(24, whole_machine=False) == "pools=24:frame-threads=3"
+
+
+def test_run_ffmpeg_stops_on_fatal_stderr():
+    fatal = ["sh", "-c", "echo 'Error opening input: x.ts' >&2; exec sleep 30"]
+    assert ffmpeg_cmds.run_ffmpeg(fatal) == -15
+    # Exits 0 on its own (SIGTERM ignored) but still counts as a failure
+    empty = ["sh", "-c", "trap '' TERM; echo 'Output file is empty, nothing was encoded' >&2; exit 0"]
+    assert ffmpeg_cmds.run_ffmpeg(empty) == 1
+    assert ffmpeg_cmds.run_ffmpeg(["sh", "-c", "echo 'frame=  10' >&2"]) == 0
+
+
+def test_normalize_inputs_globs_and_dedupes(tmp_path, monkeypatch):
+    for name in ("a.ts", "b.ts", "c.mkv"):
+        (tmp_path / name).write_bytes(b"")
+    monkeypatch.chdir(tmp_path)
+
+    paths, unmatched = ffmpeg_cmds.normalize_inputs([str(tmp_path / "*.ts"), "a.ts", "./b.ts", "nope*.ts"])
+    assert paths[:2] == [tmp_path / "a.ts", tmp_path / "b.ts"]
+    assert unmatched == ["nope*.ts"]
+    assert paths[2] == tmp_path / "nope*.ts"
+
+    rel, _ = ffmpeg_cmds.normalize_inputs(["*.ts"])
+    assert rel == [tmp_path / "a.ts", tmp_path / "b.ts"]
+
+
+def test_normalize_inputs_globs_skip_dotfiles(tmp_path):
+    sub = tmp_path / "d"
+    sub.mkdir()
+    for name in ("vod.ts", ".hidden.ts", "._vod.ts"):
+        (sub / name).write_bytes(b"")
+    (tmp_path / ".cache").mkdir()
+    (tmp_path / ".cache" / "x.ts").write_bytes(b"")
+
+    # Last-component wildcard (scandir) and a wildcard directory (pathlib)
+    for pattern in (sub / "*.ts", tmp_path / "*" / "*.ts"):
+        paths, _ = ffmpeg_cmds.normalize_inputs([str(pattern)])
+        assert paths == [sub / "vod.ts"]
+    # An explicit leading dot still matches hidden names, as with glob.glob
+    paths, _ = ffmpeg_cmds.normalize_inputs([str(sub / ".*.ts"), str(tmp_path / ".c*" / "*.ts")])
+    assert paths == [sub / "._vod.ts", sub / ".hidden.ts", tmp_path / ".cache" / "x.ts"]
+
+
+def test_encode_cmd_audio_copy():
+    cmd = _encode(audio_copy=True)
+    assert cmd[cmd.index("-c:a") + 1] == "copy"
+    assert cmd[cmd.index("-bsf:a") + 1] == "aac_adtstoasc"
+    assert "-b:a" not in cmd and "-af" not in cmd
+    assert cmd[-1] == "/out.mp4"
+
+
+def test_batch_encode_cmd_maps_each_input_to_its_output():
+    pairs = [(Path("/a.ts"), Path("/a_c.mp4")), (Path("/b.ts"), Path("/b_c.mp4"))]
+    cmd = ffmpeg_cmds.build_batch_encode_cmd(
+        "ffmpeg",
+        pairs,
+        loglevel="error",
+        audio_copy=[False, True],
+        video_codec="libx265",
+        preset="medium",
+        crf=26,
+        audio_bitrate="160k",
+        audio_rate=48_000,
+        max_height=480,
+        threads=None,
+    )
+    assert [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-i"] == ["/a.ts", "/b.ts"]
+    assert cmd.index("/b.ts") < cmd.index("0:v:0") < cmd.index("/a_c.mp4") < cmd.index("1:v:0") < cmd.index("/b_c.mp4")
+    first, second = cmd[: cmd.index("/a_c.mp4")], cmd[cmd.index("/a_c.mp4") :]
+    assert first[first.index("-c:a") + 1] == "aac"
+    assert second[second.index("-c:a") + 1] == "copy"
+    assert cmd.count("-c:v") == 2
+
+
+def test_remux_encode_cmd_demuxes_once_for_both_outputs():
+    cmd = ffmpeg_cmds.build_remux_encode_cmd(
+        "ffmpeg",
+        Path("/in.ts"),
+        Path("/in.mp4"),
+        Path("/in_c.mp4"),
+        loglevel="error",
+        video_codec="libx265",
+        preset="medium",
+        crf=26,
+        audio_bitrate="160k",
+        audio_rate=48_000,
+        max_height=480,
+        threads=None,
+    )
+    assert cmd.count("-i") == 1
+    remux, encode = cmd[: cmd.index("/in.mp4") + 1], cmd[cmd.index("/in.mp4") + 1 :]
+    assert remux[remux.index("-c") + 1] == "copy" and "-vf" not in remux
+    assert encode[encode.index("-c:v") + 1] == "libx265" and encode[-1] == "/in_c.mp4"
+
+
+def test_encode_cmd_nvenc_preset_and_tune():
+    cmd = _encode(hwaccel="nvenc", preset="slow", nvenc_preset="p1", nvenc_tune="ll")
+    assert cmd[cmd.index("-preset") + 1] == "p1"
+    assert cmd[cmd.index("-tune") + 1] == "ll"
+    assert "slow" not in cmd
+
+
+def test_normalize_inputs_folds_links_to_the_same_file(tmp_path):
+    real = tmp_path / "vod.ts"
+    real.write_bytes(b"")
+    (tmp_path / "alias.ts").symlink_to(real)
+    os.link(real, tmp_path / "hard.ts")
+
+    paths, _ = ffmpeg_cmds.normalize_inputs([str(real), str(tmp_path / "alias.ts"), str(tmp_path / "hard.ts")])
+    assert paths == [real]
+
+
+def test_encode_cmd_nvenc_cuvid_resizes_in_decoder():
+    assert ffmpeg_cmds.cuvid_resize(1920, 1080, 480) == "854x480"
+    assert ffmpeg_cmds.cuvid_resize(854, 480, 720) is None
+
+    cmd = _encode(hwaccel="nvenc", cuvid_decoder="h264_cuvid", cuvid_resize="854x480")
+    i = cmd.index("-i")
+    assert cmd[cmd.index("-c:v") + 1] == "h264_cuvid" and cmd.index("-c:v") < i
+    assert cmd[cmd.index("-resize") + 1] == "854x480"
+    assert cmd[cmd.index("-c:v", i) + 1] == "hevc_nvenc"
+    assert "-vf" not in cmd and "-pix_fmt" not in cmd
+
+
+def test_normalize_inputs_glob_folds_links_without_extra_stats(tmp_path, monkeypatch):
+    real = tmp_path / "a.ts"
+    real.write_bytes(b"")
+    (tmp_path / "b.ts").symlink_to(real)
+    os.link(real, tmp_path / "c.ts")
+    (tmp_path / "d.ts").write_bytes(b"")
+
+    stats = []
+    orig_stat = os.stat
+    monkeypatch.setattr(ffmpeg_cmds.os, "stat", lambda p, *a, **k: stats.append(str(p)) or orig_stat(p, *a, **k))
+    paths, unmatched = ffmpeg_cmds.normalize_inputs([str(tmp_path / "*.ts")])
+    assert paths == [real, tmp_path / "d.ts"] and not unmatched
+    # The pattern itself, its directory, and the one symlink
+    assert sorted(stats) == sorted([str(tmp_path / "*.ts"), str(tmp_path), str(tmp_path / "b.ts")])
+
+
+def test_run_ffmpeg_returns_when_child_exits_even_if_stderr_stays_open():
+    import time
+
+    start = time.monotonic()
+    # The backgrounded sleep inherits stderr and keeps the pipe open
+    assert ffmpeg_cmds.run_ffmpeg(["sh", "-c", "sleep 3 & exit 4"]) == 4
+    assert time.monotonic() - start < 2.0
+
+
+def test_normalize_inputs_directory_matches_rglob_and_folds_hardlinks(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.ts").write_bytes(b"")
+    (tmp_path / "sub" / "b.ts").write_bytes(b"")
+    os.link(tmp_path / "a.ts", tmp_path / "sub" / "a_again.ts")
+    (tmp_path / "loop").symlink_to(tmp_path / "sub")
+
+    paths, _ = ffmpeg_cmds.normalize_inputs([str(tmp_path)])
+    # Symlinked directories are not followed, as with Path.rglob
+    assert paths == [tmp_path / "a.ts", tmp_path / "sub" / "b.ts"]
+
+
+def test_resumed_segment_encode_counts_time_from_the_seek():
+    fresh = _encode(segment_seconds=30)
+    resumed = _encode(seek=60, segment_seconds=30, segment_start=2)
+    # Without -copyts both runs start output time at 0, so the t=0 based
+    # keyframe/segment grid puts seg_N at seek + N*30 in either case
+    for cmd in (fresh, resumed):
+        assert "-copyts" not in cmd and "-start_at_zero" not in cmd
+        assert cmd[cmd.index("-force_key_frames") + 1] == "expr:gte(t,n_forced*30)"
+        assert cmd[cmd.index("-segment_time") + 1] == "30"
+    assert resumed[resumed.index("-ss") + 1] == "60"
+    assert resumed.index("-ss") < resumed.index("-i")
+    assert resumed[resumed.index("-segment_start_number") + 1] == "2"
+    assert "first_pts=0" not in resumed[resumed.index("-af") + 1]
+    # Whole-file encodes keep the source timestamps
+    assert "-copyts" in _encode()
@@ -65,3 +65,15 @@ def test_cleanup_removes_unlocked_owner(tmp_path: Path):
     removed = gsm.cleanup_stale_owners()
     assert removed == 1
     assert not op.exists()
+
+
+def test_state_version_tracks_owner_files(tmp_path: Path):
+    slots = tmp_path / "slots_version"
+    gsm = GlobalSlotManager(1, slots_dir=slots)
+    old = 1_000_000_000
+    os.utime(slots, ns=(old, old))
+    assert gsm.state_version() == old
+    gsm.acquire_slot("alice", fail_fast=True)
+    # Fresh changes are reported as untrusted until the timestamp settles
+    assert gsm.state_version() is None
+    gsm.release_slot()
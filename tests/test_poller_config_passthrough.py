@@ -1,51 +1,22 @@
 from __future__ import annotations
 
 import asyncio
+import signal
 from pathlib import Path
 
-import pytest
-
 from twitchtool.poller import PollerOptions
 
 
-class FakeProc:
-    def __init__(self, rc: int = 0):
-        self.returncode = None
-        self._rc = rc
-
-    async def wait(self):
-        await asyncio.sleep(0.001)
-        self.returncode = self._rc
-        return self._rc
-
-    def kill(self):
-        self.returncode = -9
-
-
-@pytest.mark.asyncio
-async def test_poller_passes_config_to_recorders(monkeypatch, tmp_path: Path):
-    # Import inside test to ensure monkeypatches apply to the module state
-    from twitchtool import poller as pol
-
-    # Avoid touching real state files
-    monkeypatch.setattr(pol, "_register_poller_process", lambda interval, logger: "now")
-    monkeypatch.setattr(pol, "_clear_pid_file", lambda: None)
-    monkeypatch.setattr(pol, "_write_status", lambda update: None)
-
-    # Make probe fast and successful
-    monkeypatch.setattr(pol, "which", lambda _: "/usr/bin/streamlink")
-
-    async def fake_cpe(*args, **kwargs):
-        return FakeProc(0)
+async def test_poller_passes_config_to_recorders(patched_poller, monkeypatch, tmp_path: Path):
+    pol = patched_poller
 
-    monkeypatch.setattr(pol.asyncio, "create_subprocess_exec", fake_cpe)
+    async def fake_run_probe(cmd, timeout):
+        return 0
 
-    # Ensure the download command resolves to an absolute path
-    monkeypatch.setattr(pol.shutil, "which", lambda exe: "/usr/bin/twitchtool" if exe == "twitchtool" else None)
+    monkeypatch.setattr(pol, "_run_probe", fake_run_probe)
 
     # Simulate one user, live, not locked
     monkeypatch.setattr(pol, "_load_users", lambda path: ["gooduser"])
-    monkeypatch.setattr(pol.PerUserLock, "is_user_locked", staticmethod(lambda user: False))
 
     class DummyGSM:
         def __init__(self, *args, **kwargs):
@@ -60,12 +31,13 @@ async def test_poller_passes_config_to_recorders(monkeypatch, tmp_path: Path):
 
     def fake_popen(cmd, *, logfile):
         launched["cmd"] = list(cmd)
-        # Stop after first launch by raising an exception to break out
-        raise RuntimeError("stop after first launch")
+        # Stop after the first launch the way SIGTERM would: through the
+        # poller's own handler, so it finishes the cycle and returns
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
 
     monkeypatch.setattr(pol, "_detached_popen", fake_popen)
 
-    cfg_path = (tmp_path / "config.toml").resolve()
+    cfg_path = tmp_path / "config.toml"
     cfg_path.write_text("record = {}\n", encoding="utf-8")
 
     opts = PollerOptions(
@@ -81,8 +53,12 @@ async def test_poller_passes_config_to_recorders(monkeypatch, tmp_path: Path):
         config_path=cfg_path,
     )
 
-    with pytest.raises(RuntimeError):
-        await pol.poller(opts)
+    prev = signal.getsignal(signal.SIGINT), signal.getsignal(signal.SIGTERM)
+    try:
+        assert await asyncio.wait_for(pol.poller(opts), timeout=5) == 0
+    finally:
+        signal.signal(signal.SIGINT, prev[0])
+        signal.signal(signal.SIGTERM, prev[1])
 
     # Verify --config is passed through to the recorder invocation
     cmd = launched.get("cmd")
@@ -1,37 +1,34 @@
 from __future__ import annotations
 
-import asyncio
+import json
 from types import SimpleNamespace
 
-import pytest
-
+from twitchtool import poller
 from twitchtool.poller import _probe_user_live
 
 
-class FakeProc:
-    def __init__(self, rc: int):
-        self.returncode = None
-        self._rc = rc
+async def test_probe_user_live(patched_poller, monkeypatch):
+    async def fake_run_probe(cmd, timeout):
+        return 0 if "https://twitch.tv/gooduser" in cmd else 1
+
+    monkeypatch.setattr(patched_poller, "_run_probe", fake_run_probe)
+    assert await _probe_user_live("gooduser", "best", 1) is True
+    assert await _probe_user_live("baduser", "best", 1) is False
 
-    async def wait(self):
-        await asyncio.sleep(0.01)
-        self.returncode = self._rc
-        return self._rc
 
-    def kill(self):
-        self.returncode = -9
+async def test_run_probe_reports_exit_code_or_timeout():
+    assert await poller._run_probe(["sh", "-c", "exit 3"], 5) == 3
+    assert await poller._run_probe(["sleep", "5"], 0.1) is None
 
 
-@pytest.mark.asyncio
-async def test_probe_user_live(monkeypatch):
-    async def fake_cpe(*args, **kwargs):
-        # Determine rc by substring match against the constructed command
-        joined = " ".join(str(a) for a in args)
-        rc = 0 if "gooduser" in joined else 1
-        return FakeProc(rc)
+def test_poller_runtime_state_probes_each_pid_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(poller, "PID_PATH", tmp_path / "poller.pid")
+    monkeypatch.setattr(poller, "STATUS_PATH", tmp_path / "poller_status.json")
+    (tmp_path / "poller.pid").write_text(json.dumps({"pid": 4242, "interval": 60}))
+    (tmp_path / "poller_status.json").write_text(json.dumps({"pid": 4242, "last_poll_ts": None}))
+    probes = []
+    monkeypatch.setattr(poller, "is_process_alive", lambda pid: probes.append(pid) or True)
 
-    monkeypatch.setattr("twitchtool.poller.asyncio.create_subprocess_exec", fake_cpe)
-    # force which("streamlink") True
-    monkeypatch.setattr("twitchtool.poller.which", lambda _: "/usr/bin/streamlink")
-    assert await _probe_user_live("gooduser", "best", 1) is True
-    assert await _probe_user_live("baduser", "best", 1) is False
+    state = poller.poller_runtime_state()
+    assert state["running"] and state["pid"] == 4242
+    assert probes == [4242]
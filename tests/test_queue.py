@@ -1,13 +1,22 @@
 from __future__ import annotations
 
+import os
 from pathlib import Path
 
+import pytest
+
 from twitchtool.queue import Job, list_jobs, oldest_job, write_job
 
 
+@pytest.fixture(autouse=True)
+def _skip_fsync(monkeypatch):
+    # Job files are written atomically with an fsync; durability is not
+    # under test here, so keep these writes in the page cache
+    monkeypatch.setattr(os, "fsync", lambda fd: None)
+
+
 def test_queue_write_and_sort(tmp_path: Path):
     base = tmp_path / "queue"
-    base.mkdir()
     a = Job(input=str(tmp_path / "inA.mp4"), output=str(tmp_path / "outA.mp4"))
     b = Job(input=str(tmp_path / "inB.mp4"), output=str(tmp_path / "outB.mp4"))
     pa = write_job(base, a)
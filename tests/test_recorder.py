@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from twitchtool.recorder import GracefulTerm, _start_part, _wait_part
+
+
+def _installed_term() -> GracefulTerm:
+    gt = GracefulTerm()
+    gt.install(logging.getLogger("test"))
+    return gt
+
+
+def test_wait_part_returns_when_child_exits():
+    gt = GracefulTerm()
+    proc = _start_part(["sleep", "0.2"])
+    start = time.monotonic()
+    assert _wait_part(proc, gt) == 0
+    assert time.monotonic() - start < 1.0
+
+
+def test_wait_part_interrupts_child_on_stop_signal():
+    gt = _installed_term()
+    proc = _start_part(["sleep", "30"])
+    try:
+        threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM)).start()
+        start = time.monotonic()
+        assert _wait_part(proc, gt) != 0
+        # The wakeup pipe ends the wait at once rather than on a 1s tick
+        assert time.monotonic() - start < 0.9
+        assert gt.stop
+    finally:
+        proc.kill()
+        proc.wait()
+        gt.close()
+
+
+def test_wait_part_interrupts_the_whole_process_group():
+    gt = _installed_term()
+    # A shell waits out its foreground child unless that child is signalled too
+    proc = _start_part(["sh", "-c", "sleep 30; echo done"])
+    try:
+        threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM)).start()
+        start = time.monotonic()
+        assert _wait_part(proc, gt) != 0
+        assert time.monotonic() - start < 2
+    finally:
+        proc.kill()
+        proc.wait()
+        gt.close()
+
+
+def test_graceful_sleep_ends_early_on_stop():
+    gt = _installed_term()
+    try:
+        threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGINT)).start()
+        start = time.monotonic()
+        gt.sleep(30)
+        assert time.monotonic() - start < 5
+        assert gt.stop
+    finally:
+        gt.close()
+
+
+def test_graceful_term_close_restores_handlers_and_pipe():
+    prev = signal.getsignal(signal.SIGTERM)
+    gt = _installed_term()
+    r = gt.fileno()
+    assert signal.getsignal(signal.SIGTERM) is not prev
+    gt.close()
+    assert signal.getsignal(signal.SIGTERM) is prev
+    assert gt.fileno() is None
+    with pytest.raises(OSError):
+        os.fstat(r)
+
+
+def test_concat_remux_writes_mp4_from_parts_in_one_run(tmp_path):
+    from twitchtool.recorder import _ffmpeg_concat_remux
+
+    calls = tmp_path / "calls.log"
+    fake = tmp_path / "ffmpeg"
+    # Record the args and the concat list, then write the last arg as output
+    fake.write_text(
+        "#!/bin/sh\n"
+        'echo "$*" >> "%s"\n'
+        'prev=""; for arg; do [ "$prev" = "-i" ] && cat "$arg" >> "%s"; prev="$arg"; done\n'
+        'for last; do :; done\nprintf data > "$last"\n' % (calls, calls)
+    )
+    fake.chmod(0o755)
+    parts = [tmp_path / "a_part01.ts", tmp_path / "it's_part02.ts"]
+    out = tmp_path / "a.mp4"
+
+    assert _ffmpeg_concat_remux(parts, out, "error", str(fake)) == 0
+    cmd, *listed = calls.read_text().splitlines()
+    assert "-f concat -safe 0" in cmd and "-c copy" in cmd and cmd.endswith(str(out))
+    assert listed == [f"file '{parts[0]}'", "file '%s'" % str(parts[1]).replace("'", "'\\''")]
+    assert out.read_bytes() == b"data"
+    # The temporary concat list is removed afterwards
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.mp4", "calls.log", "ffmpeg"]
+
+
+def test_fmt_basename_uses_local_start_minute():
+    from datetime import datetime
+
+    from twitchtool.recorder import _fmt_basename
+
+    start = 1_700_000_000.9
+    expected = datetime.fromtimestamp(start).strftime("%Y-%m-%d_%H-%M")
+    assert _fmt_basename("djalpha", start) == f"djalpha_{expected}"
+
+
+def test_escalate_sends_each_due_signal_once(monkeypatch):
+    from twitchtool import recorder
+
+    sent = []
+    monkeypatch.setattr(recorder.os, "killpg", lambda pgid, sig: sent.append(sig))
+
+    class _Proc:
+        pid = 4242
+        returncode = None
+
+        def poll(self):
+            return self.returncode
+
+    proc = _Proc()
+    now = time.monotonic()
+    assert recorder._escalate(proc, now, 0)[0] == 1
+    assert recorder._escalate(proc, now, 1)[0] == 1
+    count, next_in = recorder._escalate(proc, now - 6, 1)
+    assert count == 2 and 3.9 < next_in <= 4
+    proc.returncode = 0
+    # Nothing more goes out once the part has exited
+    assert recorder._escalate(proc, now - 11, 2)[0] == 2
+    assert sent == [signal.SIGINT, signal.SIGTERM]
+
+
+def test_move_final_copies_only_across_filesystems(tmp_path, monkeypatch, caplog):
+    import errno
+
+    from twitchtool import recorder
+
+    src = tmp_path / "temp.mp4"
+    src.write_bytes(b"data")
+    recorder._move_final(src, tmp_path / "same.mp4", logging.getLogger("test"))
+    assert (tmp_path / "same.mp4").read_bytes() == b"data" and not src.exists()
+
+    src.write_bytes(b"more")
+
+    def cross_device(a, b):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(recorder.os, "replace", cross_device)
+    with caplog.at_level(logging.WARNING):
+        recorder._move_final(src, tmp_path / "other.mp4", logging.getLogger("test"))
+    assert (tmp_path / "other.mp4").read_bytes() == b"more" and not src.exists()
+    assert "another filesystem" in caplog.text
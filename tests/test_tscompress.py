@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+import pytest
+
+from twitchtool.cli import main
+from twitchtool.tscompress import TsCompressOptions, _largest_first, _prefetch, _worker_cpus, run_tscompress
+
+# Fake ffmpeg body that writes "data" to every .mp4 output on its command line
+_WRITE_MP4S = 'for arg; do case "$arg" in *.mp4) printf data > "$arg";; esac; done\n'
+
+
+def _fake_ffmpeg(tmp_path: Path, body: str) -> Path:
+    fake = tmp_path / "ffmpeg"
+    fake.write_text("#!/bin/sh\n" + body)
+    fake.chmod(0o755)
+    return fake
+
+
+def _make_ts(tmp_path: Path, *names: str, size: int = 188) -> list[Path]:
+    inputs = []
+    for name in names:
+        p = tmp_path / name
+        p.write_bytes(b"\x47" * size)
+        inputs.append(p)
+    return inputs
+
+
+def test_run_tscompress_dry_run_parallel(tmp_path: Path):
+    inputs = _make_ts(tmp_path, "a.ts", "b.ts")
+
+    opts = TsCompressOptions(ffmpeg_bin="/bin/true", dry_run=True, stats=False, jobs=2)
+    assert run_tscompress(inputs, opts) == 0
+    # Dry runs never produce outputs
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.ts", "b.ts"]
+
+
+def test_run_tscompress_reports_first_failure(tmp_path: Path):
+    missing = tmp_path / "missing.ts"
+    not_ts = tmp_path / "clip.mkv"
+    not_ts.write_bytes(b"")
+
+    opts = TsCompressOptions(ffmpeg_bin="/bin/true", dry_run=True, stats=False, jobs=1)
+    assert run_tscompress([missing, not_ts], opts) == 1
+
+
+def test_run_tscompress_caps_concurrent_gpu_encodes(tmp_path: Path):
+    log = tmp_path / "encodes.log"
+    fake = _fake_ffmpeg(
+        tmp_path,
+        'for last; do :; done\n'
+        'case "$*" in *hevc_nvenc*) echo start >> "%s"; sleep 0.2; echo end >> "%s";; esac\n'
+        'printf data > "$last"\n' % (log, log),
+    )
+    inputs = _make_ts(tmp_path, "a.ts", "b.ts", "c.ts")
+
+    opts = TsCompressOptions(ffmpeg_bin=str(fake), hwaccel="nvenc", stats=False, jobs=3, gpu_jobs=1)
+    assert run_tscompress(inputs, opts) == 0
+    # With one GPU slot every encode finishes before the next one starts
+    assert log.read_text().split() == ["start", "end"] * 3
+
+
+def test_run_tscompress_fused_skips_intermediate_remux(tmp_path: Path):
+    calls = tmp_path / "calls.log"
+    fake = _fake_ffmpeg(tmp_path, 'for last; do :; done\necho "$*" >> "%s"\nprintf data > "$last"\n' % calls)
+    [src] = _make_ts(tmp_path, "vod.ts")
+
+    opts = TsCompressOptions(ffmpeg_bin=str(fake), stats=False, fuse_remux_encode=True, delete_input_on_success=True)
+    assert run_tscompress([src], opts) == 0
+    lines = calls.read_text().splitlines()
+    assert len(lines) == 1 and f"-i {src}" in lines[0]
+    assert not (tmp_path / "vod.mp4").exists()
+    assert (tmp_path / "vod_compressed.mp4").exists()
+    # delete-input-on-success targets the intermediate; the .ts needs --delete-source
+    assert src.exists()
+
+
+def test_prefetch_ignores_unreadable_paths(tmp_path: Path):
+    [data] = _make_ts(tmp_path, "next.ts")
+    _prefetch(data)
+    _prefetch(tmp_path / "gone.ts")
+
+
+def test_run_tscompress_batch_uses_one_ffmpeg_per_group(tmp_path: Path):
+    calls = tmp_path / "calls.log"
+    fake = _fake_ffmpeg(tmp_path, 'echo run >> "%s"\n' % calls + _WRITE_MP4S)
+    inputs = _make_ts(tmp_path, "a.ts", "b.ts", "c.ts")
+
+    opts = TsCompressOptions(ffmpeg_bin=str(fake), stats=False, batch=2, jobs=1)
+    assert run_tscompress(inputs, opts) == 0
+    assert calls.read_text().split() == ["run", "run"]
+    assert all((tmp_path / f"{n}_compressed.mp4").exists() for n in "abc")
+
+
+def test_preallocated_output_keeps_size_and_gets_trimmed(tmp_path: Path):
+    # -truncate 0 means ffmpeg overwrites in place; emulate with dd conv=notrunc
+    fake = _fake_ffmpeg(tmp_path, 'for last; do :; done\nprintf data | dd of="$last" conv=notrunc 2>/dev/null\n')
+    [src] = _make_ts(tmp_path, "vod.ts", size=188 * 1000)
+    final = tmp_path / "vod_compressed.mp4"
+    final.write_bytes(b"stale output from an earlier run")
+
+    opts = TsCompressOptions(
+        ffmpeg_bin=str(fake), stats=False, fuse_remux_encode=True, overwrite=True, preallocate=True
+    )
+    assert run_tscompress([src], opts) == 0
+    assert final.read_bytes() == b"data"
+
+
+def test_run_tscompress_resume_keeps_finished_segments(tmp_path: Path):
+    calls = tmp_path / "calls.log"
+    fake = _fake_ffmpeg(
+        tmp_path,
+        'echo "$*" >> "%s"\n'
+        "for last; do :; done\n"
+        'case "$*" in\n'
+        '  *"-f segment"*) n=$(echo "$*" | sed "s/.*-segment_start_number \\([0-9]*\\).*/\\1/")\n'
+        '     printf seg > "$(printf "$last" "$n")"; printf seg > "$(printf "$last" $((n + 1)))";;\n'
+        '  *) printf joined > "$last";;\n'
+        "esac\n" % calls,
+    )
+    [src] = _make_ts(tmp_path, "vod.ts")
+    parts = tmp_path / ".vod_compressed.parts"
+    parts.mkdir()
+    for idx, data in enumerate([b"a", b"b", b"partial"]):
+        (parts / f"seg_{idx:05d}.mp4").write_bytes(data)
+
+    opts = TsCompressOptions(ffmpeg_bin=str(fake), stats=False, fuse_remux_encode=True, resume=True)
+    assert run_tscompress([src], opts) == 0
+
+    encode, concat = calls.read_text().splitlines()
+    # The last saved segment may be truncated, so it is redone from 60s
+    assert "-ss 60 -i" in encode and "-segment_start_number 2" in encode
+    # Output time restarts at the seek, so seg_2 begins at 60s of the source
+    assert "-copyts" not in encode
+    assert "-f concat" in concat
+    assert (tmp_path / "vod_compressed.mp4").read_bytes() == b"joined"
+    assert not parts.exists()
+
+
+def test_largest_first_orders_units_by_size(tmp_path: Path):
+    sizes = (("small.ts", 1), ("big.ts", 300), ("mid.ts", 50))
+    paths = [_make_ts(tmp_path, name, size=size)[0] for name, size in sizes]
+    assert _largest_first(paths) == [1, 2, 0]
+    # Batch groups are ranked by combined size; missing files count as empty
+    assert _largest_first([[paths[0], paths[2]], [paths[1]], [tmp_path / "gone.ts"]]) == [1, 0, 2]
+
+
+def test_run_tscompress_caps_workers_by_threads(tmp_path: Path, monkeypatch, caplog):
+    inputs = _make_ts(tmp_path, "a.ts", "b.ts", "c.ts")
+
+    monkeypatch.setattr("os.cpu_count", lambda: 4)
+    opts = TsCompressOptions(ffmpeg_bin="/bin/true", dry_run=True, stats=False, jobs=3, threads=4)
+    with caplog.at_level(logging.INFO, logger="twitchtool.tscompress"):
+        assert run_tscompress(inputs, opts) == 0
+    plans = [r.extra for r in caplog.records if getattr(r, "extra", {}).get("event") == "parallel-plan"]
+    assert plans == [{"event": "parallel-plan", "workers": 1, "threads_per_job": 4}]
+
+
+def test_run_tscompress_skips_remux_when_final_exists(tmp_path: Path):
+    calls = tmp_path / "calls.log"
+    fake = _fake_ffmpeg(tmp_path, 'echo run >> "%s"\n' % calls)
+    [src] = _make_ts(tmp_path, "vod.ts")
+    (tmp_path / "vod_compressed.mp4").write_bytes(b"done")
+
+    opts = TsCompressOptions(ffmpeg_bin=str(fake), stats=False)
+    assert run_tscompress([src], opts) == 0
+    assert not calls.exists()
+    assert not (tmp_path / "vod.mp4").exists()
+
+
+def test_run_tscompress_keep_remux_uses_one_ffmpeg_run(tmp_path: Path):
+    calls = tmp_path / "calls.log"
+    fake = _fake_ffmpeg(tmp_path, 'echo run >> "%s"\n' % calls + _WRITE_MP4S)
+    [src] = _make_ts(tmp_path, "vod.ts")
+
+    opts = TsCompressOptions(ffmpeg_bin=str(fake), stats=False)
+    assert run_tscompress([src], opts) == 0
+    assert calls.read_text().split() == ["run"]
+    assert (tmp_path / "vod.mp4").exists() and (tmp_path / "vod_compressed.mp4").exists()
+
+
+def test_worker_cpus_are_disjoint_shares():
+    allowed = [0, 1, 2, 3, 4, 5, 8, 9]
+    shares = [_worker_cpus(allowed, slot, 3) for slot in range(3)]
+    assert shares == [{0, 1}, {2, 3}, {4, 5}]
+    # More workers than CPUs wrap around instead of getting an empty mask
+    assert _worker_cpus([0, 1], 3, 4) == {1}
+
+
+def test_cli_checks_and_file_events_share_one_logger(tmp_path: Path, caplog):
+    with caplog.at_level(logging.INFO, logger="twitchtool.tscompress"), pytest.raises(SystemExit) as exc:
+        main(["tscompress", "--json-logs", "--ffmpeg", "/bin/true", str(tmp_path / "none" / "*.ts")])
+    assert exc.value.code == 1
+    # The CLI's own check and the per-file skip come out as the same kind of record
+    events = [(r.name, r.levelname, r.extra["event"]) for r in caplog.records]
+    assert events == [
+        ("twitchtool.tscompress", "WARNING", "no-match"),
+        ("twitchtool.tscompress", "WARNING", "skip-missing"),
+    ]
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+from twitchtool.utils import wait_for_exit
+
+
+def test_wait_for_exit_returns_promptly_when_process_ends():
+    proc = subprocess.Popen(["sleep", "0.2"])
+    start = time.monotonic()
+    assert wait_for_exit(proc.pid, 5.0)
+    assert time.monotonic() - start < 2.0
+    proc.wait()
+
+
+def test_wait_for_exit_times_out_on_live_process():
+    proc = subprocess.Popen(["sleep", "30"])
+    try:
+        assert not wait_for_exit(proc.pid, 0.2)
+    finally:
+        proc.kill()
+        proc.wait()
+    # Reaped pids are simply gone
+    assert wait_for_exit(proc.pid, 0.1)
+
+
+def test_process_handle_signals_and_awaits_the_same_process():
+    import signal
+
+    import pytest
+
+    from twitchtool.utils import ProcessHandle
+
+    proc = subprocess.Popen(["sleep", "30"])
+    with ProcessHandle(proc.pid) as handle:
+        handle.send_signal(signal.SIGTERM)
+        assert handle.wait(5.0)
+    assert proc.wait() == -signal.SIGTERM
+    with pytest.raises(ProcessLookupError):
+        ProcessHandle(proc.pid)
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_json_round_trip_with_and_without_orjson(tmp_path: Path, monkeypatch, fast):
+    from twitchtool import utils
+
+    if not fast:
+        monkeypatch.setattr(utils, "orjson", None)
+    elif utils.orjson is None:
+        pytest.skip("orjson not installed")
+    path = tmp_path / "state" / "status.json"
+    data = {"user": "café", "pid": 42, "nested": {"ok": True, "items": [1, 2]}}
+    utils.atomic_write_json(path, data)
+    assert utils.read_json(path) == data
+    assert json.loads(path.read_text(encoding="utf-8")) == data
+    assert [p.name for p in path.parent.iterdir()] == ["status.json"]
+
+
+def test_which_memoizes_hits_but_retries_misses(monkeypatch):
+    from twitchtool import utils
+
+    calls = []
+
+    def fake_which(cmd):
+        calls.append(cmd)
+        return "/usr/bin/tool" if len(calls) > 1 else None
+
+    monkeypatch.setattr(utils, "_WHICH_HITS", {})
+    monkeypatch.setattr(utils.shutil, "which", fake_which)
+    assert utils.which("tool") is None
+    assert utils.which("tool") == "/usr/bin/tool"
+    assert utils.which("tool") == "/usr/bin/tool"
+    assert calls == ["tool", "tool"]
+
+
+def test_is_valid_twitch_username_bounds():
+    from twitchtool.utils import is_valid_twitch_username
+
+    assert is_valid_twitch_username("abc")
+    assert is_valid_twitch_username("a_" + "b" * 23)
+    assert not is_valid_twitch_username("ab")
+    assert not is_valid_twitch_username("a" * 26)
+    assert not is_valid_twitch_username("abc\n")
+    assert not is_valid_twitch_username("bad-name")
+
+
+def test_json_formatter_timestamp_is_utc_iso():
+    import logging
+    from datetime import datetime
+
+    from twitchtool.utils import JsonFormatter
+
+    fmt = JsonFormatter()
+    for created in (1_700_000_000.25, 1_700_000_000.75, 1_700_000_001.0):
+        record = logging.LogRecord("t", logging.INFO, __file__, 1, "hello", None, None)
+        record.created = created
+        payload = json.loads(fmt.format(record))
+        ts = datetime.fromisoformat(payload["ts"])
+        assert ts.utcoffset().total_seconds() == 0
+        assert abs(ts.timestamp() - created) < 1e-5
+
+
+def test_run_capture_decodes_and_kills_on_timeout():
+    from twitchtool.utils import run_capture
+
+    done = run_capture(["sh", "-c", "printf 'caf\\303\\251\\377'; echo oops >&2; exit 3"])
+    assert (done.returncode, done.stdout, done.stderr) == (3, "café�", "oops\n")
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_capture(["sleep", "30"], timeout=0.2)
+    assert time.monotonic() - start < 5